@@ -0,0 +1,176 @@
+"""
+Compares the structure-aware StructuredSplitter with the CharacterTextSplitter settings it replaced.
+
+For every file the benchmark counts the chunks each splitter produces (one chunk is one LLM call in the
+CodeAnalysisAgent and one vector in the DocsCrawler) and the structural units (HCL blocks, top-level
+definitions, Markdown sections) that end up cut across two or more chunks. Source files are split with the
+CodeAnalysisAgent settings and Markdown files with the DocsCrawler settings.
+
+Two baselines are measured: the CharacterTextSplitter with its old character settings, and the same splitter
+at the StructuredSplitter's token budget (lengths counted with common.tokenizer, no overlap). The old settings
+used a different chunk size, so only the same-budget comparison shows the effect of splitting along the
+structure; the old-settings columns mix in the effect of the chunk size change.
+
+Without paths a synthetic sample repository is generated; pass project directories to measure real repos.
+
+Usage:
+    python benchmarks/chunking.py [--seed N] [path ...]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+from collections import defaultdict
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(ROOT_DIR)
+
+from common.project_walker import walk_project
+from common.structured_splitter import StructuredSplitter, detect_language
+from common.tokenizer import count_tokens
+
+# (old CharacterTextSplitter chunk_size, chunk_overlap), new StructuredSplitter max_tokens
+CODE_SETTINGS = ((1500, 100), 1000)
+DOCS_SETTINGS = ((1000, 100), 256)
+MAX_FILE_BYTES = 1024 * 1024
+
+
+def generate_sample_repo(directory, seed=0, modules=20):
+    """Writes a small synthetic repository of Terraform, Python, JavaScript and Markdown files."""
+    rng = random.Random(seed)
+    services = ["s3_bucket", "lambda_function", "iam_role", "sqs_queue", "dynamodb_table", "vpc", "subnet"]
+    for m in range(modules):
+        module_dir = os.path.join(directory, f"module_{m}")
+        os.makedirs(module_dir, exist_ok=True)
+        with open(os.path.join(module_dir, "main.tf"), "w", encoding="utf-8") as f:
+            for r in range(rng.randint(5, 25)):
+                service = rng.choice(services)
+                f.write(f'# {service.replace("_", " ")} number {r}\nresource "aws_{service}" "r{r}" {{\n')
+                for a in range(rng.randint(3, 15)):
+                    f.write(f'  attribute_{a} = "value-{rng.randint(0, 9999)}"\n')
+                f.write('  tags = {\n    Name = "example"\n  }\n}\n\n')
+        with open(os.path.join(module_dir, "handler.py"), "w", encoding="utf-8") as f:
+            f.write("import json\nimport os\n\n")
+            for d in range(rng.randint(3, 15)):
+                f.write(f'def handler_{d}(event, context):\n    """Handles event type {d}."""\n')
+                for line in range(rng.randint(4, 30)):
+                    f.write(f"    value_{line} = event.get('key_{line}', {rng.randint(0, 99)})\n")
+                f.write("    return {'statusCode': 200}\n\n\n")
+        with open(os.path.join(module_dir, "client.js"), "w", encoding="utf-8") as f:
+            for d in range(rng.randint(3, 12)):
+                f.write(f"export function request{d}(url) {{\n")
+                for line in range(rng.randint(3, 20)):
+                    f.write(f"  const part{line} = fetch(`${{url}}/{line}`);\n")
+                f.write("  return null;\n}\n\n")
+        with open(os.path.join(module_dir, "README.md"), "w", encoding="utf-8") as f:
+            f.write(f"# Module {m}\n\nOverview of the module.\n\n")
+            for section in range(rng.randint(2, 8)):
+                f.write(f"## Section {section}\n\n")
+                for paragraph in range(rng.randint(1, 4)):
+                    f.write(" ".join(rng.choice(services + ["the", "and", "deploys", "uses"])
+                                     for _ in range(rng.randint(20, 80))) + "\n\n")
+
+
+def line_spans(text, chunks, overlap):
+    """Locates the chunks of a CharacterTextSplitter in the source and returns their (start, end) line indexes."""
+    spans = []
+    position = 0
+    for chunk in chunks:
+        offset = text.find(chunk, max(0, position - overlap - len(chunk)))
+        if offset < 0:
+            offset = text.find(chunk)
+        if offset < 0:
+            continue
+        position = offset + len(chunk)
+        spans.append((text.count("\n", 0, offset), text.count("\n", 0, position - 1) + 1))
+    return spans
+
+
+def units_cut(units, spans):
+    """Counts the units that are not contained in a single chunk."""
+    return sum(not any(start <= unit_start and unit_end <= end for start, end in spans)
+               for unit_start, unit_end, _ in units)
+
+
+def measure(paths):
+    try:
+        from langchain.text_splitter import CharacterTextSplitter
+    except ImportError:
+        sys.exit("The baseline needs langchain: pip install langchain")
+
+    rows = defaultdict(lambda: defaultdict(int))
+    for path in paths:
+        for file_path in walk_project(path):
+            if os.path.getsize(file_path) > MAX_FILE_BYTES:
+                continue
+            with open(file_path, "rb") as f:
+                data = f.read()
+            if b"\0" in data[:8192]:
+                continue  # Binary file
+            text = data.decode("utf-8", errors="ignore")
+            language = detect_language(file_path)
+            (chunk_size, overlap), max_tokens = DOCS_SETTINGS if language == "markdown" else CODE_SETTINGS
+
+            baseline = CharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=overlap).split_text(text)
+            same_budget = CharacterTextSplitter(
+                chunk_size=max_tokens, chunk_overlap=0, length_function=count_tokens
+            ).split_text(text)
+            splitter = StructuredSplitter(max_tokens=max_tokens)
+            structured = splitter.split(text, file_path=file_path)
+            units = splitter.units(text.splitlines(keepends=True), language)
+
+            row = rows[language]
+            row["files"] += 1
+            row["units"] += len(units)
+            row["baseline_chunks"] += len(baseline)
+            row["same_budget_chunks"] += len(same_budget)
+            row["structured_chunks"] += len(structured)
+            row["baseline_cut"] += units_cut(units, line_spans(text, baseline, overlap))
+            row["same_budget_cut"] += units_cut(units, line_spans(text, same_budget, 0))
+            row["structured_cut"] += units_cut(units, [(c.start_line - 1, c.end_line) for c in structured])
+    return rows
+
+
+def print_report(rows):
+    header = f"{'language':<12}{'files':>7}{'units':>8}  {'chunks: old':>11}{'same budget':>13}{'structured':>12}" \
+             f"{'change':>9}  {'units cut: old':>14}{'same budget':>13}{'structured':>12}"
+    print(header)
+    print("-" * len(header))
+    totals = defaultdict(int)
+    for language, row in sorted(rows.items()) + [("total", totals)]:
+        if language != "total":
+            for key, value in row.items():
+                totals[key] += value
+        # The change is measured against the same token budget, so it only reflects the structural split.
+        change = (row["structured_chunks"] - row["same_budget_chunks"]) / max(row["same_budget_chunks"], 1)
+        print(f"{language:<12}{row['files']:>7}{row['units']:>8}  {row['baseline_chunks']:>11}"
+              f"{row['same_budget_chunks']:>13}{row['structured_chunks']:>12}{change:>+9.0%}  "
+              f"{row['baseline_cut']:>14}{row['same_budget_cut']:>13}{row['structured_cut']:>12}")
+
+    markdown = rows.get("markdown", {})
+    code = {key: totals[key] - markdown.get(key, 0)
+            for key in ("baseline_chunks", "same_budget_chunks", "structured_chunks")}
+    print(f"\nCode analysis LLM calls at the same token budget: {code['same_budget_chunks']} -> "
+          f"{code['structured_chunks']} (old character settings: {code['baseline_chunks']})")
+    if markdown:
+        print(f"Documentation vectors at the same token budget: {markdown['same_budget_chunks']} -> "
+              f"{markdown['structured_chunks']} (old character settings: {markdown['baseline_chunks']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="Project directories; a sample repository is generated if empty.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated sample repository.")
+    args = parser.parse_args()
+
+    if args.paths:
+        print_report(measure(args.paths))
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        generate_sample_repo(directory, seed=args.seed)
+        print_report(measure([directory]))
+
+
+if __name__ == "__main__":
+    main()
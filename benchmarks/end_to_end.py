@@ -0,0 +1,331 @@
+"""
+Benchmarks the pipeline stages end to end, offline and reproducibly.
+
+Every scenario runs in a fresh interpreter against local stand-ins for the external services: the fake
+OpenRouter/Ollama server of benchmarks/fake_llm_server.py (with configurable latency, token rate and error
+rate), and a local vector store and BM25 index seeded with synthetic Terraform documentation. Projects are
+generated by benchmarks/synthetic_repo.py. The LLM response cache and the embedding cache are disabled, so
+every repeat does the full work.
+
+Scenarios:
+    extract_files       FileExtractor.start() on the project (file walk, ranking, LLM file selection, extraction)
+    analyze_directory   CodeAnalysisAgent.analyze_directory() of code_analysis_expert (Ollama summaries)
+    terraform           TerraformAgent.start() (retrieval, service optimization, streamed generation); does not
+                        depend on the project size and runs once
+
+For each scenario the report shows p50/p95 wall time over the repeats, throughput (project files per second,
+or runs per second for terraform) and the peak RSS of the process. With --baseline the results are compared
+with a stored run and the exit code is 1 if p50 or peak RSS regressed by more than --tolerance.
+
+Usage:
+    python benchmarks/end_to_end.py [--sizes 1k,10k,100k] [--scenarios extract_files,terraform] [--repeat 3]
+                                    [--fake-embeddings] [--save-baseline FILE | --baseline FILE]
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+import numpy as np
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+TEMPLATE_EXPERT_DIR = os.path.join(ROOT_DIR, "terraform-template-expert")
+sys.path.append(ROOT_DIR)
+
+from benchmarks.fake_llm_server import SERVICES_RESPONSE, FakeLLMServer
+from benchmarks.synthetic_repo import generate_repo
+
+SIZES = {"1k": 1000, "10k": 10000, "100k": 100000}
+SCENARIOS = ("extract_files", "analyze_directory", "terraform")
+RESULT_PREFIX = "BENCHMARK_RESULT "
+EMBEDDING_DIMENSION = 384
+DOC_RESOURCES = [
+    "aws_s3_bucket", "aws_lambda_function", "aws_iam_role", "aws_iam_policy", "aws_sqs_queue",
+    "aws_dynamodb_table", "aws_api_gateway_rest_api", "aws_vpc", "aws_subnet", "aws_security_group",
+    "aws_instance", "aws_cloudwatch_log_group", "aws_sns_topic", "aws_ecr_repository", "aws_ecs_service",
+]
+
+
+class HashingEmbedder:
+    """
+    A deterministic stand-in for the SentenceTransformer, hashing words into a fixed-size vector.
+
+    Used with --fake-embeddings when the embedding model is not available offline; retrieval quality is
+    meaningless, but the vector store sees the same number and size of vectors as with the real model.
+    """
+
+    def __init__(self, dimension=EMBEDDING_DIMENSION):
+        self.dimension = dimension
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        embeddings = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                embeddings[row, zlib.crc32(word.encode("utf-8")) % self.dimension] += 1.0
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+
+
+def load_embedder(fake):
+    if fake:
+        return HashingEmbedder()
+    from sentence_transformers import SentenceTransformer
+
+    sys.path.append(TEMPLATE_EXPERT_DIR)
+    from terraform_gen_agent import EMBEDDING_MODEL
+
+    return SentenceTransformer(EMBEDDING_MODEL)
+
+
+def peak_rss_mb():
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def seed_docs(fake_embeddings, chunks_per_resource=20):
+    """Fills the local vector store and BM25 index (from the environment) with synthetic documentation chunks."""
+    from common.bm25_index import create_keyword_index
+    from common.vector_store import create_vector_store
+
+    documents = []
+    for resource in DOC_RESOURCES:
+        for n in range(chunks_per_resource):
+            text = (
+                f"# Resource: {resource}\n\nProvides a {resource.replace('_', ' ')} resource (section {n}).\n\n"
+                f"## Argument Reference\n\n* `name` - (Optional) Name of the {resource}.\n"
+                f"* `tags` - (Optional) Map of tags.\n\n## Example Usage\n\n"
+                f'resource "{resource}" "example_{n}" {{\n  name = "example"\n}}\n'
+            )
+            documents.append({"id": f"{resource}-{n}", "metadata": {"text": text, "url": f"https://docs/{resource}"}})
+
+    embeddings = load_embedder(fake_embeddings).encode([d["metadata"]["text"] for d in documents], batch_size=64)
+    vector_store = create_vector_store()
+    vector_store.upsert([{**document, "values": list(map(float, embedding))}
+                         for document, embedding in zip(documents, embeddings)])
+    vector_store.save()
+    keyword_index = create_keyword_index()
+    keyword_index.upsert(documents)
+    keyword_index.save()
+    return len(documents)
+
+
+def run_scenario(scenario, repo, repeat, fake_embeddings, concurrency):
+    """Runs a scenario `repeat` times in this process and returns its timings; called in the worker process."""
+    sys.path.append(TEMPLATE_EXPERT_DIR)
+    from common.project_walker import walk_project
+
+    files = sum(1 for _ in walk_project(repo)) if repo else 0
+
+    if scenario == "extract_files":
+        from extract_files import FileExtractor
+
+        extractor = FileExtractor()
+        run = lambda: extractor.start(repo)
+        items = files
+    elif scenario == "analyze_directory":
+        from code_analysis_expert.code_analysis_agent import CodeAnalysisAgent, model_name
+
+        agent = CodeAnalysisAgent(model_name, max_concurrency=concurrency)
+        run = lambda: agent.analyze_directory(repo)
+        items = files
+    elif scenario == "terraform":
+        import terraform_gen_agent
+
+        if fake_embeddings:
+            terraform_gen_agent._embed_model = HashingEmbedder()
+        agent = terraform_gen_agent.TerraformAgent()
+        run = lambda: agent.start(SERVICES_RESPONSE)
+        items = 1
+    else:
+        raise ValueError(f"Unknown scenario: {scenario}")
+
+    seconds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        seconds.append(time.perf_counter() - started)
+    return {"seconds": seconds, "items": items, "peak_rss_mb": peak_rss_mb()}
+
+
+def run_worker(arguments, env, workdir):
+    """Runs this script as a worker in a fresh interpreter and returns the result it reports."""
+    log_path = os.path.join(workdir, "worker.log")
+    with open(log_path, "w", encoding="utf-8") as log:
+        process = subprocess.run([sys.executable, os.path.abspath(__file__), *arguments], cwd=workdir, env=env,
+                                 stdout=subprocess.PIPE, stderr=log, text=True)
+        log.write(process.stdout)
+    results = [line[len(RESULT_PREFIX):] for line in process.stdout.splitlines() if line.startswith(RESULT_PREFIX)]
+    if process.returncode != 0 or not results:
+        raise RuntimeError(f"Worker {' '.join(arguments)} failed (exit code {process.returncode}), see {log_path}")
+    return json.loads(results[-1])
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(np.ceil(fraction * len(ordered))) - 1))]
+
+
+def summarize(result):
+    p50 = percentile(result["seconds"], 0.5)
+    return {
+        "runs": len(result["seconds"]),
+        "p50": p50,
+        "p95": percentile(result["seconds"], 0.95),
+        "throughput": result["items"] / p50 if p50 else 0.0,
+        "peak_rss_mb": result["peak_rss_mb"],
+    }
+
+
+def print_report(summaries, baseline=None, tolerance=0.2):
+    """Prints the results, compared with the baseline if given; returns the keys that regressed."""
+    baseline = (baseline or {}).get("scenarios", {})
+    header = f"{'scenario':<28}{'runs':>5}{'p50 s':>10}{'p95 s':>10}{'throughput/s':>14}{'peak RSS MB':>13}"
+    if baseline:
+        header += f"{'p50 vs base':>13}{'RSS vs base':>13}"
+    print(header)
+    print("-" * len(header))
+
+    regressions = []
+    for key, summary in summaries.items():
+        line = (f"{key:<28}{summary['runs']:>5}{summary['p50']:>10.3f}{summary['p95']:>10.3f}"
+                f"{summary['throughput']:>14.1f}{summary['peak_rss_mb']:>13.1f}")
+        base = baseline.get(key)
+        if base:
+            p50_change = summary["p50"] / base["p50"] - 1 if base["p50"] else 0.0
+            rss_change = summary["peak_rss_mb"] / base["peak_rss_mb"] - 1 if base["peak_rss_mb"] else 0.0
+            regressed = p50_change > tolerance or rss_change > tolerance
+            line += f"{p50_change:>+13.0%}{rss_change:>+13.0%}" + ("  REGRESSION" if regressed else "")
+            if regressed:
+                regressions.append(key)
+        elif baseline:
+            line += f"{'-':>13}{'-':>13}"
+        print(line)
+    return regressions
+
+
+def worker_main(args):
+    if args.worker == "seed_docs":
+        print(f"{RESULT_PREFIX}{json.dumps({'documents': seed_docs(args.fake_embeddings)})}")
+        return
+    result = run_scenario(args.worker, args.repo, args.repeat, args.fake_embeddings, args.concurrency)
+    print(f"{RESULT_PREFIX}{json.dumps(result)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1k", help=f"Comma-separated project sizes: {', '.join(SIZES)}.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated scenarios.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per scenario.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated projects.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Ollama concurrency of analyze_directory.")
+    parser.add_argument("--latency", type=float, default=0.02, help="Fake LLM latency to the first token, seconds.")
+    parser.add_argument("--tokens-per-second", type=float, default=1000.0, help="Fake LLM token rate; 0 for instant.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of fake LLM requests failing.")
+    parser.add_argument("--fake-embeddings", action="store_true",
+                        help="Use a hashing embedder instead of the SentenceTransformer model.")
+    parser.add_argument("--repos-dir", help="Directory to keep (and reuse) the generated projects in.")
+    parser.add_argument("--baseline", help="Compare with the results stored in this file.")
+    parser.add_argument("--save-baseline", help="Store the results in this file.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression against the baseline.")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--repo", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker_main(args)
+        return
+
+    scenarios = [scenario.strip() for scenario in args.scenarios.split(",") if scenario.strip()]
+    sizes = [size.strip() for size in args.sizes.split(",") if size.strip()]
+    for scenario in scenarios:
+        if scenario not in SCENARIOS:
+            parser.error(f"unknown scenario {scenario}; choose from {', '.join(SCENARIOS)}")
+    for size in sizes:
+        if size not in SIZES and not size.isdigit():
+            parser.error(f"unknown size {size}; use {', '.join(SIZES)} or a number of files")
+
+    work_root = tempfile.mkdtemp(prefix="pipeline-bench-")
+    repos_dir = args.repos_dir or os.path.join(work_root, "repos")
+    server = FakeLLMServer(latency=args.latency, tokens_per_second=args.tokens_per_second,
+                           error_rate=args.error_rate, seed=args.seed)
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": os.pathsep.join([ROOT_DIR, TEMPLATE_EXPERT_DIR, env.get("PYTHONPATH", "")]),
+        "OPENROUTER_API_KEY": "benchmark",
+        "OPENROUTER_BASE_URL": server.openrouter_base_url,
+        "OLLAMA_HOST": server.ollama_host,
+        "LLM_CACHE_DISABLED": "1",
+        "EMBEDDING_CACHE_DISABLED": "1",
+        "VECTOR_STORE_BACKEND": "local",
+        "LOCAL_VECTOR_STORE_DIR": os.path.join(work_root, "vector_store"),
+        "BM25_INDEX_DIR": os.path.join(work_root, "bm25_index"),
+    })
+    common_arguments = ["--repeat", str(args.repeat), "--concurrency", str(args.concurrency)]
+    if args.fake_embeddings:
+        common_arguments.append("--fake-embeddings")
+
+    summaries = {}
+    with server:
+        print(f"🔹 Fake LLM server on {server.url}, work directory {work_root}")
+        if "terraform" in scenarios:
+            seeded = run_worker(["--worker", "seed_docs", *common_arguments], env, _makedirs(work_root, "seed"))
+            print(f"🔹 Seeded the local vector store with {seeded['documents']} documentation chunks")
+
+        for scenario in scenarios:
+            for size in (["-"] if scenario == "terraform" else sizes):
+                arguments = ["--worker", scenario, *common_arguments]
+                if size != "-":
+                    files = SIZES.get(size) or int(size)
+                    repo = os.path.join(repos_dir, f"repo_{files}_{args.seed}")
+                    if not os.path.exists(f"{repo}.complete"):
+                        print(f"🔹 Generating a {files}-file project...")
+                        generate_repo(repo, files, args.seed)
+                        open(f"{repo}.complete", "w").close()
+                    arguments += ["--repo", repo]
+
+                key = scenario if size == "-" else f"{scenario}/{size}"
+                print(f"⏱️ Running {key}...")
+                workdir = _makedirs(work_root, key.replace("/", "_"))
+                summaries[key] = summarize(run_worker(arguments, env, workdir))
+        print(f"🔹 Fake LLM server: {server.requests} requests, {server.errors} injected errors\n")
+    if not args.repos_dir:
+        shutil.rmtree(repos_dir, ignore_errors=True)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    regressions = print_report(summaries, baseline, args.tolerance)
+
+    if args.save_baseline:
+        settings = {name: getattr(args, name) for name in
+                    ("repeat", "seed", "concurrency", "latency", "tokens_per_second", "error_rate", "fake_embeddings")}
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"settings": settings, "scenarios": summaries}, f, indent=2)
+        print(f"\n✅ Baseline saved to {args.save_baseline}")
+    if regressions:
+        print(f"\n❌ Regressed against the baseline: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+def _makedirs(root, name):
+    directory = os.path.join(root, name)
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+if __name__ == "__main__":
+    main()
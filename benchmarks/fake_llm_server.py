@@ -0,0 +1,292 @@
+"""
+A local stand-in for the OpenRouter (OpenAI-compatible) and Ollama chat APIs, for offline benchmarks.
+
+The server answers POST /api/v1/chat/completions (with or without "stream": true, as server-sent events) and
+POST /api/chat like the real services, with canned responses that keep the pipeline going: the file selection
+prompt gets back files from its own listing, the AWS service prompt a service list, the Terraform prompt a
+valid template and Ollama a short summary. Latency, token rate and error rate are configurable, so the
+benchmarks measure the pipeline and not the network.
+
+Point the pipeline at it with OPENROUTER_BASE_URL=<url>/api/v1 and OLLAMA_HOST=<url>.
+
+Usage:
+    python benchmarks/fake_llm_server.py [--port 8089] [--latency 0.05] [--tokens-per-second 200] [--error-rate 0]
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SERVICES_RESPONSE = """1. **Amazon S3** - stores the uploaded files and static assets
+2. **AWS Lambda** - runs the request handlers
+3. **Amazon API Gateway** - exposes the handlers over HTTP
+4. **Amazon DynamoDB** - stores the application data
+5. **Amazon SQS** - queues background jobs
+6. **AWS IAM** - roles and policies for the functions"""
+
+OPTIMIZED_RESPONSE = """- Amazon S3: cheapest durable storage for uploads
+- AWS Lambda: pay-per-request compute
+- Amazon DynamoDB: on-demand capacity keeps idle cost at zero
+- AWS IAM: required for the function roles"""
+
+TERRAFORM_RESPONSE = """```terraform
+terraform {
+  required_providers {
+    aws = {
+      source  = "hashicorp/aws"
+      version = "~> 4.0"
+    }
+  }
+}
+
+provider "aws" {
+  region                      = "us-west-2"
+  access_key                  = "test"
+  secret_key                  = "test"
+  skip_credentials_validation = true
+  skip_requesting_account_id  = true
+  skip_metadata_api_check     = true
+  s3_force_path_style         = true
+
+  endpoints {
+    s3       = "http://localhost:4566"
+    lambda   = "http://localhost:4566"
+    dynamodb = "http://localhost:4566"
+    iam      = "http://localhost:4566"
+  }
+}
+
+resource "aws_s3_bucket" "uploads" {
+  bucket = "benchmark-uploads"
+}
+
+resource "aws_dynamodb_table" "items" {
+  name         = "items"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "id"
+
+  attribute {
+    name = "id"
+    type = "S"
+  }
+}
+
+resource "aws_iam_role" "lambda" {
+  name = "benchmark-lambda"
+  assume_role_policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [{
+      Action    = "sts:AssumeRole",
+      Effect    = "Allow",
+      Principal = { Service = "lambda.amazonaws.com" }
+    }]
+  })
+}
+```"""
+
+SUMMARY_RESPONSE = (
+    "The file defines AWS resources and application code. Cloud provider: AWS. Services: S3, Lambda, "
+    "DynamoDB. Resources depend on an IAM role. No state backend is configured."
+)
+
+PATH_LINE = re.compile(r"^\s*([\w./-]+\.\w+)\s*$")
+MAX_SELECTED_FILES = 20
+
+
+def respond(prompt):
+    """Picks the canned response for a prompt of the pipeline."""
+    if "determine which files are essential" in prompt:
+        # Answer with the first files of the listing, so the extraction has real files to read.
+        listing = prompt.split("extracted project structure:", 1)[-1].split("### Task", 1)[0]
+        paths = [match.group(1) for match in map(PATH_LINE.match, listing.splitlines()) if match]
+        return "\n".join(paths[:MAX_SELECTED_FILES])
+    if "Identify the specific AWS services" in prompt:
+        return SERVICES_RESPONSE
+    if "most cost-effective and necessary AWS services" in prompt:
+        return OPTIMIZED_RESPONSE
+    if "Generate a Terraform script" in prompt:
+        return TERRAFORM_RESPONSE
+    return SUMMARY_RESPONSE
+
+
+def count_tokens(text):
+    """A rough token count (4 characters per token), good enough to pace the emulated generation."""
+    return max(1, len(text) // 4)
+
+
+class FakeLLMServer:
+    """
+    A threaded HTTP server emulating the OpenRouter and Ollama chat APIs.
+
+    Args:
+        host (str): Interface to listen on.
+        port (int): Port to listen on; 0 picks a free one.
+        latency (float): Seconds before the first token of every response.
+        tokens_per_second (float): Generation speed; the response takes completion tokens / tokens_per_second
+                                   on top of the latency. 0 disables the pacing.
+        error_rate (float): Fraction of requests answered with HTTP 503 (with Retry-After: 0, so the client
+                            retries at once).
+        seed (int): Seed of the error sampling.
+
+    Attributes:
+        requests (int): Number of requests received.
+        errors (int): Number of injected errors.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.05, tokens_per_second=200.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def openrouter_base_url(self):
+        return f"{self.url}/api/v1"
+
+    @property
+    def ollama_host(self):
+        return self.url
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-llm-server", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def inject_error(self):
+        with self._lock:
+            self.requests += 1
+            failed = self._random.random() < self.error_rate
+            self.errors += failed
+            return failed
+
+    def generation_delay(self, text):
+        return count_tokens(text) / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    return self.send_json(400, {"error": "invalid JSON"})
+
+                if server.inject_error():
+                    return self.send_json(503, {"error": {"message": "injected error"}}, {"Retry-After": "0"})
+
+                messages = payload.get("messages") or []
+                prompt = "\n".join(str(message.get("content", "")) for message in messages)
+                content = respond(prompt)
+                time.sleep(server.latency)
+
+                if self.path.rstrip("/").endswith("/chat/completions"):
+                    if payload.get("stream"):
+                        return self.stream_openai(payload, prompt, content)
+                    time.sleep(server.generation_delay(content))
+                    return self.send_json(200, {
+                        "id": "fake",
+                        "model": payload.get("model"),
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                     "finish_reason": "stop"}],
+                        "usage": {"prompt_tokens": count_tokens(prompt), "completion_tokens": count_tokens(content)},
+                    })
+                if self.path.rstrip("/") == "/api/chat":
+                    time.sleep(server.generation_delay(content))
+                    return self.send_json(200, {
+                        "model": payload.get("model"),
+                        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                        "message": {"role": "assistant", "content": content},
+                        "done": True,
+                        "done_reason": "stop",
+                        "prompt_eval_count": count_tokens(prompt),
+                        "eval_count": count_tokens(content),
+                    })
+                self.send_json(404, {"error": f"unknown endpoint {self.path}"})
+
+            def send_json(self, status, body, headers=None):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def stream_openai(self, payload, prompt, content):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                pieces = re.findall(r"\S*\s*", content)
+                pieces = [piece for piece in pieces if piece]
+                delay = server.generation_delay(content) / max(len(pieces), 1)
+                for piece in pieces:
+                    event = {"model": payload.get("model"), "choices": [{"index": 0, "delta": {"content": piece}}]}
+                    self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    time.sleep(delay)
+                usage = {"prompt_tokens": count_tokens(prompt), "completion_tokens": count_tokens(content)}
+                final = {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage}
+                self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+                self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds before the first token.")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="Generation speed; 0 for instant.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failing with HTTP 503.")
+    args = parser.parse_args()
+
+    server = FakeLLMServer(args.host, args.port, args.latency, args.tokens_per_second, args.error_rate)
+    print(f"Fake LLM server on {server.url}")
+    print(f"  OPENROUTER_BASE_URL={server.openrouter_base_url}")
+    print(f"  OLLAMA_HOST={server.ollama_host}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Measures the cold-start import time of the pipeline modules and fails if it exceeds a target.
+
+Each module is imported in a fresh interpreter, several times, and the best run is compared against the
+target, so the numbers are not skewed by a warm import cache in the current process.
+
+Usage:
+    python benchmarks/import_time.py [--target SECONDS] [--repeat N] [module ...]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+TEMPLATE_EXPERT_DIR = os.path.join(ROOT_DIR, "terraform-template-expert")
+
+DEFAULT_MODULES = ["terraform_gen_agent", "extract_files", "determine_aws_service"]
+DEFAULT_TARGET = 1.0  # Seconds
+
+MEASURE = "import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+
+
+def measure_import(module, repeat):
+    """Returns the import times of a module, in seconds, measured in fresh interpreters."""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([TEMPLATE_EXPERT_DIR, ROOT_DIR, env.get("PYTHONPATH", "")])
+    timings = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-c", MEASURE.format(module=module)],
+            capture_output=True,
+            text=True,
+            env=env,
+            cwd=ROOT_DIR,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--target", type=float, default=DEFAULT_TARGET, help="Maximum import time in seconds.")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        timings = measure_import(module, args.repeat)
+        best = min(timings)
+        status = "ok" if best <= args.target else "TOO SLOW"
+        failed = failed or best > args.target
+        print(f"{module:<25} best {best:.3f}s  worst {max(timings):.3f}s  target {args.target:.3f}s  {status}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Generates synthetic project trees of a given number of files for the benchmarks.
+
+The tree looks like a typical web project deployed to AWS: Terraform modules, Python and JavaScript
+sources, Markdown docs, JSON/YAML configuration and the usual dependency and entry point files at the top,
+spread over nested directories. A git-ignored node_modules/ directory with extra files exercises the
+.gitignore handling of the project walker. Generation is deterministic for a given seed.
+
+Usage:
+    python benchmarks/synthetic_repo.py DIRECTORY [--files 1000] [--seed 0]
+"""
+import argparse
+import json
+import os
+import random
+
+FILES_PER_DIRECTORY = 50
+DIRECTORIES_PER_LEVEL = 10
+# (extension, share of the files)
+FILE_MIX = [(".py", 0.3), (".js", 0.3), (".md", 0.1), (".tf", 0.05), (".json", 0.1), (".yml", 0.05), (".txt", 0.1)]
+SERVICES = ["s3_bucket", "lambda_function", "iam_role", "sqs_queue", "dynamodb_table", "api_gateway_rest_api"]
+WORDS = ["deploy", "bucket", "queue", "handler", "request", "table", "user", "order", "event", "the", "and", "uses"]
+
+TOP_LEVEL_FILES = {
+    "README.md": "# Benchmark project\n\nA synthetic web service that stores orders in DynamoDB and files in S3.\n",
+    "requirements.txt": "boto3==1.34.0\nflask==3.0.0\nrequests==2.31.0\n",
+    "package.json": json.dumps({"name": "benchmark", "dependencies": {"aws-sdk": "^2.1500.0", "express": "^4.18.0"}},
+                               indent=2) + "\n",
+    "Dockerfile": "FROM python:3.11-slim\nCOPY . /app\nRUN pip install -r /app/requirements.txt\nCMD [\"python\", \"app.py\"]\n",
+    "app.py": "import boto3\n\ns3 = boto3.client('s3')\ntable = boto3.resource('dynamodb').Table('orders')\n",
+    "main.tf": 'provider "aws" {\n  region = "us-west-2"\n}\n',
+    ".gitignore": "node_modules/\n*.log\n",
+}
+
+
+def file_content(extension, rng):
+    """Returns the content of a file of the given type, roughly 0.3 to 3 KB long."""
+    if extension == ".py":
+        lines = ["import json\nimport boto3\n\n"]
+        for d in range(rng.randint(2, 8)):
+            lines.append(f"def handler_{d}(event, context):\n")
+            lines.extend(f"    value_{i} = event.get('key_{i}', {rng.randint(0, 99)})\n" for i in range(rng.randint(3, 12)))
+            lines.append("    return {'statusCode': 200}\n\n\n")
+        return "".join(lines)
+    if extension == ".js":
+        lines = ["const AWS = require('aws-sdk');\n\n"]
+        for d in range(rng.randint(2, 8)):
+            lines.append(f"export function request{d}(url) {{\n")
+            lines.extend(f"  const part{i} = fetch(`${{url}}/{i}`);\n" for i in range(rng.randint(3, 12)))
+            lines.append("  return null;\n}\n\n")
+        return "".join(lines)
+    if extension == ".tf":
+        lines = []
+        for r in range(rng.randint(2, 8)):
+            lines.append(f'resource "aws_{rng.choice(SERVICES)}" "r{r}" {{\n')
+            lines.extend(f'  attribute_{a} = "value-{rng.randint(0, 9999)}"\n' for a in range(rng.randint(2, 8)))
+            lines.append("}\n\n")
+        return "".join(lines)
+    if extension == ".json":
+        return json.dumps({f"key_{i}": rng.choice(WORDS) for i in range(rng.randint(5, 40))}, indent=2) + "\n"
+    if extension == ".yml":
+        return "".join(f"setting_{i}: {rng.choice(WORDS)}\n" for i in range(rng.randint(5, 40)))
+    paragraphs = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 80))) for _ in range(rng.randint(1, 5))]
+    title = f"# {rng.choice(WORDS).title()}\n\n" if extension == ".md" else ""
+    return title + "\n\n".join(paragraphs) + "\n"
+
+
+def directory_for(index):
+    """Spreads the files over nested directories, FILES_PER_DIRECTORY per leaf and up to three levels deep."""
+    leaf = index // FILES_PER_DIRECTORY
+    parts = []
+    while True:
+        parts.append(f"pkg_{leaf % DIRECTORIES_PER_LEVEL}")
+        leaf //= DIRECTORIES_PER_LEVEL
+        if not leaf or len(parts) == 3:
+            break
+    if leaf:
+        parts.append(f"group_{leaf}")
+    return os.path.join("src", *reversed(parts))
+
+
+def generate_repo(directory, files=1000, seed=0, ignored_files=None):
+    """
+    Writes a synthetic project tree.
+
+    Args:
+        directory (str): Target directory; created if needed.
+        files (int): Number of files that are not git-ignored, including the top-level files.
+        seed (int): Seed of the generated content.
+        ignored_files (int): Number of extra files under the git-ignored node_modules/; 5% of `files` by default.
+
+    Returns:
+        int: Number of files written, not counting the ignored ones.
+    """
+    rng = random.Random(seed)
+    extensions = [extension for extension, _ in FILE_MIX]
+    weights = [share for _, share in FILE_MIX]
+
+    written = 0
+    for name, content in TOP_LEVEL_FILES.items():
+        if written >= files:
+            break
+        with open(os.path.join(_makedirs(directory), name), "w", encoding="utf-8") as f:
+            f.write(content)
+        written += 1
+
+    for index in range(files - written):
+        extension = rng.choices(extensions, weights)[0]
+        file_dir = _makedirs(os.path.join(directory, directory_for(index)))
+        with open(os.path.join(file_dir, f"file_{index}{extension}"), "w", encoding="utf-8") as f:
+            f.write(file_content(extension, rng))
+        written += 1
+
+    ignored = max(1, files // 20) if ignored_files is None else ignored_files
+    for index in range(ignored):
+        module_dir = _makedirs(os.path.join(directory, "node_modules", f"dep_{index // FILES_PER_DIRECTORY}"))
+        with open(os.path.join(module_dir, f"index_{index}.js"), "w", encoding="utf-8") as f:
+            f.write(file_content(".js", rng))
+    return written
+
+
+def _makedirs(directory):
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory")
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(f"Wrote {generate_repo(args.directory, args.files, args.seed)} files to {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,90 +1,273 @@
 import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
 import ollama
-from pathspec import PathSpec
-from pathspec.patterns.gitwildmatch import GitWildMatchPattern
-from langchain.text_splitter import CharacterTextSplitter
 from dotenv import load_dotenv
 
+from code_analysis_expert.summary_cache import SummaryCache
+from common.cassette import CassetteMiss, cassette_call
+from common.file_manifest import FileManifest, load_state, save_state
+from common.project_walker import walk_project
+from common.structured_splitter import StructuredSplitter
+from common.tracing import span
+
 load_dotenv()
 
 model_name = "qwen2.5-coder"
 
+# Bump PROMPT_VERSION whenever PROMPT_TEMPLATE changes so cached summaries are invalidated.
+PROMPT_VERSION = "1"
+PROMPT_TEMPLATE = """Analyze this Terraform configuration from '{file_path}' and identify:
+1. Cloud providers/services used
+2. Resource definitions and dependencies
+3. Variables/Outputs/Data sources
+4. Network and security configurations
+5. State management setup
+Provide concise technical summary:\n{chunk}"""
+
 class CodeAnalysisAgent:
-    def __init__(self, model_name):
-        self.text_splitter = CharacterTextSplitter(chunk_size=1500, chunk_overlap=100)
+    def __init__(self, model_name, cache=None, max_concurrency=1, chunk_tokens=1000):
+        """
+        :param model_name: Ollama model used to summarize chunks.
+        :param cache: Optional SummaryCache; chunks found in it skip the LLM call.
+        :param max_concurrency: Maximum number of chunk summaries requested from Ollama in parallel,
+            across files and across chunks within a file. 1 keeps the sequential behaviour.
+        :param chunk_tokens: Maximum size of a chunk in tokens. Files are split along their HCL blocks,
+            top-level definitions or Markdown sections, so each summary sees whole units.
+        """
+        self.text_splitter = StructuredSplitter(max_tokens=chunk_tokens)
         self.model_name = model_name
         self.terraform_exts = (".tf", ".tfvars", ".hcl")
+        self.cache = cache
+        self.max_concurrency = max(1, max_concurrency)
 
-    def summarize_code(self, file_path, all_files_content):
-        try:
+    def summarize_chunk(self, file_path, chunk):
+        """
+        Summarizes one chunk of a file, from the cache if possible.
+
+        :param file_path: Path of the file the chunk belongs to.
+        :param chunk: Text of the chunk.
+        :return: (summary, ok), where ok is False if the LLM call failed and summary is the error message.
+        """
+        with span("llm", self.model_name, provider="ollama") as s:
+            if self.cache is not None:
+                cached = self.cache.get(chunk, self.model_name, PROMPT_VERSION)
+                if cached is not None:
+                    s.add(cache_hits=1)
+                    return cached, True
+                s.add(cache_misses=1)
+
+            prompt = PROMPT_TEMPLATE.format(file_path=file_path, chunk=chunk)
+            messages = [{"role": "user", "content": prompt}]
+            try:
+                response = cassette_call("ollama", {"model": self.model_name, "messages": messages},
+                                         lambda: self.chat(messages), errors=(Exception,))
+            except CassetteMiss:
+                raise
+            except Exception as e:
+                s.set(error=str(e))
+                return f"API Error: {str(e)}", False
+            s.set(prompt_tokens=response["prompt_eval_count"], completion_tokens=response["eval_count"])
+
+        summary = response["content"]
+        if self.cache is not None:
+            self.cache.put(chunk, self.model_name, PROMPT_VERSION, summary)
+        return summary, True
+
+    def chat(self, messages):
+        """
+        Sends a chat request to Ollama.
+
+        :param messages: Chat messages.
+        :return: {"content", "prompt_eval_count", "eval_count"}: the answer and the prompt and completion token
+            counts, as Ollama reports them.
+        """
+        response = ollama.chat(model=self.model_name, messages=messages)
+        return {
+            "content": response.message.content,
+            "prompt_eval_count": getattr(response, "prompt_eval_count", None),
+            "eval_count": getattr(response, "eval_count", None),
+        }
+
+    def read_chunks(self, file_path):
+        with span("file", "read_chunks") as s:
             with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
                 content = f.read()
+            s.set(bytes=len(content.encode("utf-8")))
+        return self.text_splitter.split_text(content, file_path=file_path)
+
+    def summarize_code(self, file_path, all_files_content):
+        """
+        Summarizes a file chunk by chunk.
+
+        :return: (summary, ok), where ok is False if the file could not be read or any chunk failed.
+        """
+        try:
+            chunks = self.read_chunks(file_path)
         except Exception as e:
-            return f"Error reading file: {str(e)}"
+            return f"Error reading file: {str(e)}", False
 
-        chunks = self.text_splitter.split_text(content)
-        chunk_summaries = []
+        if self.max_concurrency > 1 and len(chunks) > 1:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                results = list(executor.map(lambda chunk: self.summarize_chunk(file_path, chunk), chunks))
+        else:
+            results = [self.summarize_chunk(file_path, chunk) for chunk in chunks]
 
-        for chunk in chunks:
-            prompt = f"""Analyze this Terraform configuration from '{file_path}' and identify:
-1. Cloud providers/services used
-2. Resource definitions and dependencies
-3. Variables/Outputs/Data sources
-4. Network and security configurations
-5. State management setup
-Provide concise technical summary:\n{chunk}"""
+        return "\n".join(summary for summary, _ in results), all(ok for _, ok in results)
 
-            try:
-                response = ollama.chat(model=self.model_name, messages=[{"role": "user", "content": prompt}])
-                chunk_summaries.append(response.message.content)
-            except Exception as e:
-                chunk_summaries.append(f"API Error: {str(e)}")
+    def summarize_files(self, file_paths, root=None):
+        """
+        Summarizes the given files and returns {file_path: summary} in the order of file_paths.
+
+        With max_concurrency > 1 the chunks of all files share one bounded thread pool, so a large file
+        does not hold back the small ones behind it. Chunk results are collected file by file in
+        submission order, and a failing chunk only produces an error line in its own file's summary.
+
+        :param root: Directory the progress messages show the paths relative to.
+        """
+        return self._summarize_files(file_paths, root)[0]
 
-        return "\n".join(chunk_summaries)
+    def _summarize_files(self, file_paths, root=None):
+        """
+        Summarizes the given files, printing each file once its summary is complete.
 
-    def analyze_directory(self, dir_path):
+        :return: ({file_path: summary}, failed), where failed is the set of files with a failed read or chunk.
+        """
+        def done(file_path):
+            print(f"Processed: {os.path.relpath(file_path, root) if root else file_path}")
+
+        failed = set()
+        if self.max_concurrency == 1:
             summaries = {}
+            for file_path in file_paths:
+                try:
+                    summaries[file_path], ok = self.summarize_code(file_path, {})
+                except CassetteMiss:
+                    # A replay must not quietly fall back to error summaries.
+                    raise
+                except Exception as e:
+                    print(f"Failed to analyze file {file_path}: {str(e)}")
+                    summaries[file_path], ok = f"Analysis failed: {str(e)}", False
+                if not ok:
+                    failed.add(file_path)
+                done(file_path)
+            return summaries, failed
+
+        summaries = {}
+        pending = deque()
+        in_flight = 0
+        # Keep a few chunks queued per worker, but never read the whole project into memory up front.
+        window = self.max_concurrency * 4
+
+        def collect(file_path, futures):
+            chunk_summaries = []
+            for future in futures:
+                try:
+                    summary, ok = future.result()
+                except CassetteMiss:
+                    raise
+                except Exception as e:
+                    summary, ok = f"API Error: {str(e)}", False
+                chunk_summaries.append(summary)
+                if not ok:
+                    failed.add(file_path)
+            summaries[file_path] = "\n".join(chunk_summaries)
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            for file_path in file_paths:
+                try:
+                    chunks = self.read_chunks(file_path)
+                    futures = [executor.submit(self.summarize_chunk, file_path, chunk) for chunk in chunks]
+                except Exception as e:
+                    futures = [Future()]
+                    futures[0].set_result((f"Error reading file: {str(e)}", False))
+
+                # Report the file when its last chunk finishes, not when its chunks are queued.
+                remaining = [len(futures)]
+                remaining_lock = threading.Lock()
+
+                def chunk_done(_, file_path=file_path, remaining=remaining, remaining_lock=remaining_lock):
+                    with remaining_lock:
+                        remaining[0] -= 1
+                        finished = remaining[0] == 0
+                    if finished:
+                        done(file_path)
+
+                for future in futures:
+                    future.add_done_callback(chunk_done)
+                if not futures:
+                    done(file_path)
+
+                pending.append((file_path, futures))
+                in_flight += len(futures)
+
+                while in_flight > window:
+                    done_path, done_futures = pending.popleft()
+                    collect(done_path, done_futures)
+                    in_flight -= len(done_futures)
+
+            while pending:
+                collect(*pending.popleft())
+
+        return summaries, failed
+
+    def summarize_incrementally(self, file_paths, state_file, root=None):
+        state = load_state(state_file)
+        previous_summaries = state.get("summaries", {})
+        manifest, diff = FileManifest.from_dict(state.get("manifest")).refresh(file_paths)
+        print(
+            f"Incremental analysis: {len(diff.added)} added, {len(diff.changed)} changed, "
+            f"{len(diff.deleted)} deleted, {len(diff.unchanged)} unchanged"
+        )
+
+        stale = set(diff.added) | set(diff.changed)
+        stale.update(path for path in diff.unchanged if path not in previous_summaries)
+        fresh_summaries, failed = self._summarize_files([path for path in file_paths if path in stale], root)
+
+        # Forget files that failed so the next run retries them instead of reusing the error.
+        for file_path in failed:
+            manifest.entries.pop(file_path, None)
+
+        summaries = {}
+        for file_path in file_paths:
+            if file_path in fresh_summaries:
+                summaries[file_path] = fresh_summaries[file_path]
+            elif file_path in previous_summaries:
+                summaries[file_path] = previous_summaries[file_path]
+
+        save_state(state_file, {"manifest": manifest.to_dict(), "summaries": summaries})
+        return summaries
+
+    def analyze_directory(self, dir_path, state_file=None):
+            """
+            Summarizes every file in dir_path that is not ignored by .gitignore.
+
+            :param dir_path: Project directory to analyze.
+            :param state_file: Optional path of a JSON file holding the manifest and summaries of the previous
+                run. When given, only added or changed files are summarized again, summaries of deleted files
+                are dropped and the state file is updated for the next run.
+            :return: Dictionary mapping file paths to their summaries.
+            """
+            file_paths = []
             print(f"Starting analysis of directory: {dir_path}")
 
-            for root, dirs, files in os.walk(dir_path, topdown=True):
-                gitignore_path = os.path.join(root, '.gitignore')
-                spec = PathSpec([])
-                if os.path.exists(gitignore_path):
-                    with open(gitignore_path, 'r') as f:
-                        spec = PathSpec.from_lines(GitWildMatchPattern, f)
-
-                # 1. Skip ignored directories
-                dirs[:] = [
-                    d for d in dirs
-                    if not spec.match_file(os.path.join(d))  # Check dir patterns
-                ]
-
-                # 2. Process all files, only skipping those ignored by .gitignore
-                for file in files:
-                    full_path = os.path.join(root, file)
-
-                    # 3. Calculate proper relative path for .gitignore matching
-                    rel_to_root = os.path.relpath(full_path, dir_path)
-                    rel_to_current = os.path.relpath(full_path, root)
-
-                    # Check against all relevant .gitignore specs
-                    if spec.match_file(rel_to_current):
-                        print(f"Ignoring {rel_to_root} (matches local .gitignore)")
-                        continue
-
-                    print(f"Processing: {rel_to_root}")
-                    try:
-                        summary = self.summarize_code(full_path, {})
-                        summaries[full_path] = summary
-                    except Exception as e:
-                        print(f"Failed to analyze file {full_path}: {str(e)}")  # Corrected variable name here
-                        summaries[full_path] = f"Analysis failed: {str(e)}"  # Corrected variable name here
+            for full_path in walk_project(dir_path):
+                file_paths.append(full_path)
+            print(f"Found {len(file_paths)} files to analyze")
 
+            if state_file is None:
+                summaries = self.summarize_files(file_paths, root=dir_path)
+            else:
+                summaries = self.summarize_incrementally(file_paths, state_file, root=dir_path)
+            if self.cache is not None:
+                print(f"Summary cache: {self.cache.stats()}")
             return summaries  # Added return statement
 
 
 if __name__ == '__main__':
-    agent = CodeAnalysisAgent(model_name=model_name)
+    agent = CodeAnalysisAgent(model_name=model_name, cache=SummaryCache(), max_concurrency=4)
     summaries = agent.analyze_directory("/path/to/terraform/config")
     for file_path, summary in summaries.items():
         print(f"Summary for {file_path}:\n{summary}\n")
@@ -0,0 +1,162 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+class SummaryCache:
+    """
+    A persistent, content-addressed cache for chunk summaries produced by the CodeAnalysisAgent.
+
+    Entries are keyed by a hash of (chunk text, model name, prompt template version) and stored in a
+    SQLite database, so a re-run over an unchanged project skips the LLM call for every chunk it has
+    already seen. The cache is bounded by total summary size and evicts the least recently used
+    entries first.
+
+    Args:
+        db_path (str): Path of the SQLite database file. Parent directories are created if needed.
+        max_bytes (int): Upper bound for the total size of cached summaries, in bytes.
+
+    Attributes:
+        hits (int): Number of lookups answered from the cache since it was opened.
+        misses (int): Number of lookups that had to fall through to the LLM.
+    """
+
+    def __init__(self, db_path=".cache/code_summaries.sqlite3", max_bytes=256 * 1024 * 1024):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS summaries (
+                key TEXT PRIMARY KEY,
+                model_name TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS summaries_lru ON summaries (last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(chunk, model_name, prompt_version):
+        """Returns the content address of a chunk for the given model and prompt template version."""
+        digest = hashlib.sha256()
+        for part in (model_name, prompt_version, chunk):
+            encoded = part.encode("utf-8")
+            digest.update(len(encoded).to_bytes(8, "big"))
+            digest.update(encoded)
+        return digest.hexdigest()
+
+    def get(self, chunk, model_name, prompt_version):
+        """
+        Looks up the cached summary of a chunk.
+
+        Returns:
+            str | None: The cached summary, or None on a miss.
+        """
+        key = self.make_key(chunk, model_name, prompt_version)
+        with self._lock:
+            row = self._conn.execute("SELECT summary FROM summaries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE summaries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, chunk, model_name, prompt_version, summary):
+        """Stores the summary of a chunk and evicts least recently used entries if the cache is over budget."""
+        key = self.make_key(chunk, model_name, prompt_version)
+        size = len(summary.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model_name, prompt_version, summary, size, time.time()),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM summaries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        excess = total - self.max_bytes
+        stale_keys = []
+        for key, size in self._conn.execute("SELECT key, size FROM summaries ORDER BY last_access"):
+            stale_keys.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self._conn.executemany("DELETE FROM summaries WHERE key = ?", stale_keys)
+
+    def invalidate(self, model_name=None, prompt_version=None):
+        """
+        Drops cached summaries.
+
+        Called without arguments it clears the whole cache; with a model name and/or prompt version it only
+        drops the entries produced by that model or prompt template.
+
+        Returns:
+            int: The number of entries removed.
+        """
+        clauses, params = [], []
+        if model_name is not None:
+            clauses.append("model_name = ?")
+            params.append(model_name)
+        if prompt_version is not None:
+            clauses.append("prompt_version = ?")
+            params.append(prompt_version)
+
+        query = "DELETE FROM summaries"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+
+        with self._lock:
+            removed = self._conn.execute(query, params).rowcount
+            self._conn.commit()
+        return removed
+
+    def invalidate_stale(self, prompt_version):
+        """
+        Drops the entries produced with another prompt template version, which can no longer be hit.
+
+        This is a maintenance call, not needed for correctness: the key includes the model and the prompt
+        version, so stale entries are never returned and are eventually evicted as least recently used.
+        Entries of other models are kept, since agents using different models may share the cache.
+
+        Returns:
+            int: The number of entries removed.
+        """
+        with self._lock:
+            removed = self._conn.execute(
+                "DELETE FROM summaries WHERE prompt_version != ?", (prompt_version,)
+            ).rowcount
+            self._conn.commit()
+        return removed
+
+    def stats(self):
+        """Returns the hit/miss counters together with the current number of entries and their total size."""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM summaries"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
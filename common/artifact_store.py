@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+import threading
+
+
+def input_key(name, inputs):
+    """
+    Hashes the inputs of a stage into its checkpoint key.
+
+    Args:
+        name (str): Name of the stage.
+        inputs (dict): JSON-serializable values the stage output depends on.
+
+    Returns:
+        str: SHA-256 hex digest.
+    """
+    encoded = json.dumps({"stage": name, "inputs": inputs}, sort_keys=True, ensure_ascii=False,
+                         separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ArtifactStore:
+    """
+    Holds the outputs of pipeline stages in memory and checkpoints them to a run directory.
+
+    Stages hand their outputs to each other through the store instead of through files in the working
+    directory. When a run directory is given, every output is also written to `<name>.json` in it together
+    with the key of the inputs it was computed from, so a later run can skip a stage whose inputs are
+    unchanged (see load()). Checkpoints are written atomically, and each run directory belongs to one project,
+    so concurrent runs for different projects do not touch each other's artifacts.
+
+    Args:
+        run_dir (str): Directory of the checkpoints, created if needed; None keeps the artifacts in memory only.
+    """
+
+    def __init__(self, run_dir=None):
+        self.run_dir = run_dir
+        self._artifacts = {}
+        self._lock = threading.Lock()
+        if run_dir:
+            os.makedirs(run_dir, exist_ok=True)
+
+    def __contains__(self, name):
+        return name in self._artifacts
+
+    def path(self, name):
+        return os.path.join(self.run_dir, f"{name}.json")
+
+    def get(self, name, default=None):
+        """Returns the in-memory artifact of a stage."""
+        with self._lock:
+            return self._artifacts.get(name, default)
+
+    def put(self, name, value, key=None):
+        """
+        Stores the output of a stage and checkpoints it, if the store has a run directory.
+
+        Args:
+            name (str): Name of the stage.
+            value: The output; must be JSON-serializable to be checkpointed.
+            key (str): Key of the inputs the output was computed from, see input_key().
+        """
+        with self._lock:
+            self._artifacts[name] = value
+        if not self.run_dir or key is None:
+            return
+        tmp_file = f"{self.path(name)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump({"key": key, "value": value}, f)
+            os.replace(tmp_file, self.path(name))
+        except (OSError, TypeError, ValueError) as e:
+            print(f"⚠ WARNING: Could not checkpoint {name} - {e}")
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    def load(self, name, key):
+        """
+        Loads the checkpoint of a stage into memory if it was computed from the same inputs.
+
+        Returns:
+            tuple: (found, value); found is False if there is no checkpoint or its key differs.
+        """
+        if not self.run_dir or not os.path.exists(self.path(name)):
+            return False, None
+        try:
+            with open(self.path(name), "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠ WARNING: Ignoring unreadable checkpoint {self.path(name)} - {e}")
+            return False, None
+        if checkpoint.get("key") != key:
+            return False, None
+        with self._lock:
+            self._artifacts[name] = checkpoint["value"]
+        return True, checkpoint["value"]
@@ -0,0 +1,218 @@
+import json
+import os
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+
+TOKEN = re.compile(r"[a-z0-9_]+")
+
+
+def tokenize(text):
+    """
+    Splits text into lowercase terms for keyword search.
+
+    Identifiers joined by underscores are kept whole and also split into their parts, so a query for
+    "aws_s3_bucket" matches the exact resource name first but still matches "s3 bucket".
+    """
+    terms = []
+    for token in TOKEN.findall(text.lower()):
+        terms.append(token)
+        if "_" in token:
+            terms.extend(part for part in token.split("_") if part)
+    return terms
+
+
+class BM25Index:
+    """
+    A local inverted index with BM25 scoring over the same chunks as the vector store.
+
+    The index is stored in `directory` in a compact, memory-mapped CSR layout: the sorted vocabulary
+    (terms.json), per-term offsets into the posting lists (offsets.npy), the posting lists themselves as
+    document numbers and term frequencies (postings.npy, frequencies.npy), and the document lengths
+    (lengths.npy). Chunk IDs and metadata are kept in records.json in document number order.
+
+    A query reads the posting lists of its terms only and scores them with vectorized numpy operations,
+    which takes well under a millisecond to a few milliseconds for the documentation indexes we build.
+    Changes are applied in memory and the index is rebuilt by save(), like LocalVectorStore.
+
+    Args:
+        directory (str): Directory holding the index files; created on save() if needed.
+        k1 (float): BM25 term frequency saturation.
+        b (float): BM25 document length normalization.
+    """
+
+    def __init__(self, directory, k1=1.2, b=0.75):
+        self.directory = directory
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._ids = []
+        self._metadata = []
+        self._row_of = {}
+        self._terms = {}
+        self._offsets = self._postings = self._frequencies = self._norms = None
+        self._dirty = False
+        self._load()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        if not os.path.exists(self.path("records.json")):
+            return
+        with open(self.path("records.json"), "r", encoding="utf-8") as f:
+            records = json.load(f)
+        with open(self.path("terms.json"), "r", encoding="utf-8") as f:
+            self._terms = {term: i for i, term in enumerate(json.load(f))}
+        self._ids = records["ids"]
+        self._metadata = records["metadata"]
+        self._row_of = {doc_id: row for row, doc_id in enumerate(self._ids)}
+        self._offsets = np.load(self.path("offsets.npy"), mmap_mode="r")
+        self._postings = np.load(self.path("postings.npy"), mmap_mode="r")
+        self._frequencies = np.load(self.path("frequencies.npy"), mmap_mode="r")
+        lengths = np.load(self.path("lengths.npy"))
+        average_length = max(float(lengths.mean()), 1.0) if len(lengths) else 1.0
+        self._norms = (self.k1 * (1 - self.b + self.b * lengths / average_length)).astype(np.float32)
+
+    def upsert(self, documents):
+        """
+        Adds or replaces documents.
+
+        Args:
+            documents (list): {"id": str, "metadata": {"text": str, ...}} dicts, the same records that are
+                              upserted into the vector store (any "values" are ignored).
+        """
+        with self._lock:
+            for document in documents:
+                metadata = document.get("metadata", {})
+                row = self._row_of.get(document["id"])
+                if row is None:
+                    self._row_of[document["id"]] = len(self._ids)
+                    self._ids.append(document["id"])
+                    self._metadata.append(metadata)
+                else:
+                    self._metadata[row] = metadata
+            self._dirty = True
+
+    def delete(self, ids):
+        with self._lock:
+            removed = {self._row_of[doc_id] for doc_id in ids if doc_id in self._row_of}
+            if not removed:
+                return
+            self._ids = [doc_id for row, doc_id in enumerate(self._ids) if row not in removed]
+            self._metadata = [metadata for row, metadata in enumerate(self._metadata) if row not in removed]
+            self._row_of = {doc_id: row for row, doc_id in enumerate(self._ids)}
+            self._dirty = True
+
+    def save(self):
+        """Rebuilds the inverted index from the current documents and writes it to disk."""
+        with self._lock:
+            if not self._dirty:
+                return
+            postings = {}
+            lengths = np.zeros(len(self._ids), dtype=np.int32)
+            for row, metadata in enumerate(self._metadata):
+                terms = tokenize(metadata.get("text", ""))
+                lengths[row] = len(terms)
+                for term, frequency in Counter(terms).items():
+                    postings.setdefault(term, []).append((row, frequency))
+
+            vocabulary = sorted(postings)
+            offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+            for i, term in enumerate(vocabulary):
+                offsets[i + 1] = offsets[i] + len(postings[term])
+            flat = [entry for term in vocabulary for entry in postings[term]]
+            documents = np.array([row for row, _ in flat], dtype=np.int32)
+            frequencies = np.array([min(frequency, 65535) for _, frequency in flat], dtype=np.uint16)
+
+            os.makedirs(self.directory, exist_ok=True)
+            for name, array in (("offsets.npy", offsets), ("postings.npy", documents),
+                                ("frequencies.npy", frequencies), ("lengths.npy", lengths)):
+                tmp = self.path(name + ".tmp.npy")
+                np.save(tmp, array)
+                os.replace(tmp, self.path(name))
+            for name, content in (("terms.json", vocabulary), ("records.json", {"ids": self._ids,
+                                                                                 "metadata": self._metadata})):
+                tmp = self.path(name + ".tmp")
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(content, f)
+                os.replace(tmp, self.path(name))
+
+            self._dirty = False
+            self._load()
+
+    def query(self, text, top_k=5, include_metadata=True):
+        """
+        Scores the documents against the query terms with BM25.
+
+        Returns:
+            dict: {"matches": [{"id", "score", "metadata"}]}, best first; documents without any query term
+                  are not returned.
+        """
+        with self._lock:
+            if self._dirty:
+                self.save()
+            if self._offsets is None or not len(self._ids):
+                return {"matches": []}
+
+            n_docs = len(self._ids)
+            scores = np.zeros(n_docs, dtype=np.float32)
+            for term in set(tokenize(text)):
+                i = self._terms.get(term)
+                if i is None:
+                    continue
+                start, end = self._offsets[i], self._offsets[i + 1]
+                rows = self._postings[start:end]
+                frequencies = self._frequencies[start:end].astype(np.float32)
+                idf = np.log(1 + (n_docs - (end - start) + 0.5) / ((end - start) + 0.5))
+                scores[rows] += idf * frequencies * (self.k1 + 1) / (frequencies + self._norms[rows])
+
+            candidates = np.flatnonzero(scores)
+            k = min(top_k, len(candidates))
+            if not k:
+                return {"matches": []}
+            best = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+            best = best[np.argsort(-scores[best], kind="stable")]
+
+            matches = []
+            for row in best:
+                match = {"id": self._ids[row], "score": float(scores[row])}
+                if include_metadata:
+                    match["metadata"] = self._metadata[row]
+                matches.append(match)
+            return {"matches": matches}
+
+
+def reciprocal_rank_fusion(result_lists, k=60, top_k=None):
+    """
+    Fuses ranked match lists (e.g. vector and BM25 results) with reciprocal rank fusion.
+
+    Each match contributes 1 / (k + rank) to the fused score of its ID, so documents ranked well by several
+    retrievers rise to the top without having to calibrate their scores against each other.
+
+    Args:
+        result_lists (list): Lists of matches ({"id", "metadata", ...}, or Pinecone matches), each ordered best
+                             first.
+        k (int): Rank offset; larger values flatten the influence of the top ranks.
+        top_k (int): Number of fused matches to return; all by default.
+
+    Returns:
+        list: Fused matches {"id", "score", "metadata"}, best first.
+    """
+    fused = {}
+    for matches in result_lists:
+        for rank, match in enumerate(matches, start=1):
+            entry = fused.setdefault(match["id"], {"id": match["id"], "score": 0.0, "metadata": match["metadata"]})
+            entry["score"] += 1.0 / (k + rank)
+    ranked = sorted(fused.values(), key=lambda entry: entry["score"], reverse=True)
+    return ranked[:top_k] if top_k is not None else ranked
+
+
+def create_keyword_index(directory=None):
+    """Opens the BM25 index in BM25_INDEX_DIR (default ".bm25_index"), or the given directory."""
+    return BM25Index(directory or os.getenv("BM25_INDEX_DIR", ".bm25_index"))
@@ -0,0 +1,287 @@
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+CASSETTE_ENV = "PIPELINE_CASSETTE"
+CASSETTE_MODE_ENV = "PIPELINE_CASSETTE_MODE"
+CASSETTE_LATENCY_ENV = "PIPELINE_CASSETTE_LATENCY"
+CASSETTE_MATCH_BY_ORDER_ENV = "PIPELINE_CASSETTE_MATCH_BY_ORDER"
+RECORD = "record"
+REPLAY = "replay"
+CASSETTE_VERSION = 1
+
+
+class CassetteMiss(LookupError):
+    """Raised in replay mode when the cassette holds no interaction for a request."""
+
+
+class RecordedError(Exception):
+    """A failure recorded on the cassette, raised again on replay when the caller gave no matching type."""
+
+
+def request_key(kind, request):
+    """Returns the key of a request: a SHA-256 of its kind and its canonical JSON encoding."""
+    data = json.dumps([kind, request], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """
+    Records the external calls of a pipeline run (OpenRouter, Ollama, Pinecone, crawl4ai and plain HTTP) to a
+    gzipped JSON-lines file, and replays them without any network access.
+
+    Each line after the header is one interaction: {"kind", "key", "seconds"} and either "response", "error"
+    (the type and message of a recorded failure) or "events" ([offset seconds, event] pairs of a stream). Only
+    the key of a request is stored, not the request itself, which keeps the cassette compact.
+
+    On replay a request is answered by the next unused interaction with the same key. A strict cassette (the
+    default) raises CassetteMiss for a request whose key was not recorded or whose interactions are used up,
+    so a run that diverges from the recording fails instead of going on with mismatched responses. A lenient
+    cassette repeats the last interaction of a used-up key and answers an unrecorded request (e.g. a prompt
+    mentioning a path that differs between machines) with the next unused interaction of the same kind in
+    recorded order; both are counted in `unmatched`.
+
+    Args:
+        path (str): Path of the cassette file.
+        mode (str): "record" or "replay".
+        latency (float): On replay, sleep for the recorded duration of each call (and the recorded gaps
+                         between stream events) times this factor; 0 replays instantly.
+        strict (bool): On replay, raise CassetteMiss for any request without an unused recorded interaction
+                       of the same key; False matches such requests by order.
+    """
+
+    def __init__(self, path, mode=REPLAY, latency=0.0, strict=True):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.strict = strict
+        self.recorded = 0
+        self.replayed = 0
+        self.unmatched = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._by_key = defaultdict(deque)
+        self._last = {}
+        self._by_kind = defaultdict(deque)
+
+        if mode == RECORD:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = gzip.open(path, "wt", encoding="utf-8")
+            self._file.write(json.dumps({"cassette": CASSETTE_VERSION, "created": time.time()}) + "\n")
+        else:
+            self._load()
+
+    @property
+    def replaying(self):
+        return self.mode == REPLAY
+
+    def _load(self):
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            lines = iter(f)
+            header = json.loads(next(lines, "{}") or "{}")
+            if header.get("cassette") != CASSETTE_VERSION:
+                raise ValueError(f"{self.path} is not a version {CASSETTE_VERSION} cassette.")
+            try:
+                for line in lines:
+                    entry = json.loads(line)
+                    entry["used"] = False
+                    self._by_key[entry["key"]].append(entry)
+                    self._by_kind[entry["kind"]].append(entry)
+            except (EOFError, ValueError):
+                # A recording that was killed leaves a truncated last line; the complete interactions still count.
+                pass
+
+    def _write(self, entry):
+        with self._lock:
+            if self._file is not None:
+                self._file.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+                self.recorded += 1
+
+    def _take(self, kind, key):
+        """Returns the recorded interaction answering a request, marking it as used."""
+        with self._lock:
+            queue = self._by_key.get(key)
+            while queue and queue[0]["used"]:
+                queue.popleft()
+            if queue:
+                entry = queue.popleft()
+            elif self.strict:
+                raise CassetteMiss(f"No recorded {kind} interaction left for the request ({key[:12]}) in {self.path}.")
+            elif key in self._last:
+                entry = self._last[key]
+                self.unmatched += 1
+            else:
+                queue = self._by_kind.get(kind)
+                while queue and queue[0]["used"]:
+                    queue.popleft()
+                if not queue:
+                    raise CassetteMiss(f"No recorded {kind} interaction left in {self.path}.")
+                entry = queue.popleft()
+                self.unmatched += 1
+            entry["used"] = True
+            self._last[key] = entry
+            self.replayed += 1
+            return entry
+
+    def _sleep(self, seconds):
+        if self.latency and seconds > 0:
+            time.sleep(seconds * self.latency)
+
+    def call(self, kind, request, func, errors=()):
+        """
+        Records or replays a call.
+
+        Args:
+            kind (str): Service of the call, e.g. "openrouter" or "pinecone".
+            request: JSON-serializable description of the request; calls are matched on it.
+            func (callable): Makes the real call; its return value must be JSON-serializable.
+            errors (tuple): Exception types recorded as the outcome of the call and raised again on replay;
+                            other exceptions are not recorded.
+
+        Returns:
+            The (recorded) return value of `func`.
+        """
+        key = request_key(kind, request)
+        if self.replaying:
+            entry = self._take(kind, key)
+            self._sleep(entry.get("seconds", 0))
+            if "error" in entry:
+                raise _recorded_error(entry["error"], errors)
+            return entry.get("response")
+
+        started = time.perf_counter()
+        try:
+            response = func()
+        except errors as e:
+            self._write({"kind": kind, "key": key, "seconds": round(time.perf_counter() - started, 6),
+                         "error": [type(e).__name__, str(e)]})
+            raise
+        self._write({"kind": kind, "key": key, "seconds": round(time.perf_counter() - started, 6),
+                     "response": response})
+        return response
+
+    def stream(self, kind, request, func, errors=()):
+        """
+        Records or replays a streaming call, keeping the timing of its events.
+
+        A stream is recorded once it has been consumed to the end (or failed with one of `errors`); a stream
+        the caller abandons is not recorded.
+
+        Args:
+            kind (str): Service of the call.
+            request: JSON-serializable description of the request.
+            func (callable): Makes the real call and returns an iterator of JSON-serializable events.
+            errors (tuple): Exception types recorded as the end of the stream and raised again on replay.
+
+        Yields:
+            The (recorded) events.
+        """
+        key = request_key(kind, request)
+        if self.replaying:
+            entry = self._take(kind, key)
+            elapsed = 0.0
+            for offset, event in entry.get("events", []):
+                self._sleep(offset - elapsed)
+                elapsed = offset
+                yield event
+            self._sleep(entry.get("seconds", 0) - elapsed)
+            if "error" in entry:
+                raise _recorded_error(entry["error"], errors)
+            return
+
+        started = time.perf_counter()
+        events = []
+        try:
+            for event in func():
+                events.append([round(time.perf_counter() - started, 6), event])
+                yield event
+        except errors as e:
+            self._write({"kind": kind, "key": key, "seconds": round(time.perf_counter() - started, 6),
+                         "events": events, "error": [type(e).__name__, str(e)]})
+            raise
+        self._write({"kind": kind, "key": key, "seconds": round(time.perf_counter() - started, 6),
+                     "events": events})
+
+    def stats(self):
+        if self.replaying:
+            if not self.strict:
+                return f"{self.replayed} interactions replayed from {self.path} ({self.unmatched} matched by order)"
+            return f"{self.replayed} interactions replayed from {self.path}"
+        return f"{self.recorded} interactions recorded to {self.path}"
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def _recorded_error(error, errors):
+    """Rebuilds a recorded failure as the caller's exception type of the same name, or as RecordedError."""
+    name, message = error
+    for error_type in errors:
+        if error_type.__name__ == name:
+            return error_type(message)
+    return (errors[0] if errors else RecordedError)(message)
+
+
+_cassette = None
+_cassette_configured = False
+_cassette_lock = threading.Lock()
+
+
+def get_cassette():
+    """
+    Returns the process-wide Cassette, or None if calls are neither recorded nor replayed.
+
+    The cassette is enabled by the PIPELINE_CASSETTE environment variable (the path of the cassette file), with
+    PIPELINE_CASSETTE_MODE set to "record" or "replay" (the default). PIPELINE_CASSETTE_LATENCY is the latency
+    emulation factor of the replay (0 by default, 1 for real time). Requests without a recorded match fail the
+    replay unless PIPELINE_CASSETTE_MATCH_BY_ORDER is set, see Cassette.
+    """
+    global _cassette, _cassette_configured
+    if not _cassette_configured:
+        with _cassette_lock:
+            if not _cassette_configured:
+                path = os.getenv(CASSETTE_ENV)
+                if path:
+                    _cassette = Cassette(
+                        path,
+                        mode=os.getenv(CASSETTE_MODE_ENV, REPLAY).lower(),
+                        latency=float(os.getenv(CASSETTE_LATENCY_ENV) or 0),
+                        strict=os.getenv(CASSETTE_MATCH_BY_ORDER_ENV, "").lower() not in ("1", "true", "yes"),
+                    )
+                    atexit.register(_cassette.close)
+                _cassette_configured = True
+    return _cassette
+
+
+def replaying():
+    """Returns True if external calls are answered from a cassette, i.e. nothing may touch the network."""
+    cassette = get_cassette()
+    return cassette is not None and cassette.replaying
+
+
+def cassette_call(kind, request, func, errors=()):
+    """Runs `func`, through the process-wide cassette if one is enabled. See Cassette.call()."""
+    cassette = get_cassette()
+    if cassette is None:
+        return func()
+    return cassette.call(kind, request, func, errors)
+
+
+def cassette_stream(kind, request, func, errors=()):
+    """Iterates over `func()`, through the process-wide cassette if one is enabled. See Cassette.stream()."""
+    cassette = get_cassette()
+    if cassette is None:
+        return func()
+    return cassette.stream(kind, request, func, errors)
@@ -0,0 +1,294 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from common.tracing import annotate
+
+# SQLite limits the number of host parameters per statement; lookups are split into chunks of this size.
+LOOKUP_CHUNK = 500
+
+
+class _ModelStore:
+    """The embeddings of one model: a float16 matrix memory-mapped from disk and a SQLite index of its rows."""
+
+    def __init__(self, directory, model_name, dimension, capacity):
+        self.directory = directory
+        self.dimension = dimension
+        self.capacity = capacity
+        meta_path = os.path.join(directory, "meta.json")
+        vectors_path = os.path.join(directory, "vectors.f16")
+
+        meta = {"model": model_name, "dimension": dimension, "capacity": capacity}
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                if json.load(f) != meta:
+                    # A different dimension or capacity: the stored rows cannot be reused.
+                    shutil.rmtree(directory)
+        os.makedirs(directory, exist_ok=True)
+
+        exists = os.path.exists(vectors_path)
+        self.vectors = np.memmap(vectors_path, dtype=np.float16, mode="r+" if exists else "w+",
+                                 shape=(capacity, dimension))
+        # The crawler and the pipeline may share the store from different processes; writers wait for each other.
+        self.conn = sqlite3.connect(os.path.join(directory, "index.sqlite3"), timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, slot INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access)")
+        # Rows freed by eviction, and the first row never handed out yet.
+        self.conn.execute("CREATE TABLE IF NOT EXISTS free_slots (slot INTEGER PRIMARY KEY)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self.conn.execute(
+            "INSERT OR IGNORE INTO counters VALUES ('next_slot', (SELECT COALESCE(MAX(slot) + 1, 0) FROM entries))"
+        )
+        self.conn.commit()
+        if not os.path.exists(meta_path):
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+
+    def close(self):
+        self.vectors.flush()
+        self.conn.close()
+
+
+class EmbeddingCache:
+    """
+    A persistent cache of text embeddings, keyed by (model name, hash of the text).
+
+    Each model has its own store under `directory`: a preallocated float16 matrix that is memory-mapped, so
+    a lookup only touches the rows it reads, and a SQLite index mapping text hashes to rows. Lookups and
+    inserts work on whole batches. When the store is full, the least recently used tenth of the rows is
+    evicted and the freed rows are reused.
+
+    Embeddings are stored as float16, which halves the size and is far more precise than cosine similarity
+    ranking needs; they are returned as float32. A store is dropped automatically when the model's
+    embedding dimension changes, and invalidate() drops it explicitly, e.g. after updating the model weights
+    under the same name.
+
+    Args:
+        directory (str): Directory holding one subdirectory per model.
+        max_entries (int): Number of embeddings kept per model.
+
+    Attributes:
+        hits (int): Number of texts answered from the cache.
+        misses (int): Number of texts that had to be encoded.
+    """
+
+    def __init__(self, directory=".cache/embeddings", max_entries=100000):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._stores = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def model_directory(self, model_name):
+        safe_name = re.sub(r"[^A-Za-z0-9._-]+", "_", model_name)
+        return os.path.join(self.directory, safe_name)
+
+    def _store(self, model_name, dimension=None):
+        """Opens the store of a model; with dimension=None only an existing store is opened, else None is returned."""
+        store = self._stores.get(model_name)
+        if dimension is None:
+            if store is not None:
+                return store
+            meta_path = os.path.join(self.model_directory(model_name), "meta.json")
+            if not os.path.exists(meta_path):
+                return None
+            with open(meta_path, "r", encoding="utf-8") as f:
+                dimension = json.load(f)["dimension"]
+        if store is None or store.dimension != dimension:
+            if store is not None:
+                store.close()
+            store = _ModelStore(self.model_directory(model_name), model_name, dimension, self.max_entries)
+            self._stores[model_name] = store
+        return store
+
+    def get_many(self, model_name, texts, dimension=None):
+        """
+        Looks up the embeddings of a batch of texts.
+
+        Args:
+            model_name (str): Name of the embedding model.
+            texts (list): The texts to look up.
+            dimension (int): Embedding dimension of the model; a store with another dimension is dropped.
+                             None uses whatever is stored for the model.
+
+        Returns:
+            list: A float32 vector per text, or None for texts that are not cached.
+        """
+        keys = [self.make_key(text) for text in texts]
+        with self._lock:
+            store = self._store(model_name, dimension)
+            if store is None:
+                self.misses += len(keys)
+                return [None] * len(keys)
+            slots = {}
+            for i in range(0, len(keys), LOOKUP_CHUNK):
+                chunk = keys[i:i + LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                slots.update(
+                    store.conn.execute(f"SELECT key, slot FROM entries WHERE key IN ({placeholders})", chunk)
+                )
+            if slots:
+                now = time.time()
+                store.conn.executemany("UPDATE entries SET last_access = ? WHERE key = ?",
+                                       [(now, key) for key in slots])
+                store.conn.commit()
+
+            results = [
+                np.asarray(store.vectors[slots[key]], dtype=np.float32) if key in slots else None for key in keys
+            ]
+            found = sum(result is not None for result in results)
+            self.hits += found
+            self.misses += len(results) - found
+            return results
+
+    def put_many(self, model_name, texts, embeddings):
+        """Stores the embeddings of a batch of texts."""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if not len(texts):
+            return
+        keys = list(dict.fromkeys(self.make_key(text) for text in texts))
+        rows = {self.make_key(text): row for row, text in enumerate(texts)}
+
+        with self._lock:
+            store = self._store(model_name, embeddings.shape[1])
+            if store.conn.in_transaction:
+                store.conn.commit()
+            # The write lock is held from the lookup to the insert, so another process sharing the store can
+            # neither take the same rows nor insert the same keys in between.
+            store.conn.execute("BEGIN IMMEDIATE")
+            try:
+                existing = {}
+                for i in range(0, len(keys), LOOKUP_CHUNK):
+                    chunk = keys[i:i + LOOKUP_CHUNK]
+                    placeholders = ",".join("?" * len(chunk))
+                    existing.update(
+                        store.conn.execute(f"SELECT key, slot FROM entries WHERE key IN ({placeholders})", chunk)
+                    )
+                new_keys = [key for key in keys if key not in existing][:store.capacity]
+                free_slots = self._free_slots(store, len(new_keys))
+
+                # Texts already cached keep their rows: the same text always has the same embedding under a model.
+                # The rows are written before the keys are committed, so no reader finds a key without its row.
+                now = time.time()
+                assignments = list(zip(new_keys, free_slots))
+                for key, slot in assignments:
+                    store.vectors[slot] = embeddings[rows[key]]
+                store.vectors.flush()
+                store.conn.executemany("INSERT INTO entries VALUES (?, ?, ?)",
+                                       [(key, slot, now) for key, slot in assignments])
+                store.conn.commit()
+            except BaseException:
+                store.conn.rollback()
+                raise
+
+    @staticmethod
+    def _free_slots(store, count):
+        """
+        Reserves `count` unused rows, evicting the least recently used entries if the store is full.
+
+        Must be called inside a write transaction. Rows are taken from the rows freed by earlier evictions,
+        then from the rows never used yet; evicted rows beyond `count` go to the free list.
+        """
+        free = [slot for (slot,) in store.conn.execute("SELECT slot FROM free_slots ORDER BY slot LIMIT ?",
+                                                       (count,))]
+        store.conn.executemany("DELETE FROM free_slots WHERE slot = ?", [(slot,) for slot in free])
+
+        if len(free) < count:
+            next_slot = store.conn.execute("SELECT value FROM counters WHERE name = 'next_slot'").fetchone()[0]
+            fresh = min(count - len(free), store.capacity - next_slot)
+            free.extend(range(next_slot, next_slot + fresh))
+            store.conn.execute("UPDATE counters SET value = ? WHERE name = 'next_slot'", (next_slot + fresh,))
+
+        if len(free) < count:
+            evict = max(count - len(free), store.capacity // 10)
+            evicted = store.conn.execute("SELECT key, slot FROM entries ORDER BY last_access LIMIT ?",
+                                         (evict,)).fetchall()
+            store.conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in evicted])
+            slots = [slot for _, slot in evicted]
+            needed = count - len(free)
+            free.extend(slots[:needed])
+            store.conn.executemany("INSERT INTO free_slots VALUES (?)", [(slot,) for slot in slots[needed:]])
+        return free
+
+    def embed(self, model_name, texts, encode, dimension=None):
+        """
+        Returns the embeddings of a batch of texts, encoding only those that are not cached.
+
+        Args:
+            model_name (str): Name of the embedding model; part of the cache key.
+            texts (list): The texts to embed.
+            encode (callable): Called with the list of texts missing from the cache; returns their embeddings.
+            dimension (int): Embedding dimension of the model, if known without loading it.
+
+        Returns:
+            numpy.ndarray: A float32 matrix with one row per text.
+        """
+        results = self.get_many(model_name, texts, dimension)
+        missing = [i for i, result in enumerate(results) if result is None]
+        annotate(cache_hits=len(texts) - len(missing), cache_misses=len(missing))
+        if missing:
+            missing_texts = list(dict.fromkeys(texts[i] for i in missing))
+            encoded = np.asarray(encode(missing_texts), dtype=np.float32)
+            self.put_many(model_name, missing_texts, encoded)
+            by_text = dict(zip(missing_texts, encoded))
+            for i in missing:
+                results[i] = by_text[texts[i]]
+        if not results:
+            return np.empty((0, dimension or 0), dtype=np.float32)
+        return np.stack(results)
+
+    def invalidate(self, model_name=None):
+        """Drops the cached embeddings of a model, or of all models."""
+        with self._lock:
+            names = [model_name] if model_name is not None else list(self._stores)
+            for name in names:
+                store = self._stores.pop(name, None)
+                if store is not None:
+                    store.close()
+            if model_name is not None:
+                shutil.rmtree(self.model_directory(model_name), ignore_errors=True)
+            else:
+                shutil.rmtree(self.directory, ignore_errors=True)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            for store in self._stores.values():
+                store.close()
+            self._stores.clear()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    """
+    Returns the EmbeddingCache shared by the crawler and the retrieval path, or None if EMBEDDING_CACHE_DISABLED
+    is set. The cache lives in EMBEDDING_CACHE_DIR (default ".cache/embeddings").
+    """
+    global _default_cache
+    if os.getenv("EMBEDDING_CACHE_DISABLED"):
+        return None
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = EmbeddingCache(os.getenv("EMBEDDING_CACHE_DIR", ".cache/embeddings"))
+    return _default_cache
@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+ManifestDiff = namedtuple("ManifestDiff", ["added", "changed", "deleted", "unchanged"])
+
+
+def hash_file(file_path, block_size=1024 * 1024):
+    """Returns the SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FileManifest:
+    """
+    A record of (path, size, mtime, content hash) for every file seen by a previous run.
+
+    Comparing a manifest against the current state of the disk tells an incremental run which files were
+    added, changed or deleted since then. Files whose size and mtime are unchanged are trusted without being
+    re-read, so refreshing the manifest of an unchanged tree costs one stat() per file.
+
+    Args:
+        entries (dict): Mapping of file path to {"size": int, "mtime_ns": int, "sha256": str}.
+    """
+
+    def __init__(self, entries=None):
+        self.entries = entries or {}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(dict(data or {}))
+
+    def to_dict(self):
+        return self.entries
+
+    def refresh(self, file_paths):
+        """
+        Builds the manifest for the given files and compares it with this one.
+
+        Args:
+            file_paths (iterable): Paths of the files that currently make up the project.
+
+        Returns:
+            tuple: A tuple containing two elements:
+                - manifest (FileManifest): The manifest describing the current files.
+                - diff (ManifestDiff): Lists of added, changed, deleted and unchanged paths, relative to this manifest.
+        """
+        entries = {}
+        added, changed, unchanged = [], [], []
+
+        for file_path in file_paths:
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+
+            previous = self.entries.get(file_path)
+            if previous and previous["size"] == stat.st_size and previous["mtime_ns"] == stat.st_mtime_ns:
+                entries[file_path] = previous
+                unchanged.append(file_path)
+                continue
+
+            try:
+                sha256 = hash_file(file_path)
+            except OSError:
+                continue
+
+            entries[file_path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}
+            if previous is None:
+                added.append(file_path)
+            elif previous["sha256"] != sha256:
+                changed.append(file_path)
+            else:
+                unchanged.append(file_path)
+
+        deleted = [file_path for file_path in self.entries if file_path not in entries]
+        return FileManifest(entries), ManifestDiff(added, changed, deleted, unchanged)
+
+
+def load_state(state_file):
+    """Loads the JSON state saved by a previous incremental run, or returns an empty dict if there is none."""
+    if not state_file or not os.path.exists(state_file):
+        return {}
+    try:
+        with open(state_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠ WARNING: Ignoring unreadable state file {state_file} - {e}")
+        return {}
+
+
+def save_state(state_file, state):
+    """Atomically writes the JSON state of an incremental run."""
+    directory = os.path.dirname(state_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_file = f"{state_file}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_file, state_file)
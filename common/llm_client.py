@@ -0,0 +1,344 @@
+import bisect
+import email.utils
+import json
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from common.cassette import cassette_call, cassette_stream, get_cassette
+from common.response_cache import ResponseCache
+from common.tracing import annotate, span
+
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """
+    Raised when an LLM request fails for good, i.e. after all retries or with a non-retryable error.
+
+    Attributes:
+        status_code (int | None): HTTP status of the last response, or None if no response was received.
+        body (str | None): Body of the last response.
+    """
+
+    def __init__(self, message, status_code=None, body=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.body = body
+
+
+class LatencyHistogram:
+    """
+    A thread-safe histogram of request latencies with fixed bucket bounds in seconds.
+
+    Args:
+        bounds (tuple): Upper bounds of the buckets; latencies above the last bound go to an overflow bucket.
+    """
+
+    def __init__(self, bounds=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+            self.count += 1
+            self.total += seconds
+
+    def snapshot(self):
+        """Returns {"count", "sum", "buckets": {upper bound: count}} with "+Inf" for the overflow bucket."""
+        with self._lock:
+            labels = [str(bound) for bound in self.bounds] + ["+Inf"]
+            return {"count": self.count, "sum": self.total, "buckets": dict(zip(labels, self.counts))}
+
+    def summary(self):
+        snapshot = self.snapshot()
+        if not snapshot["count"]:
+            return "no LLM requests"
+        buckets = ", ".join(f"≤{label}s: {count}" for label, count in snapshot["buckets"].items() if count)
+        return f"{snapshot['count']} LLM requests, mean {snapshot['sum'] / snapshot['count']:.2f}s ({buckets})"
+
+
+class LLMClient:
+    """
+    A pooled HTTP client for OpenRouter's OpenAI-compatible chat completions API.
+
+    All callers share one requests.Session, so connections are kept alive and reused instead of paying a
+    TCP and TLS handshake per request. Requests time out, and 429/5xx responses as well as connection
+    errors are retried with exponential backoff and full jitter, honouring the Retry-After header when the
+    server sends one.
+
+    Args:
+        api_key (str): OpenRouter API key; defaults to the OPENROUTER_API_KEY environment variable.
+        base_url (str): API base URL; defaults to OPENROUTER_BASE_URL from the environment, then to OpenRouter.
+        timeout (tuple): (connect, read) timeouts in seconds.
+        max_retries (int): Number of retries after the first attempt.
+        backoff_base (float): Base delay of the exponential backoff, in seconds.
+        backoff_max (float): Upper bound of a single backoff delay, in seconds.
+        pool_size (int): Maximum number of pooled connections.
+        cache (ResponseCache): Optional cache of chat responses; hits are answered without any network traffic.
+
+    Attributes:
+        latency (LatencyHistogram): Latencies of all attempts made by this client.
+    """
+
+    def __init__(self, api_key=None, base_url=None, timeout=(10, 300), max_retries=4, backoff_base=1.0,
+                 backoff_max=60.0, pool_size=16, cache=None):
+        self.api_key = api_key or os.getenv("OPENROUTER_API_KEY")
+        self.base_url = (base_url or os.getenv("OPENROUTER_BASE_URL") or OPENROUTER_BASE_URL).rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.latency = LatencyHistogram()
+        self.cache = cache
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(
+            {
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json",
+            }
+        )
+
+    def backoff_delay(self, attempt, response=None):
+        """Returns how long to wait before the given retry attempt (1-based)."""
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    def send(self, path, payload, stream=False):
+        """
+        POSTs a JSON payload, retrying transient failures until a 200 response is received.
+
+        With stream=True the response body is not read, so the caller can consume it incrementally; retries
+        only happen before the first byte of a successful response.
+
+        Returns:
+            requests.Response: The successful response.
+
+        Raises:
+            LLMError: If the request cannot be completed.
+        """
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        attempt = 0
+        while True:
+            response = None
+            started = time.perf_counter()
+            try:
+                response = self.session.post(url, json=payload, timeout=self.timeout, stream=stream)
+                error = None
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            finally:
+                self.latency.observe(time.perf_counter() - started)
+
+            if response is not None and response.status_code == 200:
+                return response
+
+            retryable = error is not None or response.status_code in RETRYABLE_STATUS_CODES
+            if not retryable or attempt >= self.max_retries:
+                if error is not None:
+                    raise LLMError(f"Request to {url} failed: {error}") from error
+                raise LLMError(
+                    f"API Error: {response.status_code} - {response.text}", response.status_code, response.text
+                )
+
+            attempt += 1
+            delay = self.backoff_delay(attempt, response)
+            reason = error if error is not None else f"HTTP {response.status_code}"
+            if response is not None:
+                response.close()
+            print(f"⚠ LLM request failed ({reason}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+            annotate(retries=1)
+            time.sleep(delay)
+
+    def post(self, path, payload):
+        """
+        POSTs a JSON payload, retrying transient failures.
+
+        Returns:
+            dict: The decoded JSON response.
+
+        Raises:
+            LLMError: If the request cannot be completed.
+        """
+        response = self.send(path, payload)
+        try:
+            return response.json()
+        except ValueError as e:
+            raise LLMError(f"Invalid JSON response: {e}", response.status_code, response.text) from e
+
+    def chat(self, model, messages, use_cache=True, **params):
+        """
+        Sends a chat completion request, or answers it from the response cache.
+
+        Args:
+            model (str): OpenRouter model ID.
+            messages (list): OpenAI-style chat messages.
+            use_cache (bool): Whether the response cache may be used for this request.
+            **params: Additional sampling parameters (temperature, max_tokens, ...).
+
+        Returns:
+            str: The content of the first choice.
+
+        Raises:
+            LLMError: If the request fails or the response contains no message.
+        """
+        cache = self.cache if use_cache else None
+        with span("llm", model, provider="openrouter") as s:
+            if cache is not None:
+                cached = cache.get(model, messages, params)
+                if cached is not None:
+                    s.add(cache_hits=1)
+                    return cached
+                s.add(cache_misses=1)
+
+            payload = {"model": model, "messages": messages, **params}
+            json_response = cassette_call("openrouter", payload, lambda: self.post("chat/completions", payload),
+                                          errors=(LLMError,))
+            try:
+                content = json_response["choices"][0]["message"]["content"]
+            except (KeyError, IndexError, TypeError) as e:
+                error = json_response.get("error") if isinstance(json_response, dict) else None
+                raise LLMError(f"Unexpected response from {model}: {error or json_response}") from e
+            s.set(**usage_counts(json_response.get("usage")))
+
+            if cache is not None and content:
+                cache.put(model, messages, params, content)
+            return content
+
+    def stream_chat(self, model, messages, use_cache=True, **params):
+        """
+        Sends a streaming chat completion request and yields the content as it arrives over server-sent events.
+
+        A cached response is yielded as a single piece. The complete response is only cached when the stream
+        ends normally, so an aborted stream (the caller closing the generator) leaves no cache entry behind.
+
+        Args:
+            model (str): OpenRouter model ID.
+            messages (list): OpenAI-style chat messages.
+            use_cache (bool): Whether the response cache may be used for this request.
+            **params: Additional sampling parameters (temperature, max_tokens, ...).
+
+        Yields:
+            str: Content deltas of the first choice.
+
+        Raises:
+            LLMError: If the request fails or the stream reports an error.
+        """
+        cache = self.cache if use_cache else None
+        with span("llm", model, provider="openrouter", stream=True) as s:
+            if cache is not None:
+                cached = cache.get(model, messages, params)
+                if cached is not None:
+                    s.add(cache_hits=1)
+                    yield cached
+                    return
+                s.add(cache_misses=1)
+
+            started = time.perf_counter()
+            payload = {"model": model, "messages": messages, "stream": True, **params}
+            pieces = []
+            for event in cassette_stream("openrouter", payload, lambda: self._stream_events(model, payload),
+                                         errors=(LLMError,)):
+                # OpenRouter reports the token usage in the last event.
+                s.set(**usage_counts(event.get("usage")))
+
+                choices = event.get("choices") or [{}]
+                delta = (choices[0].get("delta") or {}).get("content")
+                if delta:
+                    if not pieces:
+                        s.set(first_token_seconds=round(time.perf_counter() - started, 6))
+                    pieces.append(delta)
+                    yield delta
+
+            if cache is not None and pieces:
+                cache.put(model, messages, params, "".join(pieces))
+
+    def _stream_events(self, model, payload):
+        """
+        Sends a streaming request and yields the decoded server-sent events, up to the [DONE] marker.
+
+        Raises:
+            LLMError: If the request fails or the stream is invalid, reports an error or is interrupted.
+        """
+        response = self.send("chat/completions", payload, stream=True)
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                # Blank lines separate events and lines starting with ":" are keep-alive comments.
+                if not line or line.startswith(":") or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    event = json.loads(data)
+                except ValueError as e:
+                    raise LLMError(f"Invalid event in stream from {model}: {data}") from e
+                if event.get("error"):
+                    raise LLMError(f"Stream from {model} failed: {event['error']}")
+                yield event
+        except requests.RequestException as e:
+            raise LLMError(f"Stream from {model} was interrupted: {e}") from e
+        finally:
+            response.close()
+
+
+def usage_counts(usage):
+    """Returns the prompt and completion token counts of an OpenAI-style usage object, for a tracing span."""
+    if not isinstance(usage, dict):
+        return {}
+    return {key: usage[key] for key in ("prompt_tokens", "completion_tokens") if isinstance(usage.get(key), int)}
+
+
+def parse_retry_after(value):
+    """Parses a Retry-After header given either in seconds or as an HTTP date; returns seconds or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Returns the LLMClient shared by all OpenRouter callers, creating it on first use.
+
+    The shared client caches responses unless LLM_CACHE_DISABLED is set; LLM_CACHE_BYPASS skips cache lookups
+    while still refreshing the stored responses. Lookups are also skipped while a cassette is recorded or replayed.
+    """
+    global _default_client
+    if _default_client is None:
+        with _default_client_lock:
+            if _default_client is None:
+                cache = None
+                if not os.getenv("LLM_CACHE_DISABLED"):
+                    # Recording or replaying a cassette needs every request to reach it, not the cache.
+                    bypass = bool(os.getenv("LLM_CACHE_BYPASS")) or get_cassette() is not None
+                    cache = ResponseCache(bypass=bypass)
+                _default_client = LLMClient(cache=cache)
+    return _default_client
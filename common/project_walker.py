@@ -0,0 +1,119 @@
+import os
+import re
+
+from pathspec import PathSpec
+
+DEFAULT_IGNORE_PATTERNS = (".git/",)
+
+
+class IgnoreRules:
+    """
+    The compiled patterns of one .gitignore file.
+
+    Patterns are matched against paths relative to the directory the .gitignore lives in. When a file has no
+    negated ("!pattern") rules, all of its patterns are folded into a single regular expression, so a
+    lookup costs one regex match instead of one per pattern.
+
+    Args:
+        base (str): Path of the .gitignore's directory relative to the walk root, with a trailing "/" ("" for the root).
+        lines (iterable): The lines of the .gitignore file.
+    """
+
+    def __init__(self, base, lines):
+        self.base = base
+        self.patterns = [p for p in PathSpec.from_lines("gitwildmatch", lines).patterns if p.include is not None]
+        self._combined = None
+
+        if self.patterns and all(p.include for p in self.patterns):
+            try:
+                self._combined = re.compile(
+                    "|".join(f"(?:{re.sub(r'[(][?]P<[^>]+>', '(?:', p.regex.pattern)})" for p in self.patterns)
+                )
+            except (AttributeError, re.error):
+                self._combined = None
+
+    def match(self, rel_path):
+        """
+        Returns True if the path is ignored, False if a negated pattern re-includes it and None if no pattern matches.
+
+        Args:
+            rel_path (str): Path relative to the walk root; directories must end with "/".
+        """
+        rel_path = rel_path[len(self.base):]
+        if self._combined is not None:
+            return True if self._combined.match(rel_path) else None
+
+        result = None
+        for pattern in self.patterns:
+            if pattern.match_file(rel_path) is not None:
+                result = pattern.include
+        return result
+
+
+def load_ignore_rules(dir_path, base):
+    """Compiles the .gitignore of a directory, or returns None if it has none."""
+    try:
+        with open(os.path.join(dir_path, ".gitignore"), "r", encoding="utf-8", errors="ignore") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+
+    rules = IgnoreRules(base, lines)
+    return rules if rules.patterns else None
+
+
+def is_ignored(rules_stack, rel_path):
+    """Applies the stacked rules from the root down; the deepest .gitignore with a matching pattern decides."""
+    ignored = False
+    for rules in rules_stack:
+        result = rules.match(rel_path)
+        if result is not None:
+            ignored = result
+    return ignored
+
+
+def walk_project(root_dir, extra_ignore_patterns=DEFAULT_IGNORE_PATTERNS):
+    """
+    Lazily yields the paths of all files under root_dir that are not ignored, in a stable sorted order.
+
+    Every directory's .gitignore is compiled once and stacked on top of the rules of its parents, exactly like
+    git applies nested .gitignore files. Ignored directories (node_modules/, .venv/, ...) are pruned before
+    they are descended into, so their contents are never listed.
+
+    Args:
+        root_dir (str): Path of the project directory.
+        extra_ignore_patterns (iterable): Additional gitignore-style patterns, relative to root_dir.
+
+    Yields:
+        str: The path of each file, joined onto root_dir.
+    """
+    base_rules = IgnoreRules("", list(extra_ignore_patterns))
+    root_stack = [base_rules] if base_rules.patterns else []
+    root_rules = load_ignore_rules(root_dir, "")
+    if root_rules is not None:
+        root_stack.append(root_rules)
+
+    pending = [(root_dir, "", root_stack)]
+    while pending:
+        dir_path, rel_dir, rules_stack = pending.pop()
+        try:
+            with os.scandir(dir_path) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+
+        subdirs = []
+        for entry in entries:
+            rel_path = rel_dir + entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not is_ignored(rules_stack, rel_path + "/"):
+                        subdirs.append((entry.path, rel_path + "/"))
+                elif entry.is_file() and not is_ignored(rules_stack, rel_path):
+                    yield entry.path
+            except OSError:
+                continue
+
+        for sub_path, sub_rel in reversed(subdirs):
+            sub_rules = load_ignore_rules(sub_path, sub_rel)
+            pending.append((sub_path, sub_rel, rules_stack + [sub_rules] if sub_rules else rules_stack))
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_TTL = 7 * 24 * 3600  # One week
+
+
+def normalize_messages(messages):
+    """Normalizes line endings and trailing whitespace so formatting-only differences hit the same entry."""
+    normalized = []
+    for message in messages:
+        content = message.get("content", "")
+        if isinstance(content, str):
+            content = "\n".join(line.rstrip() for line in content.replace("\r\n", "\n").split("\n")).strip()
+        normalized.append({**message, "content": content})
+    return normalized
+
+
+class ResponseCache:
+    """
+    An exact-match cache for LLM responses with an in-process LRU layer in front of a persistent SQLite layer.
+
+    Entries are keyed by (model, normalized messages, sampling parameters) and expire after a per-model TTL.
+    Both layers are size-bounded and evict the least recently used entries first.
+
+    Args:
+        db_path (str): Path of the SQLite database file, or None for a memory-only cache.
+        memory_entries (int): Maximum number of entries of the in-process layer.
+        max_entries (int): Maximum number of entries of the on-disk layer.
+        default_ttl (float): Time-to-live of an entry in seconds, for models without an entry in model_ttls.
+        model_ttls (dict): Per-model time-to-live in seconds.
+        bypass (bool): Skip lookups (responses are still stored, so the cache is refreshed).
+
+    Attributes:
+        hits (int): Number of lookups answered from the cache.
+        misses (int): Number of lookups that had to go to the network.
+    """
+
+    def __init__(self, db_path=".cache/llm_responses.sqlite3", memory_entries=256, max_entries=10000,
+                 default_ttl=DEFAULT_TTL, model_ttls=None, bypass=False):
+        self.memory_entries = memory_entries
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.model_ttls = model_ttls or {}
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+
+        if db_path:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_access)")
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(model, messages, params):
+        payload = {"model": model, "messages": normalize_messages(messages), "params": params}
+        encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def ttl_for(self, model):
+        return self.model_ttls.get(model, self.default_ttl)
+
+    def get(self, model, messages, params):
+        """
+        Looks up a response.
+
+        Returns:
+            str | None: The cached response, or None on a miss, an expired entry or when bypassing.
+        """
+        if self.bypass:
+            return None
+
+        key = self.make_key(model, messages, params)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[1] > now:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT content, expires_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[1] > now:
+                    self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                    self._conn.commit()
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, model, messages, params, content):
+        key = self.make_key(model, messages, params)
+        now = time.time()
+        expires_at = now + self.ttl_for(model)
+        with self._lock:
+            self._remember(key, content, expires_at)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)", (key, model, content, expires_at, now)
+                )
+                self._evict(now)
+                self._conn.commit()
+
+    def _remember(self, key, content, expires_at):
+        self._memory[key] = (content, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def clear(self, model=None):
+        """Drops all cached responses, or only those of the given model."""
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                if model is None:
+                    self._conn.execute("DELETE FROM responses")
+                else:
+                    self._conn.execute("DELETE FROM responses WHERE model = ?", (model,))
+                self._conn.commit()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "memory_entries": len(self._memory)}
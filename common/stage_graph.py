@@ -0,0 +1,253 @@
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from common.artifact_store import ArtifactStore, input_key
+from common.tracing import span
+
+SUCCEEDED = "succeeded"
+REUSED = "reused"
+FAILED = "failed"
+TIMED_OUT = "timed out"
+CANCELLED = "cancelled"
+
+StageResult = namedtuple("StageResult", ["name", "status", "value", "error", "seconds"])
+
+
+class StageError(Exception):
+    """Raised for a stage that did not produce a valid result."""
+
+    def __init__(self, stage, message):
+        super().__init__(f"Stage '{stage}' {message}")
+        self.stage = stage
+
+
+class StageTimeout(StageError):
+    """Raised for a stage that exceeded its timeout."""
+
+
+class StageCancelled(StageError):
+    """Recorded for a stage that was not run because an upstream stage failed."""
+
+
+def _run_stage(name, func, kwargs):
+    """Runs a stage function inside a tracing span; module-level so process pools can pickle it."""
+    with span("stage", name):
+        return func(**kwargs)
+
+
+class Stage:
+    """
+    A unit of work in a StageGraph.
+
+    Args:
+        name (str): Unique name of the stage.
+        func (callable): The work; called with one keyword argument per entry of `inputs`.
+        inputs (dict): Maps parameter names of `func` to the names of the stages whose output they receive.
+        input_types (dict): Optional expected types of the inputs, checked against the upstream output types
+                            when the graph is validated.
+        output_type (type | tuple): Type of the value returned by `func`, checked when the stage finishes.
+        after (list): Stages that must finish first without passing their output, e.g. a warm-up.
+        timeout (float): Seconds after which the stage is considered failed; None waits forever.
+        optional (bool): A failure of an optional stage is reported but does not cancel downstream stages;
+                         inputs from it are then None.
+        key (callable): Returns the JSON-serializable inputs that do not come from other stages (project files,
+                        models, settings); hashed together with the stage inputs into the checkpoint key.
+        checkpoint (bool): Checkpoint the output; it must be JSON-serializable.
+    """
+
+    def __init__(self, name, func, inputs=None, input_types=None, output_type=object, after=(), timeout=None,
+                 optional=False, key=None, checkpoint=True):
+        self.name = name
+        self.func = func
+        self.inputs = dict(inputs or {})
+        self.input_types = dict(input_types or {})
+        self.output_type = output_type
+        self.after = tuple(after)
+        self.timeout = timeout
+        self.optional = optional
+        self.key = key
+        self.checkpoint = checkpoint
+
+    @property
+    def dependencies(self):
+        return set(self.inputs.values()) | set(self.after)
+
+
+class StageGraph:
+    """
+    A declarative graph of pipeline stages, run by a scheduler that starts every stage as soon as its
+    dependencies have finished.
+
+    Independent stages run concurrently on a thread pool (or a process pool for CPU-bound stages whose
+    functions, inputs and outputs can be pickled). When a stage fails or exceeds its timeout, every stage
+    downstream of it is cancelled instead of being started; with fail_fast all remaining stages are. Python
+    cannot interrupt a running thread, so a timed-out stage is abandoned rather than killed: its result is
+    ignored and the run does not wait for it (the interpreter still does, at exit).
+
+    Stage outputs are kept in an ArtifactStore. With a run directory the store checkpoints them, and a resumed
+    run reuses the checkpoint of every stage whose inputs are unchanged instead of running it.
+
+    Args:
+        stages (list): Initial stages.
+    """
+
+    def __init__(self, stages=()):
+        self.stages = {}
+        for stage in stages:
+            self.add(stage)
+
+    def add(self, stage):
+        if stage.name in self.stages:
+            raise ValueError(f"Duplicate stage name: {stage.name}")
+        self.stages[stage.name] = stage
+        return stage
+
+    def order(self):
+        """
+        Validates the graph and returns the stage names in a topological order.
+
+        Raises:
+            ValueError: If a dependency is unknown, the graph has a cycle or an input type does not match the
+                        output type of its upstream stage.
+        """
+        for stage in self.stages.values():
+            for dependency in stage.dependencies:
+                if dependency not in self.stages:
+                    raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dependency}'")
+            for param, expected in stage.input_types.items():
+                upstream = self.stages[stage.inputs[param]]
+                provided = upstream.output_type if isinstance(upstream.output_type, tuple) else (upstream.output_type,)
+                if not all(isinstance(t, type) and issubclass(t, expected) for t in provided):
+                    raise ValueError(
+                        f"Stage '{stage.name}' expects {expected} for '{param}', "
+                        f"but '{upstream.name}' produces {upstream.output_type}"
+                    )
+
+        ordered = []
+        remaining = {name: set(stage.dependencies) for name, stage in self.stages.items()}
+        while remaining:
+            ready = sorted(name for name, dependencies in remaining.items() if not dependencies & remaining.keys())
+            if not ready:
+                raise ValueError(f"Stage graph has a cycle between: {', '.join(sorted(remaining))}")
+            for name in ready:
+                ordered.append(name)
+                del remaining[name]
+        return ordered
+
+    def _blocked_by(self, stage, results, fail_fast):
+        for dependency in stage.dependencies:
+            result = results.get(dependency)
+            if result is not None and result.status not in (SUCCEEDED, REUSED) and not self.stages[dependency].optional:
+                return dependency
+        if fail_fast:
+            for name, result in results.items():
+                if result.status in (FAILED, TIMED_OUT) and not self.stages[name].optional:
+                    return name
+        return None
+
+    def input_key(self, stage, kwargs):
+        """Returns the checkpoint key of a stage from its inputs."""
+        return input_key(stage.name, {"inputs": kwargs, "key": stage.key() if stage.key else None})
+
+    def run(self, max_workers=None, executor="thread", fail_fast=False, raise_on_failure=True, store=None,
+            resume=False):
+        """
+        Runs all stages, each as soon as its dependencies have finished.
+
+        Args:
+            max_workers (int): Size of the pool; defaults to the number of stages, so timeouts, which count
+                               from the moment a stage is submitted, are not spent waiting for a worker.
+            executor (str): "thread" or "process".
+            fail_fast (bool): Cancel all stages that have not started yet when a required stage fails.
+            raise_on_failure (bool): Re-raise the error of the first required stage that failed.
+            store (ArtifactStore): Store of the stage outputs; an in-memory one by default.
+            resume (bool): Reuse the checkpoints of stages whose inputs are unchanged.
+
+        Returns:
+            dict: StageResult per stage name.
+        """
+        order = self.order()
+        pool_class = {"thread": ThreadPoolExecutor, "process": ProcessPoolExecutor}[executor]
+        pool = pool_class(max_workers=max_workers or max(1, len(order)))
+        store = store if store is not None else ArtifactStore()
+        results = {}
+        keys = {}
+        failures = []
+        pending = list(order)
+        running = {}
+        abandoned = False
+
+        def finish(stage, status, value=None, error=None, started=None):
+            seconds = time.perf_counter() - started if started is not None else 0.0
+            results[stage.name] = StageResult(stage.name, status, value, error, seconds)
+            if status == SUCCEEDED:
+                store.put(stage.name, value, keys.get(stage.name))
+                print(f"✅ Stage {stage.name} finished in {seconds:.2f}s")
+            elif status == REUSED:
+                print(f"♻️ Stage {stage.name} reused from the previous run")
+            elif status == CANCELLED:
+                print(f"⏭️ Stage {stage.name} cancelled: {error}")
+            else:
+                print(f"❌ Stage {stage.name} {status} after {seconds:.2f}s: {error}")
+                if not stage.optional:
+                    failures.append(error)
+
+        try:
+            while pending or running:
+                for name in list(pending):
+                    stage = self.stages[name]
+                    blocker = self._blocked_by(stage, results, fail_fast)
+                    if blocker is not None:
+                        pending.remove(name)
+                        finish(stage, CANCELLED, error=StageCancelled(name, f"was cancelled because '{blocker}' failed"))
+                    elif stage.dependencies <= results.keys():
+                        pending.remove(name)
+                        kwargs = {param: results[source].value for param, source in stage.inputs.items()}
+                        if stage.checkpoint and store.run_dir:
+                            try:
+                                keys[name] = self.input_key(stage, kwargs)
+                            except Exception as e:
+                                finish(stage, FAILED, error=e)
+                                continue
+                            if resume:
+                                found, value = store.load(name, keys[name])
+                                if found:
+                                    finish(stage, REUSED, value=value)
+                                    continue
+                        running[pool.submit(_run_stage, name, stage.func, kwargs)] = (stage, time.perf_counter())
+                if not running:
+                    continue
+
+                now = time.perf_counter()
+                deadlines = [started + stage.timeout for stage, started in running.values() if stage.timeout]
+                done, _ = wait(running, timeout=max(0.0, min(deadlines) - now) if deadlines else None,
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, started = running.pop(future)
+                    try:
+                        value = future.result()
+                    except Exception as e:
+                        finish(stage, FAILED, error=e, started=started)
+                        continue
+                    if not isinstance(value, stage.output_type):
+                        error = StageError(stage.name, f"returned {type(value).__name__}, expected {stage.output_type}")
+                        finish(stage, FAILED, error=error, started=started)
+                    else:
+                        finish(stage, SUCCEEDED, value=value, started=started)
+
+                now = time.perf_counter()
+                for future, (stage, started) in list(running.items()):
+                    if stage.timeout and now - started >= stage.timeout:
+                        del running[future]
+                        future.cancel()
+                        abandoned = True
+                        finish(stage, TIMED_OUT, error=StageTimeout(stage.name, f"timed out after {stage.timeout}s"),
+                               started=started)
+        finally:
+            # Do not wait for abandoned (timed-out) stages.
+            pool.shutdown(wait=not (running or abandoned), cancel_futures=True)
+
+        if raise_on_failure and failures:
+            raise failures[0]
+        return results
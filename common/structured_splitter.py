@@ -0,0 +1,287 @@
+import os
+import re
+from collections import namedtuple
+
+from common.tokenizer import CHARS_PER_TOKEN, count_tokens
+
+Chunk = namedtuple("Chunk", ["text", "start_line", "end_line", "title", "language"])
+Chunk.__doc__ = """
+A chunk produced by StructuredSplitter.
+
+Attributes:
+    text (str): The chunk text, an exact slice of the source.
+    start_line (int): First source line of the chunk, 1-based.
+    end_line (int): Last source line of the chunk, 1-based and inclusive.
+    title (str): Name of the first unit in the chunk, e.g. 'resource "aws_s3_bucket" "logs"', "def main()" or the
+                 Markdown heading path "Usage > Arguments".
+    language (str): The language the source was split as.
+"""
+
+LANGUAGES_BY_EXTENSION = {
+    ".tf": "hcl",
+    ".tfvars": "hcl",
+    ".hcl": "hcl",
+    ".py": "python",
+    ".js": "javascript",
+    ".jsx": "javascript",
+    ".mjs": "javascript",
+    ".cjs": "javascript",
+    ".ts": "javascript",
+    ".tsx": "javascript",
+    ".md": "markdown",
+    ".markdown": "markdown",
+    ".mdx": "markdown",
+}
+
+HCL_UNIT = re.compile(r'^[A-Za-z_][\w-]*(\s+("[^"]*"|[A-Za-z_][\w-]*))*\s*(\{|=)')
+HCL_HEREDOC = re.compile(r"<<-?\s*([A-Za-z_]\w*)\s*$")
+PYTHON_UNIT = re.compile(r"^(@|def\s|class\s|async\s+def\s)")
+JS_UNIT = re.compile(
+    r"^(export\s+)?(default\s+)?(declare\s+)?(abstract\s+)?(async\s+)?"
+    r"(function\b|class\b|const\b|let\b|var\b|interface\b|type\b|enum\b|module\.exports\b)"
+)
+MARKDOWN_HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+MARKDOWN_FENCE = re.compile(r"^\s*(```|~~~)")
+COMMENT_LINE = re.compile(r"^\s*(#|//|/\*|\*)")
+
+
+def detect_language(file_path):
+    """Returns the language used to split a file, from its extension; "text" for anything unknown."""
+    return LANGUAGES_BY_EXTENSION.get(os.path.splitext(file_path)[1].lower(), "text")
+
+
+def _brace_delta(line, quotes, comments):
+    """Counts opening minus closing braces outside of strings and line comments."""
+    delta = 0
+    quote = None
+    i = 0
+    while i < len(line):
+        char = line[i]
+        if quote:
+            if char == "\\":
+                i += 1
+            elif char == quote:
+                quote = None
+        elif char in quotes:
+            quote = char
+        elif line.startswith(comments, i):
+            break
+        elif char == "{":
+            delta += 1
+        elif char == "}":
+            delta -= 1
+        i += 1
+    return delta
+
+
+class StructuredSplitter:
+    """
+    Splits source files and documentation into chunks along their structure instead of at a character count.
+
+    The source is first cut into units that should stay together: top-level blocks of HCL (resource,
+    module, variable, ...), top-level definitions of Python and JavaScript/TypeScript (with their decorators
+    and leading comments), sections of Markdown (with the heading hierarchy as their title), and paragraphs
+    of anything else. Consecutive units are then packed into chunks of at most `max_tokens` tokens, so a
+    Terraform resource or a function is never cut in half unless it is larger than a chunk on its own; such
+    units are split at line boundaries.
+
+    Args:
+        max_tokens (int): Maximum number of tokens per chunk, counted with common.tokenizer.
+    """
+
+    def __init__(self, max_tokens=512):
+        self.max_tokens = max_tokens
+
+    def split_text(self, text, file_path=None, language=None):
+        """Splits text like split(), returning only the chunk texts (a drop-in for CharacterTextSplitter)."""
+        return [chunk.text for chunk in self.split(text, file_path=file_path, language=language)]
+
+    def split(self, text, file_path=None, language=None):
+        """
+        Splits text into structure-aware chunks.
+
+        Args:
+            text (str): The source text.
+            file_path (str): Path of the source, used to detect the language.
+            language (str): "hcl", "python", "javascript", "markdown" or "text"; overrides the detection.
+
+        Returns:
+            list: Chunk tuples, in source order.
+        """
+        language = language or (detect_language(file_path) if file_path else "text")
+        lines = text.splitlines(keepends=True)
+        units = self.units(lines, language)
+
+        chunks = []
+        pending = []
+        pending_tokens = 0
+        for unit in units:
+            start, end, _ = unit
+            tokens = count_tokens("".join(lines[start:end]))
+            if tokens > self.max_tokens:
+                chunks.extend(self._pack(lines, pending, language))
+                pending, pending_tokens = [], 0
+                chunks.extend(self._split_unit(lines, unit, language))
+                continue
+            if pending and pending_tokens + tokens > self.max_tokens:
+                chunks.extend(self._pack(lines, pending, language))
+                pending, pending_tokens = [], 0
+            pending.append(unit)
+            pending_tokens += tokens
+        chunks.extend(self._pack(lines, pending, language))
+        return chunks
+
+    def units(self, lines, language):
+        """
+        Cuts lines into structural units.
+
+        Returns:
+            list: (start, end, title) tuples with 0-based, end-exclusive line indexes; blank lines around the
+                  units are not included.
+        """
+        if language == "markdown":
+            starts = self._markdown_starts(lines)
+        elif language == "hcl":
+            starts = self._code_starts(lines, HCL_UNIT, quotes='"', comments=("#", "//"), heredocs=True)
+        elif language == "python":
+            starts = self._python_starts(lines)
+        elif language == "javascript":
+            starts = self._code_starts(lines, JS_UNIT, quotes="\"'`", comments=("//",))
+        else:
+            starts = {
+                i: None for i, line in enumerate(lines) if line.strip() and (i == 0 or not lines[i - 1].strip())
+            }
+
+        if language in ("hcl", "python", "javascript"):
+            starts = self._attach_leading_comments(lines, starts)
+
+        boundaries = sorted(set(starts) | {0})
+        units = []
+        for start, end in zip(boundaries, boundaries[1:] + [len(lines)]):
+            while start < end and not lines[start].strip():
+                start += 1
+            while end > start and not lines[end - 1].strip():
+                end -= 1
+            if start < end:
+                title = starts.get(start) or self._first_code_line(lines, start, end)
+                units.append((start, end, title))
+        return units
+
+    @staticmethod
+    def _first_code_line(lines, start, end):
+        for line in lines[start:end]:
+            stripped = line.strip()
+            if stripped and not COMMENT_LINE.match(stripped) and not stripped.startswith("@"):
+                return stripped[:80].rstrip("{ ").rstrip(":")
+        return lines[start].strip()[:80]
+
+    @staticmethod
+    def _attach_leading_comments(lines, starts):
+        """Moves each unit start up over the comment lines directly above it."""
+        attached = {}
+        for start, title in starts.items():
+            while start > 0 and lines[start - 1].strip() and COMMENT_LINE.match(lines[start - 1]) \
+                    and (start - 1) not in starts:
+                start -= 1
+            attached[start] = title
+        return attached
+
+    @staticmethod
+    def _code_starts(lines, pattern, quotes, comments, heredocs=False):
+        """Finds the lines at nesting depth 0 that start a top-level unit of a brace-delimited language."""
+        starts = {}
+        depth = 0
+        heredoc = None
+        in_block_comment = False
+        for i, line in enumerate(lines):
+            stripped = line.strip()
+            if heredoc is not None:
+                if stripped == heredoc:
+                    heredoc = None
+                continue
+            if in_block_comment:
+                in_block_comment = "*/" not in line
+                continue
+            if stripped.startswith("/*") and "*/" not in stripped:
+                in_block_comment = True
+                continue
+            if depth == 0 and line[:1].strip() and pattern.match(stripped):
+                starts[i] = None
+            depth = max(0, depth + _brace_delta(line, quotes, comments))
+            if heredocs:
+                match = HCL_HEREDOC.search(line)
+                if match:
+                    heredoc = match.group(1)
+        return starts
+
+    @staticmethod
+    def _python_starts(lines):
+        """Finds the top-level def/class lines (or the first of their decorators), outside of multi-line strings."""
+        starts = {}
+        in_string = None
+        for i, line in enumerate(lines):
+            if in_string is None and line[:1].strip() and PYTHON_UNIT.match(line):
+                if not (i > 0 and lines[i - 1].startswith("@")):
+                    starts[i] = None
+            for quote in ('"""', "'''"):
+                if line.count(quote) % 2 and in_string in (None, quote):
+                    in_string = None if in_string == quote else quote
+        return starts
+
+    @staticmethod
+    def _markdown_starts(lines):
+        """Finds the heading lines outside of code fences, titled with their heading path."""
+        starts = {}
+        path = []
+        in_fence = False
+        for i, line in enumerate(lines):
+            if MARKDOWN_FENCE.match(line):
+                in_fence = not in_fence
+                continue
+            match = None if in_fence else MARKDOWN_HEADING.match(line)
+            if match:
+                level = len(match.group(1))
+                path = [entry for entry in path if entry[0] < level] + [(level, match.group(2))]
+                starts[i] = " > ".join(heading for _, heading in path)
+        return starts
+
+    @staticmethod
+    def _pack(lines, units, language):
+        if not units:
+            return []
+        start, end = units[0][0], units[-1][1]
+        return [Chunk("".join(lines[start:end]), start + 1, end, units[0][2], language)]
+
+    def _split_unit(self, lines, unit, language):
+        """Splits a unit larger than max_tokens at line boundaries, and overlong lines at max_tokens."""
+        start, end, title = unit
+        pieces = []
+        for i in range(start, end):
+            line = lines[i]
+            if count_tokens(line) <= self.max_tokens:
+                pieces.append((i, line))
+                continue
+            # Rare: a single line (minified code, a data blob) larger than a chunk.
+            width = self.max_tokens * CHARS_PER_TOKEN
+            while count_tokens(line[:width]) > self.max_tokens and width > 1:
+                width = width * 3 // 4
+            pieces.extend((i, line[j:j + width]) for j in range(0, len(line), width))
+
+        chunks = []
+        current = []
+        current_tokens = 0
+        for line_number, piece in pieces:
+            tokens = count_tokens(piece)
+            if current and current_tokens + tokens > self.max_tokens:
+                chunks.append(current)
+                current, current_tokens = [], 0
+            current.append((line_number, piece))
+            current_tokens += tokens
+        if current:
+            chunks.append(current)
+
+        return [
+            Chunk("".join(piece for _, piece in part), part[0][0] + 1, part[-1][0] + 1,
+                  f"{title} (part {n} of {len(chunks)})", language)
+            for n, part in enumerate(chunks, start=1)
+        ]
@@ -0,0 +1,38 @@
+try:
+    import tiktoken
+except ImportError:  # tiktoken is optional, fall back to a character-based estimate
+    tiktoken = None
+
+# Average number of characters per token of BPE tokenizers on English text and source code.
+CHARS_PER_TOKEN = 4
+
+_encoding = None
+
+
+def get_encoding():
+    """Returns the shared tiktoken encoding, or None if tiktoken is not installed."""
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    return _encoding
+
+
+def count_tokens(text):
+    """Counts the tokens of a text with the cl100k_base tokenizer, or estimates them if tiktoken is missing."""
+    encoding = get_encoding()
+    if encoding is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Returns the longest prefix of text that fits in max_tokens tokens."""
+    if max_tokens <= 0:
+        return ""
+    encoding = get_encoding()
+    if encoding is None:
+        return text[: max_tokens * CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
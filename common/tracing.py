@@ -0,0 +1,250 @@
+import atexit
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+TRACE_ENV = "PIPELINE_TRACE"
+DEFAULT_TRACE_FILE = ".pipeline_trace.jsonl"
+# Counters summed per span name in the summary table, in column order.
+SUMMARY_COUNTERS = ("prompt_tokens", "completion_tokens", "bytes", "cache_hits", "cache_misses")
+
+
+class Span:
+    """
+    A timed operation: a pipeline stage or one external call (LLM request, vector query, embedding batch,
+    file I/O). Created by Tracer.span() and used as a context manager; spans opened inside another span on
+    the same thread become its children.
+
+    Args:
+        tracer (Tracer): The tracer recording the span.
+        kind (str): Category of the operation, e.g. "stage", "llm", "vector", "embedding" or "file".
+        name (str): Name of the operation, e.g. the stage or model name.
+        attrs (dict): Initial attributes.
+    """
+
+    __slots__ = ("tracer", "kind", "name", "attrs", "id", "parent", "start", "_started")
+
+    def __init__(self, tracer, kind, name, attrs):
+        self.tracer = tracer
+        self.kind = kind
+        self.name = name
+        self.attrs = attrs
+        self.id = next(tracer.ids)
+        self.parent = None
+        self.start = None
+        self._started = None
+
+    def set(self, **attrs):
+        """Sets attributes, e.g. set(cache="hit")."""
+        self.attrs.update(attrs)
+
+    def add(self, **counters):
+        """Adds to numeric attributes, e.g. add(bytes=4096, cache_hits=1)."""
+        for key, value in counters.items():
+            self.attrs[key] = self.attrs.get(key, 0) + value
+
+    def __enter__(self):
+        stack = self.tracer.stack()
+        self.parent = stack[-1].id if stack else None
+        stack.append(self)
+        self.start = time.time()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self._started
+        stack = self.tracer.stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        elif self in stack:
+            stack.remove(self)
+        self.tracer.record(self, seconds, exc_value)
+        return False
+
+
+class _NoopSpan:
+    """The span handed out while tracing is disabled; every method does nothing."""
+
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def add(self, **counters):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """
+    Records spans to a JSON-lines trace file and aggregates them for an end-of-run summary.
+
+    Each line of the trace is one finished span: {"trace", "id", "parent", "kind", "name", "start" (epoch
+    seconds), "seconds", "thread", "status", "error"} plus its attributes, such as prompt_tokens,
+    completion_tokens, bytes, cache_hits and cache_misses. The file is appended to, so several runs (or the
+    worker processes of one run) can share it; the "trace" ID tells the runs apart.
+
+    Args:
+        path (str): Path of the trace file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.trace_id = uuid.uuid4().hex[:12]
+        self.ids = itertools.count(1)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._durations = defaultdict(list)
+        self._counters = defaultdict(lambda: defaultdict(int))
+        self._errors = defaultdict(int)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def span(self, kind, name, **attrs):
+        return Span(self, kind, name, attrs)
+
+    def stack(self):
+        """Returns the stack of open spans of the calling thread."""
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def current(self):
+        """Returns the innermost open span of the calling thread, or None."""
+        stack = self.stack()
+        return stack[-1] if stack else None
+
+    def record(self, span, seconds, error=None):
+        entry = {
+            "trace": self.trace_id,
+            "id": span.id,
+            "parent": span.parent,
+            "kind": span.kind,
+            "name": span.name,
+            "start": round(span.start, 6),
+            "seconds": round(seconds, 6),
+            "thread": threading.current_thread().name,
+            "status": "error" if error is not None else "ok",
+        }
+        if error is not None:
+            entry["error"] = f"{type(error).__name__}: {error}"
+        entry.update(span.attrs)
+        line = json.dumps(entry, default=str, ensure_ascii=False)
+
+        key = (span.kind, span.name)
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line + "\n")
+            self._durations[key].append(seconds)
+            counters = self._counters[key]
+            for counter in SUMMARY_COUNTERS:
+                value = span.attrs.get(counter)
+                if isinstance(value, (int, float)):
+                    counters[counter] += value
+            if error is not None:
+                self._errors[key] += 1
+
+    def summary(self):
+        """Returns a table with the count, latency percentiles and counters of the spans, per kind and name."""
+        with self._lock:
+            keys = sorted(self._durations, key=lambda key: -sum(self._durations[key]))
+            rows = []
+            for kind, name in keys:
+                durations = sorted(self._durations[(kind, name)])
+                counters = self._counters[(kind, name)]
+                rows.append([
+                    kind, name[:40], str(len(durations)), f"{sum(durations):.2f}",
+                    f"{durations[len(durations) // 2] * 1000:.1f}",
+                    f"{durations[min(len(durations) - 1, int(len(durations) * 0.95))] * 1000:.1f}",
+                    f"{durations[-1] * 1000:.1f}",
+                    *(str(int(counters[counter])) for counter in SUMMARY_COUNTERS),
+                    str(self._errors[(kind, name)]),
+                ])
+        if not rows:
+            return "no spans recorded"
+
+        header = ["kind", "name", "count", "total s", "p50 ms", "p95 ms", "max ms", "prompt tok", "compl tok",
+                  "bytes", "hits", "misses", "errors"]
+        widths = [max(len(row[i]) for row in rows + [header]) for i in range(len(header))]
+        lines = ["  ".join(cell.ljust(width) if i < 2 else cell.rjust(width)
+                           for i, (cell, width) in enumerate(zip(row, widths)))
+                 for row in [header] + rows]
+        lines.insert(1, "-" * len(lines[0]))
+        return "\n".join(lines)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_tracer = None
+_tracer_configured = False
+_tracer_lock = threading.Lock()
+
+
+def get_tracer():
+    """
+    Returns the process-wide Tracer, or None if tracing is disabled.
+
+    Tracing is enabled by the PIPELINE_TRACE environment variable: a path of the trace file, or "1" for
+    .pipeline_trace.jsonl in the working directory.
+    """
+    global _tracer, _tracer_configured
+    if not _tracer_configured:
+        with _tracer_lock:
+            if not _tracer_configured:
+                path = os.getenv(TRACE_ENV)
+                if path and path.lower() not in ("0", "false", "no"):
+                    _tracer = Tracer(DEFAULT_TRACE_FILE if path.lower() in ("1", "true", "yes") else path)
+                    atexit.register(_tracer.close)
+                _tracer_configured = True
+    return _tracer
+
+
+def span(kind, name, **attrs):
+    """
+    Opens a span on the process-wide tracer; returns a no-op span when tracing is disabled.
+
+    Usage:
+        with span("llm", model, provider="openrouter") as s:
+            ...
+            s.set(prompt_tokens=usage["prompt_tokens"])
+    """
+    tracer = get_tracer()
+    if tracer is None:
+        return NOOP_SPAN
+    return tracer.span(kind, name, **attrs)
+
+
+def annotate(**counters):
+    """Adds counters (e.g. cache_hits=3) to the innermost open span of the calling thread, if tracing is enabled."""
+    tracer = get_tracer()
+    if tracer is not None:
+        current = tracer.current()
+        if current is not None:
+            current.add(**counters)
+
+
+def print_summary():
+    """Prints the span summary table at the end of a run, if tracing is enabled."""
+    tracer = get_tracer()
+    if tracer is not None:
+        print(f"📊 Trace summary (spans in {tracer.path}):")
+        print(tracer.summary())
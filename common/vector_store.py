@@ -0,0 +1,386 @@
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from common.cassette import cassette_call, replaying
+
+PINECONE_INDEX_NAME = "terraform-docs"
+EMBEDDING_DIMENSION = 384
+
+
+class VectorStore(ABC):
+    """
+    The vector index operations used by the crawler and the Terraform agent.
+
+    Vectors are passed as {"id": str, "values": list, "metadata": dict} dicts and queries return
+    {"matches": [{"id", "score", "metadata"}]}, the same shapes as the Pinecone client, so backends can be
+    swapped without touching the callers.
+    """
+
+    @abstractmethod
+    def upsert(self, vectors):
+        """Inserts or replaces vectors."""
+
+    @abstractmethod
+    def query(self, vector, top_k=5, include_metadata=True):
+        """Returns the top_k vectors closest to `vector`, best first."""
+
+    @abstractmethod
+    def delete(self, ids):
+        """Deletes the vectors with the given ids; unknown ids are ignored."""
+
+    def save(self):
+        """Persists pending changes; a no-op for backends that persist on every call."""
+
+
+class PineconeVectorStore(VectorStore):
+    """
+    A VectorStore backed by a Pinecone serverless index.
+
+    Args:
+        api_key (str): The API key to authenticate with Pinecone service.
+        index_name (str): Name of the Pinecone index.
+        dimension (int): Dimension of the vectors, used when the index has to be created.
+        create (bool): Create the index if it does not exist yet.
+    """
+
+    def __init__(self, api_key, index_name=PINECONE_INDEX_NAME, dimension=EMBEDDING_DIMENSION, create=False):
+        if replaying():
+            # Every call is answered from the cassette, so there is no index to connect to.
+            self.index = None
+            return
+        from pinecone import Pinecone, ServerlessSpec
+
+        pc = Pinecone(api_key=api_key)
+        if create and index_name not in pc.list_indexes().names():
+            print("Creating Pinecone index...")
+            pc.create_index(
+                name=index_name,
+                dimension=dimension,
+                metric="cosine",
+                spec=ServerlessSpec(cloud="aws", region="us-east-1")
+            )
+        self.index = pc.Index(index_name)
+
+    def upsert(self, vectors):
+        def upsert():
+            self.index.upsert(vectors=vectors)
+
+        cassette_call("pinecone", {"op": "upsert", "ids": [vector["id"] for vector in vectors]}, upsert)
+
+    def query(self, vector, top_k=5, include_metadata=True):
+        # Cassettes match queries on the vector rounded to 4 decimals, so that float noise between machines
+        # computing the same embedding does not turn a replayed query into a miss.
+        request = {"op": "query", "vector": [round(float(value), 4) for value in vector], "top_k": top_k,
+                   "include_metadata": include_metadata}
+        return cassette_call("pinecone", request, lambda: _query_response_dict(
+            self.index.query(vector=vector, top_k=top_k, include_metadata=include_metadata)))
+
+    def delete(self, ids):
+        def delete():
+            self.index.delete(ids=list(ids))
+
+        if ids:
+            cassette_call("pinecone", {"op": "delete", "ids": list(ids)}, delete)
+
+
+def _query_response_dict(response):
+    """Converts a Pinecone query response to the plain {"matches": [{"id", "score", "metadata"}]} dict."""
+    return {"matches": [
+        {"id": match["id"], "score": match["score"], "metadata": dict(match.get("metadata") or {})}
+        for match in response["matches"]
+    ]}
+
+
+class LocalVectorStore(VectorStore):
+    """
+    An on-disk VectorStore for offline use, e.g. air-gapped CI.
+
+    Embeddings are kept L2-normalized in a float32 matrix (vectors.npy) that is memory-mapped when opened,
+    with ids and metadata in a side table (records.json) whose order matches the matrix rows. Top-k cosine
+    queries are a single matrix-vector product. In approximate mode an inverted-file (IVF) index partitions
+    the rows around k-means centroids and only the n_probe closest partitions are scanned.
+
+    Changes are applied in memory and written by save(). The memory-mapped rows are never copied: new rows go
+    to an in-memory buffer that grows geometrically, updated rows are kept as overrides and deleted rows as
+    tombstones until save() writes the compacted matrix.
+
+    Args:
+        directory (str): Directory holding the index files; created on save() if needed.
+        approximate (bool): Use the IVF index for queries once the store has at least min_ivf_rows rows.
+        n_lists (int): Number of IVF partitions; defaults to about sqrt(number of rows).
+        n_probe (int): Number of IVF partitions scanned per query.
+        min_ivf_rows (int): Below this size exact search is used even in approximate mode.
+    """
+
+    def __init__(self, directory, approximate=False, n_lists=None, n_probe=8, min_ivf_rows=10000):
+        self.directory = directory
+        self.approximate = approximate
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.min_ivf_rows = min_ivf_rows
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._load()
+
+    @property
+    def vectors_path(self):
+        return os.path.join(self.directory, "vectors.npy")
+
+    @property
+    def records_path(self):
+        return os.path.join(self.directory, "records.json")
+
+    @property
+    def ivf_path(self):
+        return os.path.join(self.directory, "ivf.npz")
+
+    def __len__(self):
+        return len(self._row_of)
+
+    def _load(self):
+        # Rows 0..len(_base)-1 are the memory-mapped matrix, the following ones the first _tail_rows of _tail.
+        self._base = None
+        self._tail = None
+        self._tail_rows = 0
+        self._patches = {}
+        self._deleted = set()
+        self._ids = []
+        self._metadata = []
+        self._row_of = {}
+        self._ivf = None
+        if not os.path.exists(self.vectors_path):
+            return
+        with open(self.records_path, "r", encoding="utf-8") as f:
+            records = json.load(f)
+        self._base = np.load(self.vectors_path, mmap_mode="r")
+        self._ids = records["ids"]
+        self._metadata = records["metadata"]
+        self._row_of = {vector_id: row for row, vector_id in enumerate(self._ids)}
+        if self.approximate and os.path.exists(self.ivf_path):
+            with np.load(self.ivf_path) as ivf:
+                self._ivf = (ivf["centroids"], ivf["order"], ivf["offsets"])
+
+    @staticmethod
+    def _normalize(matrix):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+    @property
+    def _base_rows(self):
+        return 0 if self._base is None else len(self._base)
+
+    def _dimension(self):
+        if self._base is not None:
+            return self._base.shape[1]
+        if self._tail is not None:
+            return self._tail.shape[1]
+        return None
+
+    def _append(self, value):
+        """Appends a row to the in-memory buffer, doubling its capacity when it is full."""
+        if self._tail is None:
+            self._tail = np.empty((64, len(value)), dtype=np.float32)
+        elif self._tail_rows == len(self._tail):
+            grown = np.empty((2 * len(self._tail), self._tail.shape[1]), dtype=np.float32)
+            grown[:self._tail_rows] = self._tail[:self._tail_rows]
+            self._tail = grown
+        self._tail[self._tail_rows] = value
+        self._tail_rows += 1
+
+    def _live_rows(self):
+        """Returns the row numbers of the vectors that are not deleted, in order."""
+        rows = np.arange(self._base_rows + self._tail_rows)
+        if self._deleted:
+            rows = rows[~np.isin(rows, np.fromiter(self._deleted, dtype=np.int64))]
+        return rows
+
+    def _row_vectors(self, rows):
+        """Returns the current vectors of the given rows, with the in-memory updates applied."""
+        rows = np.asarray(rows, dtype=np.int64)
+        out = np.empty((len(rows), self._dimension()), dtype=np.float32)
+        in_base = rows < self._base_rows
+        if in_base.any():
+            out[in_base] = self._base[rows[in_base]]
+        if not in_base.all():
+            out[~in_base] = self._tail[rows[~in_base] - self._base_rows]
+        if self._patches:
+            for i in np.flatnonzero(in_base):
+                patch = self._patches.get(int(rows[i]))
+                if patch is not None:
+                    out[i] = patch
+        return out
+
+    def _changed(self):
+        self._ivf = None
+        self._dirty = True
+
+    def upsert(self, vectors):
+        if not vectors:
+            return
+        values = self._normalize([vector["values"] for vector in vectors])
+
+        with self._lock:
+            dimension = self._dimension()
+            if dimension is not None and values.shape[1] != dimension:
+                raise ValueError(f"Expected vectors of dimension {dimension}, got {values.shape[1]}")
+            self._changed()
+
+            for vector, value in zip(vectors, values):
+                row = self._row_of.get(vector["id"])
+                if row is None:
+                    self._row_of[vector["id"]] = len(self._ids)
+                    self._ids.append(vector["id"])
+                    self._metadata.append(vector.get("metadata", {}))
+                    self._append(value)
+                    continue
+                if row < self._base_rows:
+                    self._patches[row] = value
+                else:
+                    self._tail[row - self._base_rows] = value
+                self._metadata[row] = vector.get("metadata", {})
+
+    def delete(self, ids):
+        with self._lock:
+            rows = [self._row_of.pop(vector_id) for vector_id in set(ids) if vector_id in self._row_of]
+            if not rows:
+                return
+            self._changed()
+            for row in rows:
+                self._deleted.add(row)
+                self._patches.pop(row, None)
+                self._metadata[row] = None
+
+    def query(self, vector, top_k=5, include_metadata=True):
+        with self._lock:
+            if not self._row_of:
+                return {"matches": []}
+
+            query = self._normalize(vector)
+            rows = self._ivf_candidates(query)
+            if rows is not None and len(rows):
+                scores = self._row_vectors(rows) @ query
+            else:
+                # Exact scan, also used when the probed IVF partitions hold no live rows.
+                rows = self._live_rows()
+                scores = np.empty(self._base_rows + self._tail_rows, dtype=np.float32)
+                if self._base_rows:
+                    scores[:self._base_rows] = self._base @ query
+                if self._tail_rows:
+                    scores[self._base_rows:] = self._tail[:self._tail_rows] @ query
+                for row, patch in self._patches.items():
+                    scores[row] = patch @ query
+                scores = scores[rows]
+
+            k = min(top_k, len(scores))
+            if k <= 0:
+                return {"matches": []}
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best], kind="stable")]
+
+            matches = []
+            for i in best:
+                match = {"id": self._ids[rows[i]], "score": float(scores[i])}
+                if include_metadata:
+                    match["metadata"] = self._metadata[rows[i]]
+                matches.append(match)
+            return {"matches": matches}
+
+    def _ivf_candidates(self, query):
+        if not self.approximate or len(self._row_of) < self.min_ivf_rows:
+            return None
+        if self._ivf is None:
+            self._ivf = self._build_ivf()
+        centroids, order, offsets = self._ivf
+        n_probe = min(self.n_probe, len(centroids))
+        probe = np.argpartition(-(centroids @ query), n_probe - 1)[:n_probe]
+        return np.concatenate([order[offsets[p]:offsets[p + 1]] for p in probe])
+
+    def _build_ivf(self, iterations=10, sample_size=65536, seed=0):
+        """Clusters the live rows with spherical k-means and groups the row numbers by partition."""
+        live = self._live_rows()
+        n_lists = self.n_lists or max(1, int(np.sqrt(len(live))))
+        rng = np.random.default_rng(seed)
+        sample = self._row_vectors(np.sort(rng.choice(live, size=min(sample_size, len(live)), replace=False)))
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)]
+
+        for _ in range(iterations):
+            assignments = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(n_lists):
+                members = sample[assignments == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = self._normalize(centroids)
+
+        assignments = np.concatenate(
+            [np.argmax(self._row_vectors(live[i:i + 65536]) @ centroids.T, axis=1)
+             for i in range(0, len(live), 65536)]
+        )
+        order = live[np.argsort(assignments, kind="stable")]
+        offsets = np.searchsorted(np.sort(assignments, kind="stable"), np.arange(n_lists + 1))
+        return centroids, order, offsets
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+
+            # Written in blocks straight from the memory-mapped rows, so the matrix is never fully in memory.
+            live = self._live_rows()
+            tmp_vectors = self.vectors_path + ".tmp.npy"
+            out = np.lib.format.open_memmap(tmp_vectors, mode="w+", dtype=np.float32,
+                                            shape=(len(live), self._dimension()))
+            for i in range(0, len(live), 65536):
+                out[i:i + 65536] = self._row_vectors(live[i:i + 65536])
+            out.flush()
+            del out
+            ids = [self._ids[row] for row in live]
+            metadata = [self._metadata[row] for row in live]
+            ivf = self._ivf
+            if ivf is not None and self._deleted:
+                # Row numbers shift with the compaction; renumber the partitions' rows.
+                ivf = (ivf[0], np.searchsorted(live, ivf[1]), ivf[2])
+            self._base = None
+            os.replace(tmp_vectors, self.vectors_path)
+
+            tmp_records = self.records_path + ".tmp"
+            with open(tmp_records, "w", encoding="utf-8") as f:
+                json.dump({"ids": ids, "metadata": metadata}, f)
+            os.replace(tmp_records, self.records_path)
+
+            if self.approximate and len(ids) >= self.min_ivf_rows:
+                self._load()
+                centroids, order, offsets = ivf or self._build_ivf()
+                tmp_ivf = self.ivf_path + ".tmp.npz"
+                np.savez(tmp_ivf, centroids=centroids, order=order, offsets=offsets)
+                os.replace(tmp_ivf, self.ivf_path)
+            elif os.path.exists(self.ivf_path):
+                os.remove(self.ivf_path)
+
+            self._dirty = False
+            self._load()
+
+
+def create_vector_store(backend=None, **kwargs):
+    """
+    Creates the vector store selected by the VECTOR_STORE_BACKEND environment variable ("pinecone" or "local").
+
+    The local backend lives in LOCAL_VECTOR_STORE_DIR (default ".vector_store") and uses the approximate IVF
+    mode when LOCAL_VECTOR_STORE_APPROXIMATE is set; the Pinecone backend uses PINECONE_API_KEY and
+    PINECONE_INDEX. Keyword arguments are passed on to the backend's constructor.
+    """
+    backend = backend or os.getenv("VECTOR_STORE_BACKEND", "pinecone")
+    if backend == "local":
+        kwargs.setdefault("directory", os.getenv("LOCAL_VECTOR_STORE_DIR", ".vector_store"))
+        kwargs.setdefault("approximate", bool(os.getenv("LOCAL_VECTOR_STORE_APPROXIMATE")))
+        return LocalVectorStore(**kwargs)
+    if backend == "pinecone":
+        kwargs.setdefault("api_key", os.getenv("PINECONE_API_KEY"))
+        kwargs.setdefault("index_name", os.getenv("PINECONE_INDEX") or PINECONE_INDEX_NAME)
+        return PineconeVectorStore(**kwargs)
+    raise ValueError(f"Unknown vector store backend: {backend}")
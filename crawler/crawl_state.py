@@ -0,0 +1,119 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+PageState = namedtuple("PageState", ["etag", "last_modified", "content_hash", "chunk_ids", "crawled_at"])
+
+
+class CrawlState:
+    """
+    A persistent record of what the DocsCrawler indexed for every URL, used to re-crawl incrementally.
+
+    For each page it stores the HTTP validators of the last fetch (ETag and Last-Modified), a hash of the
+    scraped content and the IDs of the chunks that were indexed. A re-crawl sends the validators as a
+    conditional request and skips pages the server reports as unchanged (304) or whose content hash did not
+    change; for changed pages only new chunks are embedded and the vectors of vanished chunks are deleted.
+
+    It also records the fingerprints of the chunks each page indexed, so the boilerplate dedup of a re-crawl
+    knows the chunks of the pages it skips.
+
+    Args:
+        db_path (str): Path of the SQLite database file. Parent directories are created if needed.
+    """
+
+    def __init__(self, db_path=".cache/crawl_state.sqlite3"):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                content_hash TEXT NOT NULL,
+                chunk_ids TEXT NOT NULL,
+                crawled_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints (fingerprint TEXT PRIMARY KEY, url TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS fingerprints_url ON fingerprints (url)")
+        self._conn.commit()
+
+    def get(self, url):
+        """
+        Looks up the state of a page.
+
+        Returns:
+            PageState | None: The state recorded by the last successful crawl, or None for a new page.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, content_hash, chunk_ids, crawled_at FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, content_hash, chunk_ids, crawled_at = row
+        return PageState(etag, last_modified, content_hash, json.loads(chunk_ids), crawled_at)
+
+    def update(self, pages):
+        """
+        Records the state of crawled pages in one transaction.
+
+        Args:
+            pages (dict): Maps URLs to (etag, last_modified, content_hash, chunk_ids, fingerprints) tuples, where
+                          fingerprints are those of the chunks the page indexed, or None to keep the recorded ones.
+        """
+        now = time.time()
+        rows = [
+            (url, etag, last_modified, content_hash, json.dumps(sorted(chunk_ids)), now)
+            for url, (etag, last_modified, content_hash, chunk_ids, _) in pages.items()
+        ]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)", rows)
+            for url, (*_, fingerprints) in pages.items():
+                if fingerprints is None:
+                    continue
+                self._conn.execute("DELETE FROM fingerprints WHERE url = ?", (url,))
+                self._conn.executemany("INSERT OR IGNORE INTO fingerprints VALUES (?, ?)",
+                                       [(fingerprint, url) for fingerprint in fingerprints])
+            self._conn.commit()
+
+    def fingerprints(self):
+        """
+        Returns the chunk fingerprints recorded by previous crawls.
+
+        Returns:
+            dict: Maps each fingerprint to the URL of the page that indexed it.
+        """
+        with self._lock:
+            return dict(self._conn.execute("SELECT fingerprint, url FROM fingerprints"))
+
+    def touch(self, urls):
+        """Marks pages that were found unchanged as crawled now."""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany("UPDATE pages SET crawled_at = ? WHERE url = ?", [(now, url) for url in urls])
+            self._conn.commit()
+
+    def clear(self):
+        """Forgets all pages, so the next crawl is a full crawl."""
+        with self._lock:
+            self._conn.execute("DELETE FROM pages")
+            self._conn.execute("DELETE FROM fingerprints")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,34 +1,67 @@
+import asyncio
+import hashlib
 import os
+import queue
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 
+import requests
 from dotenv import load_dotenv
 from phi.tools.crawl4ai_tools import Crawl4aiTools
-from langchain.text_splitter import CharacterTextSplitter
 from sentence_transformers import SentenceTransformer
-from pinecone import Pinecone, ServerlessSpec
+
+# Add the root directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from common.bm25_index import create_keyword_index
+from common.cassette import cassette_call
+from common.embedding_cache import get_embedding_cache
+from common.structured_splitter import StructuredSplitter
+from common.tracing import span
+from common.vector_store import PineconeVectorStore
+from crawler.crawl_state import CrawlState
+from crawler.embedding_batcher import EmbeddingBatcher
 
 
 class DocsCrawler:
     """
-    A class for scraping, processing, and indexing documentation in Pinecone.
+    A class for scraping, processing, and indexing documentation in a vector store (Pinecone by default).
 
     This class scrapes documentation from a list of URLs, splits the content into chunks, generates embeddings
-    using a specified model, and stores the embeddings in a Pinecone index.
+    using a specified model, and stores the embeddings in a vector store.
 
     Args:
         pinecone_api_key (str): The API key to authenticate with Pinecone service.
         doc_urls (list): A list of URLs from which documentation or content will be scraped.
         embedding_model (str): The name of the pre-trained embedding model to use for generating embeddings
                                 for the scraped documents.
+        vector_store (VectorStore): Optional vector store to index into, e.g. a LocalVectorStore for offline use.
+                                    Defaults to the "terraform-docs" Pinecone index.
+        crawl_state (CrawlState): Optional record of previous crawls. When given, re-crawls are incremental:
+                                  unchanged pages are skipped and only changed chunks are re-embedded.
+        embedding_cache (EmbeddingCache): Cache of chunk embeddings; defaults to the shared cache (see
+                                          get_embedding_cache()).
+        keyword_index (BM25Index): Keyword index kept in sync with the vector store, used for hybrid retrieval.
+                                   Defaults to the local index in BM25_INDEX_DIR. Pages skipped by an
+                                   incremental crawl are not re-added, so build a new index with a full crawl.
 
     Attributes:
         pinecone_api_key (str): The API key to authenticate with Pinecone service.
         doc_urls (list): A list of URLs for scraping documentation.
         scraper (Crawl4aiTools): Instance of Crawl4aiTools used for scraping content from URLs.
-        text_splitter (CharacterTextSplitter): Instance of CharacterTextSplitter used for splitting the scraped text into smaller chunks.
+        text_splitter (StructuredSplitter): Instance of StructuredSplitter used for splitting the scraped Markdown into chunks along its sections.
         model (SentenceTransformer): Instance of SentenceTransformer used for generating embeddings from the split text.
+        vector_store (VectorStore): The vector store the embeddings are written to.
     """
 
-    def __init__(self, pinecone_api_key, doc_urls, embedding_model):
+    def __init__(self, pinecone_api_key, doc_urls, embedding_model, vector_store=None, upsert_batch_size=100,
+                 upsert_workers=1, min_chunk_chars=40, embed_batch_size=256, multi_process_embedding=False,
+                 crawl_state=None, embedding_cache=None, keyword_index=None, chunk_tokens=256):
         """
         Initializes the DocsCrawler class with the given configuration.
 
@@ -37,12 +70,49 @@ class DocsCrawler:
             doc_urls (list): A list of URLs from which documentation or content will be scraped.
             embedding_model (str): The name of the pre-trained embedding model to use for generating embeddings
                                     for the scraped documents.
+            vector_store (VectorStore): Optional vector store to index into. Defaults to the "terraform-docs"
+                                        Pinecone index.
+            upsert_batch_size (int): Maximum number of vectors sent to the vector store per upsert request.
+            upsert_workers (int): Number of upsert requests sent in parallel.
+            min_chunk_chars (int): Chunks with fewer non-whitespace characters are not indexed.
+            embed_batch_size (int): Number of chunks, collected across pages, embedded per batch.
+            multi_process_embedding (bool): Embed with a multi-process pool using all CPU cores.
+            crawl_state (CrawlState): Optional record of previous crawls, enabling incremental re-crawls.
+            embedding_cache (EmbeddingCache): Cache of chunk embeddings; defaults to the shared cache.
+            keyword_index (BM25Index): Keyword index kept in sync with the vector store. Defaults to the local
+                                       index in BM25_INDEX_DIR.
+            chunk_tokens (int): Maximum size of a chunk in tokens.
         """
         self.pinecone_api_key = pinecone_api_key
         self.doc_urls = doc_urls
         self.scraper = Crawl4aiTools(max_length=None)
-        self.text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
+        # all-MiniLM-L6-v2 truncates its input at 256 word pieces, so larger chunks would only be embedded in part.
+        self.text_splitter = StructuredSplitter(max_tokens=chunk_tokens)
+        self.embedding_model = embedding_model
         self.model = SentenceTransformer(embedding_model)
+        self.embedding_cache = embedding_cache if embedding_cache is not None else get_embedding_cache()
+        if vector_store is None:
+            vector_store = PineconeVectorStore(
+                pinecone_api_key, dimension=self.model.get_sentence_embedding_dimension(), create=True
+            )
+        self.vector_store = vector_store
+        self.keyword_index = keyword_index if keyword_index is not None else create_keyword_index()
+        self.upsert_batch_size = upsert_batch_size
+        self.upsert_workers = upsert_workers
+        self.min_chunk_chars = min_chunk_chars
+        self.embed_batch_size = embed_batch_size
+        self.multi_process_embedding = multi_process_embedding
+        # Maps the fingerprint of every indexed chunk to the page that indexed it, used to skip boilerplate
+        # repeated across pages. With a crawl state it also holds the fingerprints of previous crawls.
+        self.seen_fingerprints = {}
+        self._page_fingerprints = {}
+        self.skipped_chunks = 0
+        self._dedup_lock = threading.Lock()
+        self.crawl_state = crawl_state
+        # Page states to record once the crawl has been indexed successfully, and pages found unchanged.
+        self._changed_pages = {}
+        self._unchanged_pages = []
+        self._stale_vectors = 0
 
     def __fetch_docs(self, url):
         """
@@ -60,76 +130,370 @@ class DocsCrawler:
             ValueError: If no content is retrieved from the URL.
         """
         print(f"Scraping {url} ...")
-        content = self.scraper.web_crawler(url)
+        with span("http", "crawl4ai", url=url) as s:
+            content = cassette_call("crawl4ai", {"url": url}, lambda: self.scraper.web_crawler(url))
+            s.set(bytes=len(content.encode("utf-8")))
 
         if not content.strip():
             raise ValueError(f"Failed to retrieve content from {url}.")
         return content
 
-    def __process_docs(self, content):
+    def __check_validators(self, url, previous):
+        """
+        WARNING: Internal method, do not call directly.
+
+        This method sends a conditional request for the page with the validators of the previous crawl.
+
+        Args:
+            url (str): The URL of the page.
+            previous (PageState): The state of the page recorded by the previous crawl, or None.
+
+        Returns:
+            tuple: (unchanged, etag, last_modified), where unchanged is True if the server answered 304.
+        """
+        headers = {}
+        if previous is not None and previous.etag:
+            headers["If-None-Match"] = previous.etag
+        if previous is not None and previous.last_modified:
+            headers["If-Modified-Since"] = previous.last_modified
+
+        def head():
+            # Only the status and headers are needed; the body is scraped by Crawl4ai.
+            with requests.get(url, headers=headers, stream=True, timeout=(10, 30)) as response:
+                return response.status_code, response.headers.get("ETag"), response.headers.get("Last-Modified")
+
+        try:
+            status, etag, last_modified = cassette_call("http", {"url": url, "headers": headers}, head,
+                                                        errors=(requests.RequestException,))
+        except requests.RequestException:
+            return False, None, None
+        if status == 304 and previous is not None:
+            return True, previous.etag, previous.last_modified
+        return False, etag, last_modified
+
+    def __fetch_page(self, url):
+        """
+        WARNING: Internal method, do not call directly.
+
+        This method scrapes a page, unless a crawl state is used and the server reports the page as unchanged.
+
+        Args:
+            url (str): The URL to scrape the documentation from.
+
+        Returns:
+            tuple | None: (content, (etag, last_modified)), or None if the page is unchanged.
+        """
+        previous = self.crawl_state.get(url) if self.crawl_state is not None else None
+        if previous is None:
+            # A new page has no validators to send, so a conditional request could only duplicate the scrape.
+            return self.__fetch_docs(url), (None, None)
+
+        unchanged, etag, last_modified = self.__check_validators(url, previous)
+        if unchanged:
+            with self._dedup_lock:
+                self._unchanged_pages.append(url)
+            return None
+        return self.__fetch_docs(url), (etag, last_modified)
+
+    def __changed_chunks(self, url, content, validators):
         """
         WARNING: Internal method, do not call directly.
 
-        This method splits the scraped content into smaller chunks and generates embeddings for each chunk.
+        This method splits a fetched page into chunks and, when a crawl state is used, compares them with the
+        chunks indexed by the previous crawl: the vectors of chunks that disappeared are deleted and only new
+        chunks are returned for embedding.
 
         Args:
+            url (str): The URL the content was scraped from.
             content (str): The content of the scraped documentation.
+            validators (tuple): (etag, last_modified) of the response.
 
         Returns:
-            tuple: A tuple containing two elements:
-                - documents (list): The split document chunks.
-                - embeddings (list): The embeddings generated for each document chunk.
+            list: The document chunks that have to be embedded and upserted.
         """
-        documents = self.text_splitter.split_text(content)
-        embeddings = self.model.encode(documents)
-        return documents, embeddings
+        if self.crawl_state is None:
+            return self.__split_docs(url, content)
+
+        content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        previous = self.crawl_state.get(url)
+        if previous is not None and previous.content_hash == content_hash:
+            self._changed_pages[url] = (*validators, content_hash, previous.chunk_ids, None)
+            with self._dedup_lock:
+                self._unchanged_pages.append(url)
+            return []
 
-    def __store_in_pinecone(self, documents, embeddings):
+        documents = {self.chunk_id(url, chunk): chunk for chunk in self.__split_docs(url, content)}
+        previous_ids = set(previous.chunk_ids) if previous is not None else set()
+        stale_ids = previous_ids - documents.keys()
+        if stale_ids:
+            self.vector_store.delete(list(stale_ids))
+            self.keyword_index.delete(stale_ids)
+            self._stale_vectors += len(stale_ids)
+        with self._dedup_lock:
+            fingerprints = self._page_fingerprints.pop(url, set())
+        self._changed_pages[url] = (*validators, content_hash, list(documents), fingerprints)
+        return [chunk for chunk_id, chunk in documents.items() if chunk_id not in previous_ids]
+
+    @staticmethod
+    def chunk_id(url, chunk):
+        """Returns a deterministic vector ID for a chunk of a page, derived from the URL and the chunk's content."""
+        chunk_hash = hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+        return hashlib.sha256(f"{url}\n{chunk_hash}".encode("utf-8")).hexdigest()[:32]
+
+    @staticmethod
+    def fingerprint(chunk):
+        """Returns a fingerprint that is equal for chunks differing only in case, whitespace or numbers."""
+        normalized = " ".join(re.sub(r"\d+", "0", chunk.lower()).split())
+        return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+    def __split_docs(self, url, content):
         """
         WARNING: Internal method, do not call directly.
 
-        This method stores the embeddings of the documents in a Pinecone index.
+        This method splits the scraped content into smaller chunks and drops near-duplicate boilerplate chunks
+        (navigation bars, footers, ... repeated on every page).
 
         Args:
-            documents (list): A list of document chunks.
-            embeddings (list): A list of embeddings corresponding to the document chunks.
+            url (str): The URL the content was scraped from.
+            content (str): The content of the scraped documentation.
+
+        Returns:
+            list: The document chunks worth indexing.
         """
-        pc = Pinecone(api_key=self.pinecone_api_key)
-        index_name = "terraform-docs"
-
-        # Create index if it doesn't exist
-        if index_name not in pc.list_indexes():
-            print("Creating Pinecone index...")
-            pc.create_index(
-                name=index_name,
-                dimension=384,
-                metric="cosine",
-                spec=ServerlessSpec(cloud="aws", region="us-east-1")
-            )
+        documents = []
+        page_fingerprints = set()
+        for chunk in self.text_splitter.split_text(content, language="markdown"):
+            fingerprint = self.fingerprint(chunk)
+            with self._dedup_lock:
+                # A chunk the page itself indexed in a previous crawl is not boilerplate from another page.
+                owner = self.seen_fingerprints.get(fingerprint, url)
+                if (len("".join(chunk.split())) < self.min_chunk_chars or owner != url
+                        or fingerprint in page_fingerprints):
+                    self.skipped_chunks += 1
+                    continue
+                self.seen_fingerprints[fingerprint] = url
+            page_fingerprints.add(fingerprint)
+            documents.append(chunk)
+        if self.crawl_state is not None:
+            with self._dedup_lock:
+                self._page_fingerprints[url] = page_fingerprints
+        return documents
 
-        # Connect to Pinecone index
-        index = pc.Index(index_name)
+    def __store_vectors(self, url, documents, embeddings):
+        """
+        WARNING: Internal method, do not call directly.
 
+        This method stores the embeddings of the documents in the vector store, in batches of at most
+        `upsert_batch_size` vectors, sent by `upsert_workers` parallel requests.
+
+        Args:
+            url (str): The URL the documents were scraped from.
+            documents (list): A list of document chunks.
+            embeddings (list): A list of embeddings corresponding to the document chunks.
+        """
         # Prepare and upsert data
         upsert_data = [
-            {"id": str(i), "values": embeddings[i].tolist(), "metadata": {"text": documents[i]}}
+            {
+                "id": self.chunk_id(url, documents[i]),
+                "values": embeddings[i].tolist(),
+                "metadata": {"text": documents[i], "url": url},
+            }
             for i in range(len(embeddings))
         ]
-        index.upsert(vectors=upsert_data)
-        print("Documents indexed successfully!")
+        batches = [
+            upsert_data[i:i + self.upsert_batch_size] for i in range(0, len(upsert_data), self.upsert_batch_size)
+        ]
 
-    def crawl_and_index(self):
+        with span("vector", "upsert", vectors=len(upsert_data), batches=len(batches)):
+            if self.upsert_workers > 1 and len(batches) > 1:
+                with ThreadPoolExecutor(max_workers=self.upsert_workers) as executor:
+                    list(executor.map(self.vector_store.upsert, batches))
+            else:
+                for batch in batches:
+                    self.vector_store.upsert(batch)
+        self.keyword_index.upsert(upsert_data)
+        print(f"Indexed {len(upsert_data)} chunks from {url} in {len(batches)} batches.")
+
+    def crawl_and_index(self, pipelined=False, fetch_concurrency=8, per_host_concurrency=2, per_host_delay=0.5,
+                        queue_size=16):
         """
-        Scrapes documentation from multiple URLs, processes the content into embeddings, and stores them in Pinecone.
+        Scrapes documentation from multiple URLs, processes the content into embeddings, and stores them in the vector store.
 
         This method loops through the provided `doc_urls`, scrapes each URL, processes the content into document chunks,
-        generates embeddings, and stores them in a Pinecone index.
+        generates embeddings, and stores them in the vector store. Chunks are embedded in batches of
+        `embed_batch_size` collected across pages, see EmbeddingBatcher. With a crawl state the crawl is
+        incremental: pages the server reports as unchanged (or whose content hash is unchanged) are skipped, only
+        new chunks of changed pages are embedded and the vectors of chunks that disappeared are deleted.
+
+        In pipelined mode fetching, embedding and upserting overlap: an asyncio fetch stage scrapes up to
+        `fetch_concurrency` URLs at a time (at most `per_host_concurrency` per host, starting requests to the same host
+        at least `per_host_delay` seconds apart), an embedding stage processes the fetched pages and a background
+        stage upserts the vectors. The stages are connected by queues holding at most `queue_size` items, so a slow
+        stage throttles the ones before it instead of buffering the whole crawl in memory.
+
+        Args:
+            pipelined (bool): Run the stages concurrently instead of one URL at a time.
+            fetch_concurrency (int): Maximum number of URLs fetched at the same time.
+            per_host_concurrency (int): Maximum number of URLs of the same host fetched at the same time.
+            per_host_delay (float): Minimum delay between the start of two requests to the same host, in seconds.
+            queue_size (int): Capacity of the queues between the stages.
         """
-        for url in self.doc_urls:
-            content = self.__fetch_docs(url)
-            documents, embeddings = self.__process_docs(content)
-            self.__store_in_pinecone(documents, embeddings)
+        # Seeded with the chunks of previous crawls, so boilerplate of pages skipped as unchanged is still known.
+        self.seen_fingerprints = self.crawl_state.fingerprints() if self.crawl_state is not None else {}
+        self._page_fingerprints = {}
+        self.skipped_chunks = 0
+        self._changed_pages = {}
+        self._unchanged_pages = []
+        self._stale_vectors = 0
+        started = time.perf_counter()
+
+        with EmbeddingBatcher(
+            self.model,
+            batch_size=self.embed_batch_size,
+            multi_process=self.multi_process_embedding,
+            cache=self.embedding_cache,
+            model_name=self.embedding_model,
+        ) as batcher:
+            if pipelined:
+                self.__crawl_pipelined(batcher, fetch_concurrency, per_host_concurrency, per_host_delay, queue_size)
+            else:
+                for url in self.doc_urls:
+                    fetched = self.__fetch_page(url)
+                    if fetched is None:
+                        continue
+                    for page in batcher.add(url, self.__changed_chunks(url, *fetched)):
+                        self.__store_vectors(*page)
+                for page in batcher.flush():
+                    self.__store_vectors(*page)
+
+        self.vector_store.save()
+        self.keyword_index.save()
+        if self.crawl_state is not None:
+            # Recorded only now, so an interrupted crawl is repeated instead of leaving pages unindexed.
+            self.crawl_state.update(self._changed_pages)
+            self.crawl_state.touch(self._unchanged_pages)
+            print(
+                f"Skipped {len(self._unchanged_pages)} unchanged pages, "
+                f"deleted {self._stale_vectors} vectors of vanished chunks."
+            )
+        print(
+            f"Documents indexed successfully in {time.perf_counter() - started:.1f}s! "
+            f"Skipped {self.skipped_chunks} duplicate or boilerplate chunks."
+        )
+        print(f"Embedded {batcher.encoded_chunks} chunks at {batcher.throughput():.1f} chunks/s.")
+        if self.embedding_cache is not None:
+            print(f"Embedding cache: {self.embedding_cache.stats()}")
+
+    @staticmethod
+    def __put(target_queue, item, stop):
+        """Puts an item on a bounded queue, giving up when the pipeline is being stopped."""
+        while not stop.is_set():
+            try:
+                target_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    async def __fetch_stage(self, fetched, stop, fetch_concurrency, per_host_concurrency, per_host_delay):
+        """
+        WARNING: Internal method, do not call directly.
+
+        Fetches all URLs with bounded global and per-host concurrency and puts (url, content, validators) on the
+        `fetched` queue.
+        """
+        global_slots = asyncio.Semaphore(fetch_concurrency)
+        host_slots = defaultdict(lambda: asyncio.Semaphore(per_host_concurrency))
+        host_locks = defaultdict(asyncio.Lock)
+        next_start = defaultdict(float)
+
+        async def fetch(url):
+            host = urlparse(url).netloc
+            async with global_slots, host_slots[host]:
+                async with host_locks[host]:
+                    loop_time = asyncio.get_running_loop().time()
+                    delay = next_start[host] - loop_time
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    next_start[host] = max(loop_time, next_start[host]) + per_host_delay
+                if stop.is_set():
+                    return
+                try:
+                    page = await asyncio.to_thread(self.__fetch_page, url)
+                except Exception as e:
+                    print(f"Failed to fetch {url}: {e}")
+                    return
+                if page is not None:
+                    await asyncio.to_thread(self.__put, fetched, (url, *page), stop)
+
+        await asyncio.gather(*(fetch(url) for url in self.doc_urls))
+
+    def __crawl_pipelined(self, batcher, fetch_concurrency, per_host_concurrency, per_host_delay, queue_size):
+        """
+        WARNING: Internal method, do not call directly.
+
+        Runs the fetch, embedding and upsert stages concurrently, connected by bounded queues.
+        """
+        fetched = queue.Queue(maxsize=queue_size)
+        embedded = queue.Queue(maxsize=queue_size)
+        stop = threading.Event()
+        errors = []
+
+        def fetch_stage():
+            try:
+                asyncio.run(
+                    self.__fetch_stage(fetched, stop, fetch_concurrency, per_host_concurrency, per_host_delay)
+                )
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                self.__put(fetched, None, stop)
+
+        def upsert_stage():
+            while not stop.is_set():
+                try:
+                    item = embedded.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is None:
+                    return
+                try:
+                    self.__store_vectors(*item)
+                except Exception as e:
+                    errors.append(e)
+                    stop.set()
+                    return
+
+        fetcher = threading.Thread(target=fetch_stage, name="docs-crawler-fetch", daemon=True)
+        upserter = threading.Thread(target=upsert_stage, name="docs-crawler-upsert", daemon=True)
+        fetcher.start()
+        upserter.start()
+
+        # The embedding stage runs on the calling thread.
+        try:
+            while not stop.is_set():
+                try:
+                    item = fetched.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is None:
+                    pages = batcher.flush()
+                else:
+                    url, content, validators = item
+                    pages = batcher.add(url, self.__changed_chunks(url, content, validators))
+                if not all(self.__put(embedded, page, stop) for page in pages) or item is None:
+                    break
+        except BaseException:
+            stop.set()
+            raise
+        finally:
+            self.__put(embedded, None, stop)
+            fetcher.join()
+            upserter.join()
 
+        if errors:
+            raise errors[0]
 
 # example usage:
 
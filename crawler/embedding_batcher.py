@@ -0,0 +1,135 @@
+import time
+
+from common.tracing import span
+
+
+class EmbeddingBatcher:
+    """
+    Collects document chunks across pages and embeds them in large fixed-size batches.
+
+    Small pages produce a handful of chunks each, and encoding them page by page leaves most of the model's
+    throughput unused. The batcher buffers chunks until `batch_size` of them are pending and encodes them in
+    one call. Within a batch the chunks are sorted by length, so the model's mini-batches contain chunks of
+    similar length and waste little work on padding; the embeddings are returned in the original order.
+
+    With `multi_process=True` the batches are encoded by a sentence-transformers multi-process pool with one
+    worker per CPU core (or per target device), started by `start()` and stopped by `close()`.
+
+    Args:
+        model (SentenceTransformer): The model used to generate the embeddings.
+        batch_size (int): Number of chunks encoded per batch.
+        encode_batch_size (int): Mini-batch size used by the model inside a batch.
+        multi_process (bool): Encode with a multi-process pool.
+        target_devices (list): Devices of the pool workers, e.g. ["cpu"] * 8; defaults to all CPU cores or GPUs.
+        sort_by_length (bool): Sort the chunks of a batch by length before encoding.
+        cache (EmbeddingCache): Optional embedding cache; cached chunks are not encoded again.
+        model_name (str): Name of the model, used as part of the cache key.
+
+    Attributes:
+        encoded_chunks (int): Number of chunks encoded so far.
+        encode_seconds (float): Time spent encoding so far.
+    """
+
+    def __init__(self, model, batch_size=256, encode_batch_size=32, multi_process=False, target_devices=None,
+                 sort_by_length=True, cache=None, model_name=None):
+        self.model = model
+        self.batch_size = batch_size
+        self.encode_batch_size = encode_batch_size
+        self.multi_process = multi_process
+        self.target_devices = target_devices
+        self.sort_by_length = sort_by_length
+        self.cache = cache
+        self.model_name = model_name
+        self.encoded_chunks = 0
+        self.encode_seconds = 0.0
+        self._pending = []  # (url, chunk) pairs waiting for a full batch
+        self._pool = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def start(self):
+        """Starts the multi-process pool, if enabled."""
+        if self.multi_process and self._pool is None:
+            self._pool = self.model.start_multi_process_pool(target_devices=self.target_devices)
+
+    def close(self):
+        """Stops the multi-process pool, if running. Pending chunks are not encoded; call flush() first."""
+        if self._pool is not None:
+            self.model.stop_multi_process_pool(self._pool)
+            self._pool = None
+
+    def add(self, url, documents):
+        """
+        Adds the chunks of a page and encodes every batch that is full.
+
+        Args:
+            url (str): The URL the chunks were scraped from.
+            documents (list): The chunks of the page.
+
+        Returns:
+            list: (url, documents, embeddings) tuples for the chunks encoded by this call, grouped by page.
+                  The chunks of a page may be split over the results of several calls.
+        """
+        self._pending.extend((url, document) for document in documents)
+        results = []
+        while len(self._pending) >= self.batch_size:
+            batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+            results.extend(self._encode(batch))
+        return results
+
+    def flush(self):
+        """
+        Encodes the remaining chunks, even if they do not fill a batch.
+
+        Returns:
+            list: (url, documents, embeddings) tuples, grouped by page.
+        """
+        batch, self._pending = self._pending, []
+        return self._encode(batch) if batch else []
+
+    def throughput(self):
+        """Returns the number of chunks encoded per second of encoding time."""
+        return self.encoded_chunks / self.encode_seconds if self.encode_seconds else 0.0
+
+    def _encode_texts(self, texts):
+        started = time.perf_counter()
+        with span("embedding", "encode", texts=len(texts), multi_process=self._pool is not None):
+            if self._pool is not None:
+                embeddings = self.model.encode_multi_process(texts, self._pool, batch_size=self.encode_batch_size)
+            else:
+                embeddings = self.model.encode(texts, batch_size=self.encode_batch_size)
+        self.encode_seconds += time.perf_counter() - started
+        self.encoded_chunks += len(texts)
+        return embeddings
+
+    def _encode(self, batch):
+        texts = [document for _, document in batch]
+        order = list(range(len(texts)))
+        if self.sort_by_length:
+            order.sort(key=lambda i: len(texts[i]))
+        sorted_texts = [texts[i] for i in order]
+
+        with span("embedding", "batch", chunks=len(texts), model=self.model_name):
+            if self.cache is not None:
+                sorted_embeddings = self.cache.embed(
+                    self.model_name, sorted_texts, self._encode_texts, self.model.get_sentence_embedding_dimension()
+                )
+            else:
+                sorted_embeddings = self._encode_texts(sorted_texts)
+
+        embeddings = [None] * len(texts)
+        for position, i in enumerate(order):
+            embeddings[i] = sorted_embeddings[position]
+
+        # Group the batch back into pages, keeping the order in which the pages were added.
+        groups = {}
+        for (url, document), embedding in zip(batch, embeddings):
+            documents, page_embeddings = groups.setdefault(url, ([], []))
+            documents.append(document)
+            page_embeddings.append(embedding)
+        return [(url, documents, page_embeddings) for url, (documents, page_embeddings) in groups.items()]
@@ -1,39 +1,67 @@
-
-
+import argparse
 import sys
 import os
 
-# Add the root directory to sys.path
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+# Add the root directory and the Terraform template expert (a directory, not a package) to sys.path
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(ROOT_DIR)
+sys.path.append(os.path.join(ROOT_DIR, "terraform-template-expert"))
+
+from code_analysis_expert.code_analysis_agent import CodeAnalysisAgent as CodeSummaryAgent
+from common.stage_graph import Stage, StageGraph
+from common.tracing import print_summary
+from template_stages import build_template_graph
 
-from code_analysis_expert.code_analysis_agent import CodeAnalysisAgent
-from terraform_template_expert.terraform_gen_agent import TerraformTemplateGenerator
 
 class AIPipeline:
-    def __init__(self, agents):
+    def __init__(self, agents, model_name="qwen2.5-coder", max_workers=None):
         """
         Initialize the pipeline with a list of agents.
         :param agents: List of agent instances to execute sequentially.
+        :param model_name: Local Ollama model used to summarize the project code.
+        :param max_workers: Size of the stage scheduler's thread pool; one thread per stage by default.
         """
-        self.model_name="qwen2.5-coder"
+        self.model_name = model_name
         self.agents = agents
+        self.max_workers = max_workers
+
+    def build_graph(self, program_dir, summarize=True, stage_timeout=None):
+        """
+        Builds the stage graph of the full pipeline.
+
+        The Terraform template stages run as in terraform-template-expert/pipeline.py. With `summarize`, the
+        project code is also summarized by the local Ollama model, in a stage independent of (and therefore
+        concurrent with) the template stages; it is optional, so a missing Ollama server does not fail the run.
+
+        :param program_dir: Path to the project to deploy.
+        :param summarize: Add the code summary stage.
+        :param stage_timeout: Optional timeout in seconds of each stage.
+        :return: The StageGraph.
+        """
+        graph = build_template_graph(program_dir, stage_timeout=stage_timeout)
+        if summarize:
+            agent = CodeSummaryAgent(model_name=self.model_name)
+            print(f"Initializing {agent.__class__.__name__} with model: {self.model_name}")
+            graph.add(Stage(
+                "summarize_code",
+                lambda: agent.analyze_directory(program_dir),
+                output_type=dict,
+                timeout=stage_timeout,
+                optional=True,
+            ))
+        return graph
 
-    def start_pipeline(self):
+    def start_pipeline(self, program_dir, summarize=True, stage_timeout=None):
+        """
+        Runs the full pipeline for a project.
+
+        :return: The generated Terraform script.
+        """
         print("Starting AIPipeline...")
-        agent = CodeAnalysisAgent(model_name=self.model_name)
-        print(f"Initializing {agent.__class__.__name__} with model: {self.model_name}")
-        summaries = agent.analyze_directory("/Users/amoldericksoans/Documents/PromptSeek")
-        print("Code analysis completed. Summaries generated.")
-        openrouter_api_key = "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"
-        aws_access_key_id = "aws"
-        aws_secret_access_key = "aws"
-        generator = TerraformTemplateGenerator(
-            summaries,
-            openrouter_api_key,
-            aws_access_key_id,
-            aws_secret_access_key
-        )
-        generator.execute(bucket_name="your-terraform-bucket")
+        results = self.build_graph(program_dir, summarize, stage_timeout).run(max_workers=self.max_workers)
+        if "summarize_code" in results and results["summarize_code"].value is not None:
+            print(f"Code analysis completed. {len(results['summarize_code'].value)} summaries generated.")
+        return results["generate_terraform"].value
 
     def execute(self, input_data):
         """
@@ -41,15 +69,32 @@ class AIPipeline:
         :param input_data: The initial input to the pipeline.
         :return: The final output after processing by all agents.
         """
-        # todo needs modification
-        current_data = input_data
-        for agent in self.agents:
-            print(f"Passing data to {agent.__class__.__name__}...")
-            current_data = agent.process(current_data)
-            print(f"Output from {agent.__class__.__name__}: {current_data}\n")
+        graph = StageGraph([Stage("input", lambda: input_data)])
+        previous = "input"
+        for i, agent in enumerate(self.agents):
+            name = f"{i}_{agent.__class__.__name__}"
+
+            def process(data, agent=agent):
+                print(f"Passing data to {agent.__class__.__name__}...")
+                output = agent.process(data)
+                print(f"Output from {agent.__class__.__name__}: {output}\n")
+                return output
+
+            graph.add(Stage(name, process, inputs={"data": previous}))
+            previous = name
+
+        return graph.run(max_workers=self.max_workers)[previous].value
 
-        return current_data
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Summarize a project and generate its Terraform template.")
+    parser.add_argument("program_dir", help="Path to the project to deploy.")
+    parser.add_argument("--no-summary", action="store_true", help="Skip the local code summary stage.")
+    parser.add_argument("--stage-timeout", type=float, default=None, help="Timeout in seconds of each stage.")
+    args = parser.parse_args()
+
     pipe = AIPipeline([])
-    pipe.start_pipeline()
+    try:
+        pipe.start_pipeline(args.program_dir, summarize=not args.no_summary, stage_timeout=args.stage_timeout)
+    finally:
+        print_summary()
@@ -0,0 +1,154 @@
+import hashlib
+import os
+import re
+import sys
+
+# Add the root directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from common.tokenizer import count_tokens, truncate_to_tokens
+from file_ranker import FileRanker, LOCKFILES
+
+# Tokens available for project content per model, leaving room for the instructions and the answer.
+MODEL_TOKEN_BUDGETS = {
+    "meta-llama/llama-3-8b-instruct:free": 6000,
+    "meta-llama/llama-3.2-1b-instruct:free": 100000,
+    "microsoft/phi-3-mini-128k-instruct:free": 100000,
+    "google/gemini-2.0-flash-thinking-exp-1219:free": 24000,
+}
+DEFAULT_TOKEN_BUDGET = 6000
+
+GENERATED_PATTERNS = [
+    re.compile(p)
+    for p in (
+        r"\.min\.(js|css)$",
+        r"\.map$",
+        r"_pb2(_grpc)?\.py$",
+        r"\.pb\.go$",
+        r"(^|/)(dist|build|out|generated|__generated__)/",
+    )
+]
+
+SECTION_HEADER = re.compile(r"\n\n--- (.+?) ---\n")
+
+
+def parse_sections(text):
+    """
+    Splits the content of necessary_files_content.txt back into its files.
+
+    Returns:
+        list: (file_path, content) tuples in file order.
+    """
+    parts = SECTION_HEADER.split(text)
+    return [(parts[i], parts[i + 1].removesuffix("\n")) for i in range(1, len(parts) - 1, 2)]
+
+
+def format_section(file_path, content):
+    return f"\n\n--- {file_path} ---\n{content}\n"
+
+
+class ContextPacker:
+    """
+    Packs project files into a prompt payload that fits a fixed token budget.
+
+    Files are ordered by how much they reveal about the deployment (the FileRanker score), exact and
+    whitespace-only duplicates are dropped, lockfiles and generated files are cut down to their first lines,
+    and files are added until the budget is spent; the first file that no longer fits is truncated to the
+    remaining budget when enough of it is left. Every decision is recorded in a report so the prompt size
+    is predictable.
+
+    Args:
+        token_budget (int): Maximum number of tokens of the packed payload.
+        head_lines (int): Number of lines kept from lockfiles and generated files.
+        min_partial_tokens (int): Smallest remaining budget for which a file is included truncated rather than dropped.
+    """
+
+    def __init__(self, token_budget=DEFAULT_TOKEN_BUDGET, head_lines=40, min_partial_tokens=200):
+        self.token_budget = token_budget
+        self.head_lines = head_lines
+        self.min_partial_tokens = min_partial_tokens
+        self.ranker = FileRanker()
+
+    @classmethod
+    def for_model(cls, model, **kwargs):
+        return cls(token_budget=MODEL_TOKEN_BUDGETS.get(model, DEFAULT_TOKEN_BUDGET), **kwargs)
+
+    def is_generated(self, rel_path):
+        name = os.path.basename(rel_path).lower()
+        return name in LOCKFILES or any(p.search(rel_path.replace(os.sep, "/")) for p in GENERATED_PATTERNS)
+
+    def shorten(self, content):
+        lines = content.splitlines()
+        if len(lines) <= self.head_lines:
+            return content
+        kept = "\n".join(lines[: self.head_lines])
+        return f"{kept}\n[... {len(lines) - self.head_lines} more lines omitted ...]"
+
+    def pack(self, sections):
+        """
+        Packs files into the token budget.
+
+        Args:
+            sections (list): (file_path, content) tuples, as returned by parse_sections.
+
+        Returns:
+            tuple: A tuple containing two elements:
+                - payload (str): The packed file contents, in the necessary_files_content.txt format.
+                - report (list): One {"path", "status", "tokens"} dict per input file, where status is one of
+                                 "included", "shortened", "truncated", "duplicate" or "dropped".
+        """
+        if not sections:
+            return "", []
+
+        paths = [file_path for file_path, _ in sections]
+        base = os.path.commonpath(paths) if len(paths) > 1 else os.path.dirname(paths[0])
+        order = sorted(
+            range(len(sections)),
+            key=lambda i: -self.ranker.score(os.path.relpath(paths[i], base) if base else paths[i]),
+        )
+
+        seen = {}
+        payload = []
+        report = []
+        remaining = self.token_budget
+
+        for i in order:
+            file_path, content = sections[i]
+            rel_path = os.path.relpath(file_path, base) if base else file_path
+
+            digest = hashlib.sha256(" ".join(content.split()).encode("utf-8")).hexdigest()
+            if digest in seen:
+                report.append({"path": file_path, "status": "duplicate", "tokens": 0, "duplicate_of": seen[digest]})
+                continue
+            seen[digest] = file_path
+
+            status = "included"
+            if self.is_generated(rel_path):
+                shortened = self.shorten(content)
+                if shortened != content:
+                    content, status = shortened, "shortened"
+
+            section = format_section(file_path, content)
+            tokens = count_tokens(section)
+            if tokens > remaining:
+                if remaining < self.min_partial_tokens:
+                    report.append({"path": file_path, "status": "dropped", "tokens": 0})
+                    continue
+                header_tokens = count_tokens(format_section(file_path, ""))
+                content = truncate_to_tokens(content, remaining - header_tokens - 16) + "\n[... truncated ...]"
+                section = format_section(file_path, content)
+                tokens = count_tokens(section)
+                status = "truncated"
+
+            payload.append(section)
+            remaining -= tokens
+            report.append({"path": file_path, "status": status, "tokens": tokens})
+
+        return "".join(payload), report
+
+
+def print_report(report, token_budget):
+    used = sum(entry["tokens"] for entry in report)
+    print(f"📦 Packed {used}/{token_budget} tokens:")
+    for entry in report:
+        print(f"   {entry['status']:<10} {entry['tokens']:>7}  {entry['path']}")
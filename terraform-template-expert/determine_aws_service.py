@@ -1,15 +1,19 @@
 import os
-import json
 import sys
 
-import requests
-
 from dotenv import load_dotenv
 
+# Add the root directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from common.llm_client import get_client
+from common.tracing import span
+
+from context_packer import ContextPacker, parse_sections, print_report
+
 # Load environment variables from .env file
 load_dotenv()
 
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 OPENROUTER_MODEL = "meta-llama/llama-3-8b-instruct:free"  # Free model
 
 
@@ -20,32 +24,15 @@ class CodeAnalysisAgent:
 
     def read_project_file(self, file_path="necessary_files_content.txt"):
         """Reads extracted project content from file."""
-        with open(file_path, "r", encoding="utf-8") as f:
-            return f.read()
+        with span("file", "read_project_file") as s:
+            with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+                content = f.read()
+            s.set(bytes=len(content.encode("utf-8")))
+        return content
 
     def query_openrouter(self, prompt):
         """Queries OpenRouter LLM."""
-        url = "https://openrouter.ai/api/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json",
-        }
-        data = {
-            "model": OPENROUTER_MODEL,
-            "messages": [{"role": "user", "content": prompt}],
-        }
-        response = requests.post(url, headers=headers, json=data)
-
-        if response.status_code != 200:
-            print(f"❌ API Error: {response.status_code} - {response.text}")
-            sys.exit(1)
-
-        json_response = response.json()
-
-        # Extract the LLM-generated content
-        extracted_contents = json_response["choices"][0]["message"]["content"]
-
-        return extracted_contents
+        return get_client().chat(OPENROUTER_MODEL, [{"role": "user", "content": prompt}])
 
     def extract_aws_services(self, content):
         """Uses OpenRouter LLM to determine required AWS services based on project files."""
@@ -57,18 +44,32 @@ class CodeAnalysisAgent:
         """
         return self.query_openrouter(prompt)
 
-    def start(self):
-        print("🔍 Reading project files...")
-        project_content = self.read_project_file()
+    def pack_project_content(self, project_content):
+        """Fits the extracted project files into the token budget of OPENROUTER_MODEL."""
+        packer = ContextPacker.for_model(OPENROUTER_MODEL)
+        packed_content, report = packer.pack(parse_sections(project_content))
+        print_report(report, packer.token_budget)
+        return packed_content
+
+    def determine(self, project_content):
+        """Determines the AWS services required by the extracted project content and returns them as free-form text."""
+        project_content = self.pack_project_content(project_content)
         print("🤖 Extracting required AWS services...")
         aws_services = self.extract_aws_services(project_content)
         print("✅ AWS Services Required:")
         print(aws_services)
+        return aws_services
+
+    def start(self):
+        """Determines the AWS services of the extracted project files and returns them as free-form text."""
+        print("🔍 Reading project files...")
+        aws_services = self.determine(self.read_project_file())
         with open("aws_services_required.txt", "w", encoding="utf-8") as f:
             f.write(aws_services)
         print("🎉 AWS service list saved as aws_services_required.txt")
 
         print("✅ Extraction process completed successfully!")
+        return aws_services
 
 
 
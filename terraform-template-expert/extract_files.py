@@ -1,23 +1,50 @@
 import os
 import sys
-import subprocess
-import requests
+import mmap
+import hashlib
 import json
-import pathspec
+import threading
 from dotenv import load_dotenv
 
+# Add the root directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from common.file_manifest import FileManifest, load_state, save_state
+from common.llm_client import get_client
+from common.project_walker import walk_project
+from common.tracing import span
+from file_ranker import FileRanker
+
 # Load environment variables from .env file
 load_dotenv()
 
-# OpenRouter API Key
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
+FILE_SELECTION_MODEL = "microsoft/phi-3-mini-128k-instruct:free"
+
+OUTPUT_FILE = "necessary_files_content.txt"
+MAX_FILE_BYTES = 1024 * 1024  # Per-file cap
+MAX_TOTAL_BYTES = 16 * 1024 * 1024  # Cap for the whole output
+MMAP_THRESHOLD = 256 * 1024  # Files from this size on are memory-mapped
+SNIFF_BYTES = 8192
+COPY_BLOCK_BYTES = 64 * 1024
+
+
+def index_path(output_file):
+    """Returns the path of the sidecar index holding the byte offset of each file in output_file."""
+    return f"{output_file}.index.json"
 
 
 class FileExtractor:
     # Function to query OpenRouter (or another LLM like Ollama)
 
-    def __init__(self):
-        return
+    def __init__(self, use_llm=True, ranker=None):
+        """
+        Args:
+            use_llm (bool): Ask the LLM to pick the necessary files among the best-ranked candidates. When False,
+                            only the known-good picks of the local ranker are used and no LLM call is made.
+            ranker (FileRanker): Local scorer used to pre-rank the project files.
+        """
+        self.use_llm = use_llm
+        self.ranker = ranker or FileRanker()
 
     def query_llm(self, prompt):
         """
@@ -27,33 +54,20 @@ class FileExtractor:
             prompt (str): The message to send to the LLM.
 
         Returns:
-            str: The response from the LLM.
+            list: The file paths listed in the response of the LLM.
+
+        Raises:
+            LLMError: If the request to OpenRouter fails.
         """
-        url = "https://openrouter.ai/api/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json",
-        }
-        payload = {
-            "model": "microsoft/phi-3-mini-128k-instruct:free",  # Change model if needed
-            "messages": [
+        necessary_files_text = get_client().chat(
+            FILE_SELECTION_MODEL,  # Change model if needed
+            [
                 {
                     "role": "system",
                     "content": prompt,
                 },
             ],
-        }
-
-        response = requests.post(url, json=payload, headers=headers)
-
-        if response.status_code != 200:
-            print(f"❌ API Error: {response.status_code} - {response.text}")
-            sys.exit(1)
-
-        json_response = response.json()
-
-        # Extract the LLM-generated file list
-        necessary_files_text = json_response["choices"][0]["message"]["content"]
+        )
 
         # Clean and standardize file paths
         necessary_files = list(
@@ -66,114 +80,210 @@ class FileExtractor:
 
         return necessary_files
 
-    def load_gitignore_patterns(self, project_dir):
+    def extract_project_structure(self, project_dir):
         """
-        Reads the .gitignore file and returns a PathSpec object with ignore patterns.
+        Extracts the file structure of the given project directory while respecting nested .gitignore files.
 
         Args:
             project_dir (str): Path to the project directory.
 
         Returns:
-            pathspec.PathSpec: PathSpec object containing ignore rules.
+            str: The filtered list of files in the project.
         """
-        gitignore_path = os.path.join(project_dir, ".gitignore")
-
         ignore_patterns = [
             ".git/",  # Ensure .git folder is excluded
-            ".gitignore",  # Exclude .gitignore itself
+            ".gitignore",  # Exclude .gitignore files themselves
+            "/ai-hackathon-25/",  # Exclude cloned directory
         ]
 
-        if os.path.exists(gitignore_path):
-            with open(gitignore_path, "r", encoding="utf-8") as gitignore_file:
-                ignore_patterns.extend(gitignore_file.readlines())
-
-        return pathspec.PathSpec.from_lines("gitwildmatch", ignore_patterns)
-
-    def extract_project_structure(self, project_dir):
+        with span("file", "walk_project") as s:
+            files = list(walk_project(project_dir, extra_ignore_patterns=ignore_patterns))
+            s.set(files=len(files))
+        return "\n".join(files)
+
+    def is_binary(self, sniff):
+        """Detects binary files from their first bytes: any NUL byte or invalid UTF-8 marks a file as binary."""
+        if b"\0" in sniff:
+            return True
+        try:
+            sniff.decode("utf-8")
+        except UnicodeDecodeError as e:
+            # A multi-byte character cut off at the end of the sniffed block is not a sign of binary content.
+            return e.start < len(sniff) - 3
+        return False
+
+    def copy_file_content(self, file_path, out, max_bytes):
         """
-        Extracts the file structure of the given project directory while respecting .gitignore.
+        Copies at most max_bytes of a file to the output stream without holding the whole file in memory.
 
-        Args:
-            project_dir (str): Path to the project directory.
+        Large files are memory-mapped and written straight from the mapping; smaller ones are copied in blocks.
 
         Returns:
-            str: The filtered list of files in the project.
+            tuple: (bytes written, whether the file was truncated), or None if the file is binary.
         """
-        project_structure_file = "project_structure.txt"
-
-        find_command = ["find", project_dir, "-type", "f"]
-
-        exclude_dir = "ai-hackathon-25"  # Exclude cloned directory
-        find_command += ["!", "-path", os.path.join(project_dir, exclude_dir, "*")]
-
-        result = subprocess.run(find_command, capture_output=True, text=True)
-
-        all_files = result.stdout.strip().split("\n")
-
-        # Load .gitignore patterns
-        ignore_spec = self.load_gitignore_patterns(project_dir)
-
-        if ignore_spec:
-            filtered_files = [
-                f
-                for f in all_files
-                if not ignore_spec.match_file(os.path.relpath(f, project_dir))
-            ]
-        else:
-            filtered_files = all_files  # No filtering if .gitignore is missing
-
-        # Save the filtered file list
-        # with open(project_structure_file, "w", encoding="utf-8") as file:
-        #     file.write("\n".join(filtered_files))
-
-        return "\n".join(filtered_files)
-
-    def extract_file_contents(self, necessary_files):
+        with open(file_path, "rb") as f:
+            sniff = f.read(SNIFF_BYTES)
+            if self.is_binary(sniff):
+                return None
+
+            size = os.fstat(f.fileno()).st_size
+            length = min(size, max_bytes)
+            if size >= MMAP_THRESHOLD:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    with memoryview(mm) as view:
+                        out.write(view[:length])
+            else:
+                out.write(sniff[:length])
+                written = len(sniff[:length])
+                while written < length:
+                    block = f.read(min(COPY_BLOCK_BYTES, length - written))
+                    if not block:
+                        break
+                    out.write(block)
+                    written += len(block)
+                length = written
+
+        return length, length < size
+
+    def write_file_contents(self, necessary_files, out, previous=None, previous_index=None, reusable=None):
         """
-        Extracts the content of specified files from the project directory.
+        Writes the content of the specified files to a binary stream, one file at a time.
+
+        Binary files are skipped, each file is capped at MAX_FILE_BYTES and the whole output at MAX_TOTAL_BYTES.
 
         Args:
-            project_dir (str): Path to the project directory.
             necessary_files (list): List of filenames to extract content from.
+            out (io.BufferedIOBase): Seekable binary stream receiving the content.
+            previous (io.BufferedIOBase): Output of a previous extraction, to copy reusable files from.
+            previous_index (dict): Index of the previous extraction.
+            reusable (set): Files whose content can be copied from the previous output instead of being read again.
 
         Returns:
-            dict: A dictionary with file paths as keys and their content as values.
+            tuple: (index mapping each extracted file to {"offset", "length", "truncated"}, total bytes of content).
         """
-        extracted_contents = {}
-
+        with span("file", "read_contents") as s:
+            index, total = self._write_file_contents(necessary_files, out, previous, previous_index or {}, reusable)
+            s.set(files=len(index), bytes=total)
+        return index, total
+
+    def _write_file_contents(self, necessary_files, out, previous, previous_index, reusable):
+        index = {}
+        total = 0
         for file_path in necessary_files:
-            if os.path.exists(file_path):
-                try:
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        extracted_contents[file_path] = f.read()
-                except Exception as e:
-                    print(f"⚠ WARNING: Could not read {file_path} - {e}")
-            else:
-                print(f"⚠️ WARNING: {file_path} not found in project directory.")
-
-        return extracted_contents
-
-    def save_extracted_content(self, file_contents):
+            if file_path in index:
+                continue
+            if total >= MAX_TOTAL_BYTES:
+                print(f"⚠ WARNING: Output limit of {MAX_TOTAL_BYTES} bytes reached, skipping {file_path}")
+                continue
+
+            header = f"\n\n--- {file_path} ---\n".encode("utf-8")
+            start = out.tell()
+            out.write(header)
+            offset = out.tell()
+            max_bytes = min(MAX_FILE_BYTES, MAX_TOTAL_BYTES - total)
+
+            try:
+                entry = previous_index.get(file_path) if file_path in (reusable or ()) else None
+                if entry is not None and entry["length"] <= max_bytes:
+                    previous.seek(entry["offset"])
+                    out.write(previous.read(entry["length"]))
+                    result = entry["length"], entry["truncated"]
+                elif os.path.isfile(file_path):
+                    result = self.copy_file_content(file_path, out, max_bytes)
+                    if result is None:
+                        print(f"⚠ WARNING: Skipping binary file {file_path}")
+                else:
+                    print(f"⚠️ WARNING: {file_path} not found in project directory.")
+                    result = None
+            except Exception as e:
+                print(f"⚠ WARNING: Could not read {file_path} - {e}")
+                result = None
+
+            if result is None:
+                out.seek(start)
+                out.truncate()
+                continue
+
+            length, truncated = result
+            if truncated:
+                print(f"⚠ WARNING: {file_path} truncated to {length} bytes")
+            out.write(b"\n")
+            index[file_path] = {"offset": offset, "length": length, "truncated": truncated}
+            total += length
+        return index, total
+
+    def stream_file_contents(self, necessary_files, output_file=OUTPUT_FILE, reusable=None):
         """
-        Saves the extracted file contents to necessary_files_content.txt.
+        Streams the content of the specified files into output_file, one file at a time, and writes a sidecar
+        index with the byte offset and length of each file's content.
 
         Args:
-            file_contents (dict): Dictionary containing file paths and their content.
-        """
-        output_file = "necessary_files_content.txt"
+            necessary_files (list): List of filenames to extract content from.
+            output_file (str): Path of the output file.
+            reusable (set): Files whose content can be copied from the previous output file and index instead of
+                            being read again.
 
-        with open(output_file, "w", encoding="utf-8") as f:
-            for file_path, content in file_contents.items():
-                f.write(f"\n\n--- {file_path} ---\n{content}\n")
+        Returns:
+            dict: The index, mapping each extracted file to {"offset", "length", "truncated"}.
+        """
+        previous_index = self.load_index(output_file) if reusable else {}
+        # Unique per process and thread, so concurrent runs sharing a run directory never write the same file.
+        tmp_file = f"{output_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        directory = os.path.dirname(output_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        previous = open(output_file, "rb") if previous_index else None
+        try:
+            with open(tmp_file, "wb") as out:
+                index, total = self.write_file_contents(necessary_files, out, previous, previous_index, reusable)
+        finally:
+            if previous is not None:
+                previous.close()
+
+        os.replace(tmp_file, output_file)
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp_file, index_path(output_file))
+
+        print(f"✅ Extracted {len(index)} files ({total} bytes) to {output_file}")
+        return index
+
+    def load_index(self, output_file=OUTPUT_FILE):
+        """Loads the sidecar index of a previous extraction, or returns an empty dict if it is missing or stale."""
+        try:
+            with open(index_path(output_file), "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not os.path.exists(output_file):
+            return {}
+        return index
+
+    def read_extracted_file(self, file_path, output_file=OUTPUT_FILE):
+        """
+        Reads the extracted content of a single file by seeking to it through the sidecar index.
 
-        print(f"✅ Extracted file contents saved to {output_file}")
+        Returns:
+            str: The extracted content, or None if the file is not part of the output.
+        """
+        entry = self.load_index(output_file).get(file_path)
+        if entry is None:
+            return None
+        with open(output_file, "rb") as f:
+            f.seek(entry["offset"])
+            return f.read(entry["length"]).decode("utf-8", errors="replace")
+
+    def select_necessary_files(self, project_structure):
+        """
+        Asks the LLM which files of the project structure are necessary to determine the AWS services.
 
-    def start(self, project_dir):
-        print(f"🔹 Extracting project directory structure...")
-        project_structure = self.extract_project_structure(project_dir)
+        Args:
+            project_structure (str): The (pre-ranked and bounded) list of files in the project, one per line.
 
-        # Step 2: Ask LLM which files are necessary
-        print(f"🔹 Asking LLM which files are needed...")
+        Returns:
+            list: The paths of the necessary files.
+        """
         prompt = f"""You are an AI assistant specialized in cloud infrastructure analysis.  
     Your task is to analyze a given project directory structure and determine which files are essential to identify the required AWS services for deployment.  
 
@@ -196,20 +306,104 @@ class FileExtractor:
     From the given directory structure, list the filenames that are necessary to determine the AWS services required for deployment.  
     Return the entire filepath as same as in the provided "project structure", one per line, without explanation.
     """
-        necessary_files = self.query_llm(prompt)
+        return self.query_llm(prompt)
+
+    def identify_necessary_files(self, project_dir, state):
+        """
+        Picks the files necessary to determine the AWS services of a project.
+
+        Args:
+            project_dir (str): Path to the project directory.
+            state (dict): State of the previous incremental run; its file selection is reused as long as the
+                project structure is unchanged.
 
-        # with open("necessary_files.json", "w") as f:
-        #     json.dump(necessary_files_list, f, indent=4)
+        Returns:
+            tuple: (necessary files, hash of the project structure).
+        """
+        print(f"🔹 Extracting project directory structure...")
+        project_structure = self.extract_project_structure(project_dir)
+        structure_hash = hashlib.sha256(project_structure.encode("utf-8")).hexdigest()
+
+        # Step 2: Rank files locally, then ask LLM which of the best candidates are necessary
+        if state.get("structure_hash") == structure_hash and "necessary_files" in state:
+            print(f"🔹 Project structure unchanged, reusing previous file selection...")
+            necessary_files = state["necessary_files"]
+        else:
+            ranked = self.ranker.rank(project_structure.split("\n") if project_structure else [], project_dir)
+            known_good = self.ranker.known_good(ranked)
+            if self.use_llm:
+                candidates, listing = self.ranker.build_listing(ranked, project_dir)
+                print(f"🔹 Asking LLM which of {len(candidates)} candidate files are needed...")
+                selected = self.select_necessary_files(listing)
+                necessary_files = known_good + sorted(set(selected) - set(known_good))
+            else:
+                print(f"🔹 Using {len(known_good)} known-good files without asking the LLM...")
+                necessary_files = known_good
 
         print(f"\n✅ Necessary files identified")
         print(f"📄 Files Identified:", necessary_files)
+        return necessary_files, structure_hash
+
+    def extract(self, project_dir, state_file=None, output_file=OUTPUT_FILE):
+        """
+        Extracts the files necessary to determine the AWS services of a project into output_file.
+
+        The content is streamed to disk one file at a time and stays under the MAX_TOTAL_BYTES cap, so the
+        extraction never holds the project in memory.
+
+        Args:
+            project_dir (str): Path to the project directory.
+            state_file (str): Optional path of a JSON file holding the state of the previous run. When given,
+                the LLM file selection is reused as long as the project structure is unchanged, and files that
+                did not change are copied from the previous output instead of being read again.
+            output_file (str): Path of the output file; its sidecar index is written next to it.
+
+        Returns:
+            str: output_file.
+        """
+        self._extract(project_dir, state_file, output_file)
+        return output_file
+
+    def start(self, project_dir, state_file=None):
+        """
+        Extracts the files necessary to determine the AWS services of a project into necessary_files_content.txt.
+
+        Args:
+            project_dir (str): Path to the project directory.
+            state_file (str): Optional path of a JSON file holding the state of the previous run. When given,
+                the LLM file selection is reused as long as the project structure is unchanged, and only
+                added or changed files are read again.
+
+        Returns:
+            list: The paths of the necessary files, joined onto project_dir as the project walker yields them.
+        """
+        return self._extract(project_dir, state_file, OUTPUT_FILE)
+
+    def _extract(self, project_dir, state_file, output_file):
+        state = load_state(state_file) if state_file else {}
+        necessary_files, structure_hash = self.identify_necessary_files(project_dir, state)
 
         # Step 3: Extract content of necessary files
         print(f"🔹 Extracting content from {len(necessary_files)} files...")
-        extracted_contents = self.extract_file_contents(necessary_files)
-
-        self.save_extracted_content(extracted_contents)
+        if state_file:
+            manifest, diff = FileManifest.from_dict(state.get("manifest")).refresh(necessary_files)
+            # The previous output can only be reused if it is the file this run writes to.
+            reusable = set(diff.unchanged) if state.get("output_file") == os.path.abspath(output_file) else set()
+            print(f"🔹 {len(reusable)} files unchanged since the previous run")
+            self.stream_file_contents(necessary_files, output_file, reusable=reusable)
+            save_state(
+                state_file,
+                {
+                    "structure_hash": structure_hash,
+                    "necessary_files": necessary_files,
+                    "manifest": manifest.to_dict(),
+                    "output_file": os.path.abspath(output_file),
+                },
+            )
+        else:
+            self.stream_file_contents(necessary_files, output_file)
         print("✅ Extraction process completed successfully!")
+        return necessary_files
 
 
 if __name__ == "__main__":
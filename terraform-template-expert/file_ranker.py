@@ -0,0 +1,194 @@
+import fnmatch
+import os
+from collections import defaultdict
+
+# Files that (almost) always tell us something about how a project is built and deployed.
+MANIFEST_SCORES = {
+    "package.json": 100,
+    "requirements.txt": 100,
+    "pyproject.toml": 100,
+    "pipfile": 90,
+    "setup.py": 80,
+    "setup.cfg": 60,
+    "pom.xml": 100,
+    "build.gradle": 90,
+    "build.gradle.kts": 90,
+    "go.mod": 100,
+    "cargo.toml": 100,
+    "gemfile": 90,
+    "composer.json": 90,
+    "dockerfile": 100,
+    "docker-compose.yml": 100,
+    "docker-compose.yaml": 100,
+    "compose.yml": 100,
+    "compose.yaml": 100,
+    "serverless.yml": 100,
+    "serverless.yaml": 100,
+    "template.yaml": 80,
+    "template.yml": 80,
+    "samconfig.toml": 80,
+    "cdk.json": 90,
+    "procfile": 80,
+    "jenkinsfile": 80,
+    ".gitlab-ci.yml": 80,
+    "buildspec.yml": 80,
+    "appspec.yml": 80,
+    "app.yaml": 70,
+    ".env.example": 60,
+    ".env": 60,
+    "readme.md": 50,
+    "readme.rst": 50,
+    "readme": 50,
+}
+
+EXTENSION_SCORES = {
+    ".tf": 90,
+    ".tfvars": 70,
+    ".hcl": 60,
+}
+
+PATTERN_SCORES = {
+    ".github/workflows/*.yml": 80,
+    ".github/workflows/*.yaml": 80,
+    ".circleci/config.yml": 80,
+    "*.dockerfile": 90,
+    "dockerfile.*": 90,
+    "k8s/*.yaml": 60,
+    "k8s/*.yml": 60,
+    "helm/*.yaml": 50,
+}
+
+ENTRY_POINTS = {
+    "main.py", "app.py", "server.py", "wsgi.py", "asgi.py", "manage.py", "handler.py", "lambda_function.py",
+    "index.js", "server.js", "app.js", "main.js", "index.ts", "server.ts", "app.ts", "main.ts",
+    "main.go", "main.rs", "program.cs", "application.java",
+}
+ENTRY_POINT_SCORE = 70
+
+CONFIG_NAMES = {
+    "schema.sql", "database.yml", "config.json", "config.yml", "config.yaml", "settings.py", "application.yml",
+    "application.yaml", "application.properties", "nginx.conf",
+}
+CONFIG_SCORE = 50
+
+LOCKFILES = {
+    "package-lock.json", "yarn.lock", "pnpm-lock.yaml", "poetry.lock", "pipfile.lock", "cargo.lock",
+    "composer.lock", "gemfile.lock", "go.sum",
+}
+
+LOW_SIGNAL_DIRS = {"test", "tests", "__tests__", "spec", "specs", "examples", "example", "fixtures", "vendor"}
+
+DEPTH_PENALTY = 5
+LOW_SIGNAL_PENALTY = 30
+
+
+class FileRanker:
+    """
+    A deterministic, local scorer that ranks project files by how likely they are to reveal the AWS services
+    needed for deployment.
+
+    Well-known manifests, infrastructure code, CI/CD workflows and entry points score highest; every
+    directory level and every test/example directory on the way costs points. The ranker is used to send a
+    bounded candidate list to the LLM instead of the whole project structure, and its highest-scoring files
+    can be picked without asking the LLM at all.
+
+    Args:
+        max_candidates (int): Maximum number of individual files listed in the prompt.
+        collapse_threshold (int): Minimum number of same-extension files in one directory for them to be
+                                  collapsed into a single summary line.
+        max_summary_lines (int): Maximum number of collapsed directory lines listed in the prompt.
+        known_good_score (int): Score from which a file is considered a known-good pick.
+    """
+
+    def __init__(self, max_candidates=150, collapse_threshold=10, max_summary_lines=50, known_good_score=80):
+        self.max_candidates = max_candidates
+        self.collapse_threshold = collapse_threshold
+        self.max_summary_lines = max_summary_lines
+        self.known_good_score = known_good_score
+
+    def score(self, rel_path):
+        """
+        Scores a single file.
+
+        Args:
+            rel_path (str): Path of the file relative to the project directory.
+
+        Returns:
+            int: The score of the file; files scoring 0 or less carry no known signal.
+        """
+        rel_path = rel_path.replace(os.sep, "/")
+        name = rel_path.rsplit("/", 1)[-1].lower()
+        if name in LOCKFILES:
+            return 0
+
+        score = MANIFEST_SCORES.get(name, 0)
+        score = max(score, EXTENSION_SCORES.get(os.path.splitext(name)[1], 0))
+        if name in ENTRY_POINTS:
+            score = max(score, ENTRY_POINT_SCORE)
+        if name in CONFIG_NAMES:
+            score = max(score, CONFIG_SCORE)
+
+        lowered = rel_path.lower()
+        for pattern, pattern_score in PATTERN_SCORES.items():
+            if fnmatch.fnmatch(lowered, pattern) or fnmatch.fnmatch(lowered, "*/" + pattern):
+                score = max(score, pattern_score)
+
+        if score == 0:
+            return 0
+
+        parts = rel_path.split("/")[:-1]
+        score -= DEPTH_PENALTY * len(parts)
+        if any(part.lower() in LOW_SIGNAL_DIRS for part in parts):
+            score -= LOW_SIGNAL_PENALTY
+        return score
+
+    def rank(self, file_paths, project_dir):
+        """
+        Ranks files from most to least relevant; ties are broken by path so the order is stable across runs.
+
+        Returns:
+            list: (score, file_path) tuples.
+        """
+        ranked = [(self.score(os.path.relpath(f, project_dir)), f) for f in file_paths]
+        ranked.sort(key=lambda item: (-item[0], item[1]))
+        return ranked
+
+    def known_good(self, ranked):
+        """Returns the files that score high enough to be selected without asking the LLM."""
+        return [f for score, f in ranked if score >= self.known_good_score][: self.max_candidates]
+
+    def build_listing(self, ranked, project_dir):
+        """
+        Builds a bounded project listing for the file-selection prompt.
+
+        The best-scoring files are listed individually. The remaining files are summarized: large directories of
+        same-extension files become one line each, and anything else is counted in a final line.
+
+        Returns:
+            tuple: A tuple containing two elements:
+                - candidates (list): The individually listed files.
+                - listing (str): The text to put in the prompt.
+        """
+        candidates = [f for score, f in ranked if score > 0][: self.max_candidates]
+        if len(candidates) < self.max_candidates:
+            remaining_slots = self.max_candidates - len(candidates)
+            candidates += [f for score, f in ranked if score <= 0][:remaining_slots]
+        listed = set(candidates)
+
+        groups = defaultdict(int)
+        for score, f in ranked:
+            if f not in listed:
+                groups[(os.path.dirname(f), os.path.splitext(f)[1] or "(no extension)")] += 1
+
+        summary_lines = []
+        others = 0
+        for (directory, ext), count in sorted(groups.items()):
+            if count >= self.collapse_threshold and len(summary_lines) < self.max_summary_lines:
+                rel_dir = os.path.relpath(directory, project_dir) if directory else "."
+                summary_lines.append(f"{rel_dir}/ ({count} more *{ext} files)")
+            else:
+                others += count
+        if others:
+            summary_lines.append(f"... and {others} other files")
+
+        return candidates, "\n".join(candidates + summary_lines)
@@ -0,0 +1,110 @@
+import re
+
+TOP_LEVEL_BLOCK = re.compile(
+    r"^(terraform|provider|resource|data|variable|output|locals|module|moved|import|check|removed)\b"
+)
+FENCE = re.compile(r"^\s*```")
+
+
+class HclStreamError(ValueError):
+    """Raised when a streamed Terraform generation clearly breaks the expected HCL structure."""
+
+
+class HclStreamWriter:
+    """
+    Turns a stream of LLM content deltas into validated HCL lines, as early as possible.
+
+    Deltas are split into complete lines; Markdown code fences are dropped on the fly and every other line is
+    checked against the expected structure of a Terraform template before it is passed on:
+
+    - at nesting depth 0 only blank lines, comments and top-level block headers (resource, provider, ...)
+      are allowed, so prose instead of HCL is rejected on its first line;
+    - closing more braces than were opened is rejected immediately;
+    - at the end of the stream all blocks must be closed and a provider block must have been seen.
+
+    Args:
+        sink (callable): Called with each accepted line, including its trailing newline.
+    """
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.buffer = ""
+        self.depth = 0
+        self.in_block_comment = False
+        self.seen_provider = False
+        self.lines = []
+
+    def feed(self, delta):
+        """Adds a content delta; raises HclStreamError as soon as a complete line breaks the structure."""
+        self.buffer += delta
+        *complete, self.buffer = self.buffer.split("\n")
+        for line in complete:
+            self._accept(line + "\n")
+
+    def close(self):
+        """
+        Flushes the last line and checks that the template is complete.
+
+        Returns:
+            str: The accepted HCL.
+        """
+        if self.buffer:
+            self._accept(self.buffer)
+            self.buffer = ""
+        if self.depth != 0:
+            raise HclStreamError(f"Generation ended with {self.depth} unclosed block(s)")
+        if not self.seen_provider:
+            raise HclStreamError("Generation contains no provider block")
+        return "".join(self.lines)
+
+    def _accept(self, line):
+        if FENCE.match(line):
+            return
+
+        stripped = line.strip()
+        if self.depth == 0 and not self.in_block_comment and stripped and not self._is_comment(stripped):
+            if not TOP_LEVEL_BLOCK.match(stripped):
+                raise HclStreamError(f"Expected a top-level HCL block, got: {stripped[:80]!r}")
+            if stripped.startswith("provider"):
+                self.seen_provider = True
+
+        self.depth += self._brace_delta(line)
+        if self.depth < 0:
+            raise HclStreamError(f"Unbalanced closing brace in: {stripped[:80]!r}")
+
+        self.lines.append(line)
+        self.sink(line)
+
+    @staticmethod
+    def _is_comment(stripped):
+        return stripped.startswith(("#", "//", "/*"))
+
+    def _brace_delta(self, line):
+        """Counts opening minus closing braces outside of strings and comments."""
+        delta = 0
+        in_string = False
+        i = 0
+        while i < len(line):
+            char = line[i]
+            if self.in_block_comment:
+                if line.startswith("*/", i):
+                    self.in_block_comment = False
+                    i += 1
+            elif in_string:
+                if char == "\\":
+                    i += 1
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == "#" or line.startswith("//", i):
+                break
+            elif line.startswith("/*", i):
+                self.in_block_comment = True
+                i += 1
+            elif char == "{":
+                delta += 1
+            elif char == "}":
+                delta -= 1
+            i += 1
+        return delta
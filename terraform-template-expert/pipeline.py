@@ -1,15 +1,133 @@
+import argparse
+import hashlib
+import os
 import sys
 
-from extract_files import FileExtractor
-from determine_aws_service import CodeAnalysisAgent
-from terraform_gen_agent import TerraformAgent
+from template_stages import build_template_graph
+from common.artifact_store import ArtifactStore
+from common.cassette import (CASSETTE_ENV, CASSETTE_LATENCY_ENV, CASSETTE_MATCH_BY_ORDER_ENV, CASSETTE_MODE_ENV, RECORD,
+                             REPLAY, CassetteMiss, get_cassette)
+from common.embedding_cache import get_embedding_cache
+from common.llm_client import LLMError, get_client
+from common.stage_graph import StageError
+from common.tracing import print_summary
+from extract_files import OUTPUT_FILE
+from hcl_stream import HclStreamError
+from terraform_gen_agent import OUTPUT_FILE as TERRAFORM_FILE
+
+STATE_DIR = ".pipeline_state"
+
+
+def state_file_for(program_dir, name):
+    project_key = hashlib.sha256(os.path.abspath(program_dir).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(STATE_DIR, project_key, name)
+
 
 if __name__ == '__main__':
-    program_dir = sys.argv[1]
-    f = FileExtractor()
-    code_agent = CodeAnalysisAgent()
-    t = TerraformAgent()
-    f.start(program_dir)
-    code_agent.start()
-    t.start()
+    parser = argparse.ArgumentParser(description="Generate a Terraform template for a project.")
+    parser.add_argument("program_dir", help="Path to the project to deploy.")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Reuse the previous file selection while the project structure is unchanged, and the extracted "
+             "content of the files that did not change.",
+    )
+    parser.add_argument(
+        "--no-llm-file-selection",
+        action="store_true",
+        help="Pick the necessary files with the local ranker only, without asking the LLM.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Bypass the LLM response cache (fresh responses are still stored).",
+    )
+    parser.add_argument(
+        "--stage-timeout",
+        type=float,
+        default=None,
+        help="Fail a stage (and skip the stages depending on it) after this many seconds.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip the stages whose inputs are unchanged since the previous run, reusing their checkpoints.",
+    )
+    parser.add_argument(
+        "--run-dir",
+        default=None,
+        help="Directory of the stage checkpoints (default: one per project under .pipeline_state).",
+    )
+    cassette = parser.add_mutually_exclusive_group()
+    cassette.add_argument(
+        "--record",
+        metavar="CASSETTE",
+        default=None,
+        help="Record every OpenRouter, Ollama, Pinecone and crawl4ai call of the run to a cassette file.",
+    )
+    cassette.add_argument(
+        "--replay",
+        metavar="CASSETTE",
+        default=None,
+        help="Answer every external call from a recorded cassette, without network access.",
+    )
+    parser.add_argument(
+        "--emulate-latency",
+        type=float,
+        nargs="?",
+        const=1.0,
+        default=None,
+        metavar="FACTOR",
+        help="With --replay, wait for the recorded duration of each call, scaled by FACTOR (1 by default).",
+    )
+    parser.add_argument(
+        "--match-by-order",
+        action="store_true",
+        help="With --replay, answer requests that were not recorded (e.g. prompts with machine-specific paths) "
+             "with the next recorded call of the same service instead of failing.",
+    )
+    args = parser.parse_args()
 
+    program_dir = args.program_dir
+    # Set through the environment so that every module picks up the same cassette when it first makes a call.
+    if args.record or args.replay:
+        os.environ[CASSETTE_ENV] = args.record or args.replay
+        os.environ[CASSETTE_MODE_ENV] = RECORD if args.record else REPLAY
+    if args.emulate_latency is not None:
+        os.environ[CASSETTE_LATENCY_ENV] = str(args.emulate_latency)
+    if args.match_by_order:
+        os.environ[CASSETTE_MATCH_BY_ORDER_ENV] = "1"
+    if args.no_cache and get_client().cache is not None:
+        get_client().cache.bypass = True
+    run_dir = args.run_dir or state_file_for(program_dir, "artifacts")
+    graph = build_template_graph(
+        program_dir,
+        state_file=state_file_for(program_dir, "extract_files.json") if args.incremental else None,
+        use_llm=not args.no_llm_file_selection,
+        stage_timeout=args.stage_timeout,
+        output_file=os.path.join(run_dir, OUTPUT_FILE),
+        terraform_file=os.path.join(run_dir, TERRAFORM_FILE),
+    )
+    store = ArtifactStore(run_dir=run_dir)
+    try:
+        results = graph.run(store=store, resume=args.resume)
+        # The stages only write to the run directory; the template is published to the working directory once
+        # the whole run has succeeded, atomically, so concurrent runs never see each other's partial files.
+        tmp_file = f"{TERRAFORM_FILE}.{os.getpid()}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            f.write(results["generate_terraform"].value)
+        os.replace(tmp_file, TERRAFORM_FILE)
+        print(f"🎉 Terraform script saved as {TERRAFORM_FILE}")
+    except (LLMError, HclStreamError, StageError, CassetteMiss) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    finally:
+        print(f"⏱️ {get_client().latency.summary()}")
+        if get_client().cache is not None:
+            print(f"🗄️ LLM response cache: {get_client().cache.stats()}")
+        if get_embedding_cache() is not None:
+            print(f"🗄️ Embedding cache: {get_embedding_cache().stats()}")
+        if get_cassette() is not None:
+            print(f"📼 Cassette: {get_cassette().stats()}")
+            get_cassette().close()
+        print_summary()
@@ -0,0 +1,94 @@
+import hashlib
+import os
+import sys
+
+# Add the root directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from common.project_walker import walk_project
+from common.stage_graph import Stage, StageGraph
+from determine_aws_service import OPENROUTER_MODEL as SERVICE_MODEL, CodeAnalysisAgent
+from extract_files import FILE_SELECTION_MODEL, OUTPUT_FILE, FileExtractor
+from terraform_gen_agent import (EMBEDDING_MODEL, OPENROUTER_MODEL, OUTPUT_FILE as TERRAFORM_FILE, RERANK_MODEL,
+                                 TEMPLATE_MODEL, TerraformAgent, warm)
+
+
+def project_fingerprint(program_dir):
+    """Returns the (path, size, mtime) of every project file, so a changed project invalidates the checkpoints."""
+    fingerprint = []
+    for file_path in walk_project(program_dir):
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            continue
+        fingerprint.append((os.path.relpath(file_path, program_dir), stat.st_size, stat.st_mtime_ns))
+    return fingerprint
+
+
+def file_digest(path):
+    """Returns the SHA-256 of a file's content, or None if it does not exist."""
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+
+def build_template_graph(program_dir, state_file=None, use_llm=True, stage_timeout=None, output_file=OUTPUT_FILE,
+                         terraform_file=TERRAFORM_FILE):
+    """
+    Builds the stage graph that generates a Terraform template for a project.
+
+    The three stages run in order (file extraction, AWS service detection, Terraform generation), while the
+    embedding model and the vector index are loaded concurrently by an optional warm-up stage that only the
+    Terraform generation waits for. The extracted content is streamed to output_file, whose path is passed on,
+    and the service list is passed in memory; the checkpoint keys of the stages cover the project files, the
+    extracted content (the path passed on stays the same between runs) and the models they use.
+
+    :param program_dir: Path to the project to deploy.
+    :param state_file: Optional state file of the file extraction; the file selection is reused while the
+        project structure is unchanged.
+    :param use_llm: Ask the LLM which files are necessary, not only the local ranker.
+    :param stage_timeout: Optional timeout in seconds of each stage.
+    :param output_file: File receiving the extracted project content; keep it next to the checkpoints, so a
+        resumed run finds the content of a reused extraction.
+    :param terraform_file: File the generated Terraform script is streamed to; keep it in the run directory, so
+        concurrent runs do not write the same file.
+    :return: The StageGraph; its "generate_terraform" result is the Terraform script.
+    """
+    extractor = FileExtractor(use_llm=use_llm)
+    code_agent = CodeAnalysisAgent()
+    terraform_agent = TerraformAgent()
+
+    return StageGraph([
+        Stage("warm_up", lambda: warm(background=False), optional=True, checkpoint=False),
+        Stage(
+            "extract_files",
+            lambda: extractor.extract(program_dir, state_file=state_file, output_file=output_file),
+            output_type=str,
+            timeout=stage_timeout,
+            key=lambda: {"files": project_fingerprint(program_dir), "use_llm": use_llm, "model": FILE_SELECTION_MODEL},
+        ),
+        Stage(
+            "determine_services",
+            lambda project_file: code_agent.determine(code_agent.read_project_file(project_file)),
+            inputs={"project_file": "extract_files"},
+            input_types={"project_file": str},
+            output_type=str,
+            timeout=stage_timeout,
+            key=lambda: {"content": file_digest(output_file), "model": SERVICE_MODEL},
+        ),
+        Stage(
+            "generate_terraform",
+            lambda aws_services: terraform_agent.start(aws_services, output_file=terraform_file),
+            inputs={"aws_services": "determine_services"},
+            input_types={"aws_services": str},
+            output_type=str,
+            after=["warm_up"],
+            timeout=stage_timeout,
+            key=lambda: {"models": [OPENROUTER_MODEL, TEMPLATE_MODEL, EMBEDDING_MODEL, RERANK_MODEL]},
+        ),
+    ])
@@ -1,74 +1,282 @@
+import contextlib
 import os
-import json
 import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from pinecone import Pinecone
-import requests
-from sentence_transformers import SentenceTransformer
 from dotenv import load_dotenv
-import ollama
 
-from python_terraform import Terraform
+# Add the root directory to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from common.bm25_index import create_keyword_index, reciprocal_rank_fusion
+from common.cassette import cassette_call
+from common.embedding_cache import get_embedding_cache
+from common.llm_client import LLMError, get_client
+from common.tokenizer import count_tokens
+from common.tracing import span
+from hcl_stream import HclStreamError, HclStreamWriter
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Constants
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-PINECONE_INDEX = os.getenv("PINECONE_INDEX")
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 OPENROUTER_MODEL = "meta-llama/llama-3.2-1b-instruct:free"  # Free model
 TEMPLATE_MODEL = "google/gemini-2.0-flash-thinking-exp-1219:free"
-
-# Initialize Pinecone
-pc = Pinecone(api_key=PINECONE_API_KEY)
-index = pc.Index(PINECONE_INDEX)
-
-# Load Embedding Model
-embed_model = SentenceTransformer("all-MiniLM-L6-v2")
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+# Optional cross-encoder used to rerank the fused retrieval results, e.g. "cross-encoder/ms-marco-MiniLM-L-6-v2".
+RERANK_MODEL = os.getenv("RERANK_MODEL")
+DOCS_TOKEN_BUDGET = 3000  # Tokens of retrieved documentation passed on to the prompts
+MAX_SERVICES = 12
+OUTPUT_FILE = "generated_terraform.tf"
+
+# A top-level list item of the service list, e.g. "1. **Amazon S3** - stores uploads" or "- AWS Lambda: ...".
+SERVICE_LIST_ITEM = re.compile(r"^(\s*)(?:[-*•+]|\d+[.)])\s+(.+)$")
+SERVICE_NAME_END = re.compile(r"\s+[-–—]\s+|:|\(")
+
+# The vector index and the embedding model take seconds to set up, so they are created on first use (or by warm())
+# instead of at import time. Importing pinecone and sentence_transformers is deferred for the same reason.
+_embed_model = None
+_embed_model_lock = threading.Lock()
+_index = None
+_index_lock = threading.Lock()
+_keyword_index = None
+_keyword_index_lock = threading.Lock()
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_embed_model():
+    """Returns the shared SentenceTransformer, loading it on first use."""
+    global _embed_model
+    if _embed_model is None:
+        with _embed_model_lock:
+            if _embed_model is None:
+                from sentence_transformers import SentenceTransformer
+
+                _embed_model = SentenceTransformer(EMBEDDING_MODEL)
+    return _embed_model
+
+
+def get_index():
+    """
+    Returns the shared vector index, connecting on first use.
+
+    The backend is chosen by VECTOR_STORE_BACKEND: Pinecone by default, or a local on-disk index for offline runs.
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                from common.vector_store import create_vector_store
+
+                _index = create_vector_store()
+    return _index
+
+
+def get_keyword_index():
+    """Returns the shared BM25 keyword index built by the crawler, loading it on first use."""
+    global _keyword_index
+    if _keyword_index is None:
+        with _keyword_index_lock:
+            if _keyword_index is None:
+                _keyword_index = create_keyword_index()
+    return _keyword_index
+
+
+def get_reranker():
+    """Returns the shared cross-encoder reranker, loading it on first use, or None if RERANK_MODEL is not set."""
+    global _reranker
+    if RERANK_MODEL and _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                from sentence_transformers import CrossEncoder
+
+                _reranker = CrossEncoder(RERANK_MODEL)
+    return _reranker
+
+
+def warm(background=True):
+    """
+    Loads the embedding model and connects to the vector index ahead of time.
+
+    :param background: Do the work in a daemon thread so earlier pipeline stages can run meanwhile.
+    :return: The warm-up thread, or None when warming up in the foreground.
+    """
+
+    def _warm():
+        started = time.perf_counter()
+        try:
+            get_embed_model()
+            get_index()
+            get_keyword_index()
+            get_reranker()
+        except Exception as e:
+            # Not fatal: the accessors try again when the resources are actually needed.
+            print(f"⚠ WARNING: Warm-up failed - {e}")
+            return
+        print(f"🔥 Embedding model and vector index ready after {time.perf_counter() - started:.2f}s")
+
+    if not background:
+        _warm()
+        return None
+    thread = threading.Thread(target=_warm, name="terraform-agent-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def parse_services(aws_services, max_services=MAX_SERVICES):
+    """
+    Parses the free-form service list written by the AWS service stage into individual service names.
+
+    Only top-level list items are used (nested items are usually justifications), Markdown emphasis and the
+    justification after a dash, colon or parenthesis are stripped and duplicates are dropped. If the text
+    contains no list, it is returned as a single query.
+
+    :param aws_services: The service list, e.g. the content of aws_services_required.txt.
+    :param max_services: Maximum number of services returned.
+    :return: The service names, in the order they were listed.
+    """
+    items = []
+    for line in aws_services.splitlines():
+        match = SERVICE_LIST_ITEM.match(line)
+        if match:
+            items.append((len(match.group(1).expandtabs()), match.group(2)))
+    if not items:
+        return [aws_services.strip()] if aws_services.strip() else []
+
+    top_level = min(indent for indent, _ in items)
+    services = []
+    seen = set()
+    for indent, text in items:
+        if indent != top_level:
+            continue
+        name = SERVICE_NAME_END.split(re.sub(r"\*\*|__|`", "", text), maxsplit=1)[0].strip(" *.")
+        if name and name.lower() not in seen:
+            seen.add(name.lower())
+            services.append(name)
+    return services[:max_services]
+
+
+def embed_queries(queries):
+    """Embeds all queries in one batched encode call, answering repeated queries from the embedding cache."""
+    cache = get_embedding_cache()
+    with span("embedding", "queries", texts=len(queries), model=EMBEDDING_MODEL):
+        if cache is not None:
+            # A cache hit answers the queries without loading the embedding model at all.
+            return cache.embed(EMBEDDING_MODEL, queries, lambda texts: get_embed_model().encode(texts))
+        return get_embed_model().encode(queries)
 
 
 class TerraformAgent:
 
-    def __init__(self):
-        return
+    def __init__(self, stream=True):
+        """
+        :param stream: Stream the Terraform generation into the output file and abort it early when the output is
+            clearly not a Terraform template.
+        """
+        self.stream = stream
 
     def read_aws_services(self, file_path="aws_services_required.txt"):
         """Reads extracted AWS services from file."""
-        with open(file_path, "r", encoding="utf-8") as f:
-            return f.read()
+        with span("file", "read_aws_services") as s:
+            with open(file_path, "r", encoding="utf-8") as f:
+                content = f.read()
+            s.set(bytes=len(content.encode("utf-8")))
+        return content
 
-    def query_pinecone(self, services):
-        """Queries Pinecone to find relevant Terraform modules for cost-effective deployment."""
-        query_vector = embed_model.encode(" ".join(services)).tolist()
-        response = index.query(vector=query_vector, top_k=5, include_metadata=True)
-        return [match["metadata"]["text"] for match in response["matches"]]
+    def search(self, query, query_vector, top_k=5, candidates=20):
+        """
+        Finds the documentation chunks matching one query with hybrid retrieval.
+
+        The vector index (Pinecone or local) and the BM25 keyword index, which catches exact resource names like
+        aws_s3_bucket, are queried for `candidates` matches each. The two rankings are merged with reciprocal rank
+        fusion and, if RERANK_MODEL is set, reranked with a cross-encoder.
+
+        :param query: The query text.
+        :param query_vector: The embedding of the query.
+        :param top_k: Number of matches to return.
+        :param candidates: Number of matches taken from each index before fusion.
+        :return: The best matches ({"id", "score", "metadata"}), best first.
+        """
+        with span("vector", "query", top_k=candidates) as s:
+            vector_matches = get_index().query(vector=query_vector, top_k=candidates, include_metadata=True)
+            s.set(matches=len(vector_matches["matches"]))
+        with span("keyword", "bm25", top_k=candidates) as s:
+            keyword_matches = get_keyword_index().query(query, top_k=candidates)
+            s.set(matches=len(keyword_matches["matches"]))
+
+        reranker = get_reranker()
+        fused = reciprocal_rank_fusion(
+            [vector_matches["matches"], keyword_matches["matches"]], top_k=None if reranker else top_k
+        )
+        if reranker is not None and fused:
+            with span("rerank", RERANK_MODEL, pairs=len(fused)):
+                scores = reranker.predict([(query, match["metadata"]["text"]) for match in fused])
+            order = sorted(range(len(fused)), key=lambda i: scores[i], reverse=True)
+            fused = [fused[i] for i in order[:top_k]]
+        return fused
+
+    def query_pinecone(self, services, top_k=5, candidates=20, token_budget=DOCS_TOKEN_BUDGET):
+        """
+        Finds relevant Terraform documentation for cost-effective deployment, with one query per AWS service.
+
+        All service queries are embedded in one batched call and searched concurrently (see search()). The results
+        are deduplicated and each service gets an equal share of the token budget, so every service is covered
+        instead of the best-matching one crowding out the rest; budget left over by a service goes to the
+        remaining matches in fused order.
+
+        :param services: The AWS services to find documentation for, see parse_services().
+        :param top_k: Maximum number of chunks per service.
+        :param candidates: Number of matches taken from each index before fusion.
+        :param token_budget: Maximum number of tokens of documentation returned.
+        :return: The text of the selected documentation chunks.
+        """
+        if not services:
+            return []
+        query_vectors = embed_queries(services)
+        with ThreadPoolExecutor(max_workers=min(len(services), 8)) as executor:
+            results = list(
+                executor.map(lambda args: self.search(*args, top_k=top_k, candidates=candidates),
+                             zip(services, [vector.tolist() for vector in query_vectors]))
+            )
+
+        selected = {}
+        used = 0
+        share = token_budget // len(services)
+        for matches in results:
+            spent = 0
+            for match in matches:
+                tokens = count_tokens(match["metadata"]["text"])
+                if match["id"] in selected or spent + tokens > share:
+                    continue
+                selected[match["id"]] = match["metadata"]["text"]
+                spent += tokens
+            used += spent
+
+        for match in reciprocal_rank_fusion(results):
+            tokens = count_tokens(match["metadata"]["text"])
+            if match["id"] not in selected and used + tokens <= token_budget:
+                selected[match["id"]] = match["metadata"]["text"]
+                used += tokens
+        return list(selected.values())
 
     def query_openrouter(self, prompt, model):
         """Queries OpenRouter LLM."""
-        url = "https://openrouter.ai/api/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json",
-        }
-        data = {
-            "model": model,
-            "messages": [{"role": "user", "content": prompt}],
-        }
-        response = requests.post(url, headers=headers, json=data)
-        return (
-            response.json()
-            .get("choices", [{}])[0]
-            .get("message", {})
-            .get("content", "No response")
-        )
+        return get_client().chat(model, [{"role": "user", "content": prompt}])
 
     def query_ollama(self, prompt, model):
-        """Queries OpenRouter LLM."""
-        response = ollama.chat(
-            model=model, messages=[{"role": "user", "content": prompt}]
-        )
-        getattr(getattr(response, "message", "No response"), "content", "No response")
+        """Queries a local Ollama LLM."""
+        import ollama
+
+        def chat():
+            response = ollama.chat(model=model, messages=messages)
+            return {"content": getattr(getattr(response, "message", None), "content", "No response")}
+
+        messages = [{"role": "user", "content": prompt}]
+        return cassette_call("ollama", {"model": model, "messages": messages}, chat)["content"]
 
     def optimize_aws_services(self, aws_services, terraform_docs):
         """Uses OpenRouter LLM to determine the most cost-effective AWS services needed for deployment."""
@@ -84,6 +292,8 @@ class TerraformAgent:
         return self.query_openrouter(prompt, OPENROUTER_MODEL)
 
     def deploy_terraform(self, working_dir="../"):
+        from python_terraform import Terraform
+
         tf = Terraform(working_dir=working_dir)
 
         return_code, stdout, stderr = tf.init()
@@ -92,8 +302,8 @@ class TerraformAgent:
         return_code, stdout, stderr = tf.apply(skip_plan=True, auto_approve=True)
         print(stdout)
 
-    def generate_terraform_code(self, optimized_services, terraform_docs):
-        """Uses OpenRouter LLM to generate a ready-to-deploy Terraform script."""
+    def build_terraform_prompt(self, optimized_services, terraform_docs):
+        """Builds the prompt asking the LLM for a ready-to-deploy Terraform script."""
         template = """
         terraform {
       required_providers {
@@ -250,17 +460,78 @@ class TerraformAgent:
         Follow the provided template only {template}. DO NOT provide any additional text along with the template, and do not add anything which is not there in the template.
         
         """
-        return self.query_openrouter(prompt, TEMPLATE_MODEL)
+        return prompt
+
+    def generate_terraform_code(self, optimized_services, terraform_docs):
+        """Uses OpenRouter LLM to generate a ready-to-deploy Terraform script."""
+        return self.query_openrouter(self.build_terraform_prompt(optimized_services, terraform_docs), TEMPLATE_MODEL)
+
+    def stream_terraform_code(self, optimized_services, terraform_docs, output_file=OUTPUT_FILE):
+        """
+        Streams the Terraform script from OpenRouter and writes it to output_file as it arrives.
 
-    def start(self):
+        Code fences are stripped on the fly and the stream is aborted as soon as it clearly stops being a
+        Terraform template (see HclStreamWriter). The lines are written to a temporary file of this process and
+        thread next to output_file, which replaces output_file only once the writer has validated the complete template, so no failure (including an
+        interrupt) leaves a truncated template behind. An aborted generation is kept as <output_file>.partial.
+
+        Returns:
+            str: The generated Terraform script.
+
+        Raises:
+            HclStreamError: If the generation breaks the expected HCL structure.
+            LLMError: If the request to OpenRouter fails.
+        """
+        prompt = self.build_terraform_prompt(optimized_services, terraform_docs)
+        started = time.perf_counter()
+        first_byte = None
+        tmp_file = f"{output_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+        try:
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                def write_line(line):
+                    f.write(line)
+                    f.flush()
+
+                writer = HclStreamWriter(write_line)
+                stream = get_client().stream_chat(TEMPLATE_MODEL, [{"role": "user", "content": prompt}])
+                with contextlib.closing(stream):
+                    for delta in stream:
+                        if first_byte is None:
+                            first_byte = time.perf_counter() - started
+                            print(f"⏱️ First byte after {first_byte:.2f}s")
+                        writer.feed(delta)
+                tf_script = writer.close()
+        except BaseException as e:
+            if os.path.exists(tmp_file):
+                os.replace(tmp_file, f"{output_file}.partial")
+            print(f"❌ Aborted Terraform generation: {e!r} (partial output in {output_file}.partial)")
+            raise
+        os.replace(tmp_file, output_file)
+
+        print(f"⏱️ Terraform generation took {time.perf_counter() - started:.2f}s")
+        return tf_script
+
+    def start(self, aws_services=None, output_file=OUTPUT_FILE):
+        """
+        Generates the Terraform template for the required AWS services.
+
+        :param aws_services: The service list of the AWS service stage; read from aws_services_required.txt if
+            not given.
+        :param output_file: File the Terraform script is saved to.
+        :return: The generated Terraform script.
+        """
         # self.deploy_terraform()
         # uncommented above line if needed
-        print("🔍 Reading AWS services required...")
-        aws_services = self.read_aws_services()
+        if aws_services is None:
+            print("🔍 Reading AWS services required...")
+            aws_services = self.read_aws_services()
         print("✅ AWS Services Extracted:", aws_services)
 
         print("📡 Querying Pinecone for Terraform modules...")
-        terraform_docs = self.query_pinecone(aws_services.split())
+        services = parse_services(aws_services)
+        print(f"📋 Retrieving documentation for {len(services)} services: {', '.join(services)}")
+        terraform_docs = self.query_pinecone(services)
         print("✅ Relevant Terraform Documentation Retrieved.")
 
         print("💰 Optimizing AWS service selection...")
@@ -270,22 +541,28 @@ class TerraformAgent:
         print("✅ Optimized AWS Services:", optimized_services)
 
         print("🛠️ Generating Terraform code...")
-        terraform_script = self.generate_terraform_code(
-            optimized_services, "\n\n".join(terraform_docs)
-        )
-
-        print("✅ Terraform Script Generated:")
-        print(terraform_script)
-        regex = rf"^(```terraform)+|(```)+$"
-        # Use re.sub() to replace the matches with an empty string
-        tf_script = re.sub(regex, "", terraform_script)
-
-        with open("generated_terraform.tf", "w", encoding="utf-8") as f:
-            f.write(tf_script)
-        print("🎉 Terraform script saved as generated_terraform.tf")
+        if self.stream:
+            tf_script = self.stream_terraform_code(optimized_services, "\n\n".join(terraform_docs), output_file)
+            print("✅ Terraform Script Generated:")
+            print(tf_script)
+        else:
+            terraform_script = self.generate_terraform_code(
+                optimized_services, "\n\n".join(terraform_docs)
+            )
+
+            print("✅ Terraform Script Generated:")
+            print(terraform_script)
+            regex = rf"^(```terraform)+|(```)+$"
+            # Use re.sub() to replace the matches with an empty string
+            tf_script = re.sub(regex, "", terraform_script)
+
+            with open(output_file, "w", encoding="utf-8") as f:
+                f.write(tf_script)
+        print(f"🎉 Terraform script saved as {output_file}")
         print("Creating Infrastructure on AWS....")
         # self.deploy_terraform(tf_script)
         print("✅ Infrastructure created.")
+        return tf_script
 
 
 # def main():
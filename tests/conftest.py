@@ -0,0 +1,9 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The agents are plain script directories (one with a hyphenated name), so they are imported by path.
+for path in (ROOT, os.path.join(ROOT, "terraform-template-expert")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,110 @@
+import gzip
+import time
+
+import pytest
+
+from common.cassette import RECORD, REPLAY, Cassette, CassetteMiss, RecordedError
+
+
+class ServiceError(Exception):
+    pass
+
+
+def record(path, interactions):
+    cassette = Cassette(str(path), mode=RECORD)
+    interactions(cassette)
+    cassette.close()
+    return cassette
+
+
+def test_replays_calls_and_streams_without_calling_the_service(tmp_path):
+    path = tmp_path / "run.jsonl.gz"
+    record(path, lambda c: (
+        c.call("openrouter", {"prompt": "a"}, lambda: {"content": "first"}),
+        c.call("openrouter", {"prompt": "a"}, lambda: {"content": "second"}),
+        list(c.stream("openrouter", {"prompt": "s"}, lambda: iter(["provider", " {}"]))),
+    ))
+
+    def unreachable():
+        raise AssertionError("the service was called on replay")
+
+    cassette = Cassette(str(path), mode=REPLAY)
+    assert cassette.call("openrouter", {"prompt": "a"}, unreachable) == {"content": "first"}
+    assert cassette.call("openrouter", {"prompt": "a"}, unreachable) == {"content": "second"}
+    assert list(cassette.stream("openrouter", {"prompt": "s"}, unreachable)) == ["provider", " {}"]
+    assert cassette.replayed == 3 and cassette.unmatched == 0
+    # A request made more often than it was recorded means the run diverged from the recording.
+    with pytest.raises(CassetteMiss):
+        cassette.call("openrouter", {"prompt": "a"}, unreachable)
+
+
+def test_replays_recorded_errors(tmp_path):
+    path = tmp_path / "run.jsonl.gz"
+
+    def interactions(c):
+        def failing():
+            raise ServiceError("rate limited")
+
+        def failing_stream():
+            yield "partial"
+            raise ServiceError("connection reset")
+
+        with pytest.raises(ServiceError):
+            c.call("pinecone", {"op": "query"}, failing, errors=(ServiceError,))
+        with pytest.raises(ServiceError):
+            list(c.stream("openrouter", {"prompt": "s"}, failing_stream, errors=(ServiceError,)))
+
+    record(path, interactions)
+
+    cassette = Cassette(str(path), mode=REPLAY)
+    with pytest.raises(ServiceError, match="rate limited"):
+        cassette.call("pinecone", {"op": "query"}, None, errors=(ServiceError,))
+    events = []
+    with pytest.raises(RecordedError, match="connection reset"):
+        for event in cassette.stream("openrouter", {"prompt": "s"}, None):
+            events.append(event)
+    assert events == ["partial"]
+
+
+def test_unmatched_requests_fail_unless_matched_by_order(tmp_path):
+    path = tmp_path / "run.jsonl.gz"
+    record(path, lambda c: (
+        c.call("ollama", {"file": "/home/a/main.py"}, lambda: "summary of main"),
+        c.call("ollama", {"file": "/home/a/util.py"}, lambda: "summary of util"),
+    ))
+
+    with pytest.raises(CassetteMiss):
+        Cassette(str(path), mode=REPLAY).call("ollama", {"file": "/home/b/main.py"}, None)
+
+    cassette = Cassette(str(path), mode=REPLAY, strict=False)
+    assert cassette.call("ollama", {"file": "/home/b/main.py"}, None) == "summary of main"
+    assert cassette.call("ollama", {"file": "/home/a/util.py"}, None) == "summary of util"
+    assert cassette.call("ollama", {"file": "/home/a/util.py"}, None) == "summary of util"
+    assert cassette.unmatched == 2
+    assert "2 matched by order" in cassette.stats()
+    with pytest.raises(CassetteMiss):
+        cassette.call("ollama", {"file": "/home/b/other.py"}, None)
+
+
+def test_replay_emulates_recorded_latency(tmp_path):
+    path = tmp_path / "run.jsonl.gz"
+    record(path, lambda c: c.call("http", {"url": "u"}, lambda: time.sleep(0.2) or "page"))
+
+    started = time.perf_counter()
+    assert Cassette(str(path), mode=REPLAY).call("http", {"url": "u"}, None) == "page"
+    assert time.perf_counter() - started < 0.1
+
+    started = time.perf_counter()
+    assert Cassette(str(path), mode=REPLAY, latency=0.5).call("http", {"url": "u"}, None) == "page"
+    assert time.perf_counter() - started >= 0.09
+
+
+def test_truncated_recording_keeps_complete_interactions(tmp_path):
+    path = tmp_path / "run.jsonl.gz"
+    record(path, lambda c: c.call("http", {"url": "u"}, lambda: "page"))
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        content = f.read()
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write(content + '{"kind": "http", "ke')
+
+    assert Cassette(str(path), mode=REPLAY).call("http", {"url": "u"}, None) == "page"
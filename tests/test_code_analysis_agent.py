@@ -0,0 +1,67 @@
+import pytest
+
+pytest.importorskip("ollama")
+
+from code_analysis_expert.code_analysis_agent import CodeAnalysisAgent  # noqa: E402
+from common.cassette import CassetteMiss  # noqa: E402
+
+
+class EchoAgent(CodeAnalysisAgent):
+    """Answers every chunk with its first line instead of asking Ollama."""
+
+    def chat(self, messages):
+        chunk = messages[0]["content"].split("summary:\n", 1)[1]
+        return {"content": chunk.splitlines()[0], "prompt_eval_count": 1, "eval_count": 1}
+
+
+def project(tmp_path, count):
+    paths = []
+    for i in range(count):
+        path = tmp_path / f"file{i:02d}.tf"
+        path.write_text(f'resource "null_resource" "r{i}" {{}}\n')
+        paths.append(str(path))
+    empty = tmp_path / "empty.tf"
+    empty.write_text("")
+    paths.insert(count // 2, str(empty))
+    return paths
+
+
+@pytest.mark.parametrize("max_concurrency", [1, 2])
+def test_summarizes_every_file_and_reports_each_once(tmp_path, capsys, max_concurrency):
+    # With two workers the window holds 8 chunks, so 12 files overflow it.
+    paths = project(tmp_path, 12)
+    agent = EchoAgent("model", max_concurrency=max_concurrency)
+
+    summaries, failed = agent._summarize_files(paths, root=str(tmp_path))
+
+    assert list(summaries) == paths
+    assert summaries[str(tmp_path / "file03.tf")] == 'resource "null_resource" "r3" {}'
+    assert summaries[str(tmp_path / "empty.tf")] == ""
+    assert failed == set()
+    processed = [line for line in capsys.readouterr().out.splitlines() if line.startswith("Processed: ")]
+    names = ["empty.tf"] + [f"file{i:02d}.tf" for i in range(12)]
+    assert sorted(processed) == sorted(f"Processed: {name}" for name in names)
+
+
+def test_failed_chunks_are_flagged(tmp_path):
+    paths = project(tmp_path, 3)
+
+    class FailingAgent(EchoAgent):
+        def chat(self, messages):
+            if "r1" in messages[0]["content"]:
+                raise ConnectionError("ollama is down")
+            return super().chat(messages)
+
+    summaries, failed = FailingAgent("model", max_concurrency=2)._summarize_files(paths)
+    assert failed == {str(tmp_path / "file01.tf")}
+    assert summaries[str(tmp_path / "file01.tf")].startswith("API Error:")
+
+
+@pytest.mark.parametrize("max_concurrency", [1, 2])
+def test_cassette_miss_fails_the_analysis(tmp_path, max_concurrency):
+    class ReplayAgent(EchoAgent):
+        def chat(self, messages):
+            raise CassetteMiss("No recorded ollama interaction")
+
+    with pytest.raises(CassetteMiss):
+        ReplayAgent("model", max_concurrency=max_concurrency)._summarize_files(project(tmp_path, 3))
@@ -0,0 +1,83 @@
+import multiprocessing
+
+import numpy as np
+
+from common.embedding_cache import EmbeddingCache
+
+
+def texts(prefix, count):
+    return [f"{prefix}-{i}" for i in range(count)]
+
+
+def slots(cache, model_name="m"):
+    return [slot for (slot,) in cache._store(model_name).conn.execute("SELECT slot FROM entries")]
+
+
+def test_round_trip_and_hit_counts(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), max_entries=10)
+    encoded = []
+
+    def encode(batch):
+        encoded.extend(batch)
+        return np.arange(len(batch) * 3, dtype=np.float32).reshape(len(batch), 3)
+
+    first = cache.embed("m", ["a", "b", "a"], encode)
+    second = cache.embed("m", ["b", "a"], encode)
+    assert encoded == ["a", "b"]
+    assert first.tolist() == [[0, 1, 2], [3, 4, 5], [0, 1, 2]]
+    assert second.tolist() == [[3, 4, 5], [0, 1, 2]]
+    assert cache.stats() == {"hits": 2, "misses": 3}
+
+
+def test_free_slots_hands_out_fresh_rows_then_evicts_least_recently_used(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), max_entries=20)
+    cache.put_many("m", texts("old", 15), np.zeros((15, 2)))
+    cache.get_many("m", texts("old", 15)[5:])  # old-0..old-4 are now the least recently used
+    assert sorted(slots(cache)) == list(range(15))
+
+    cache.put_many("m", texts("new", 7), np.ones((7, 2)))
+
+    assert len(slots(cache)) == len(set(slots(cache))) == 20
+    assert cache.get_many("m", texts("old", 2)) == [None, None]
+    assert all(v is not None for v in cache.get_many("m", texts("old", 15)[5:]))
+    assert [v.tolist() for v in cache.get_many("m", texts("new", 7))] == [[1.0, 1.0]] * 7
+
+
+def test_free_slots_reuses_rows_freed_by_earlier_evictions(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), max_entries=20)
+    cache.put_many("m", texts("a", 20), np.zeros((20, 2)))
+    # Eviction frees a tenth of the store even for a single row; the spare row goes to the free list.
+    cache.put_many("m", ["b"], np.ones((1, 2)))
+    store = cache._store("m")
+    assert store.conn.execute("SELECT COUNT(*) FROM free_slots").fetchone()[0] == 1
+
+    cache.put_many("m", ["c"], np.full((1, 2), 2.0))
+    assert store.conn.execute("SELECT COUNT(*) FROM free_slots").fetchone()[0] == 0
+    assert len(slots(cache)) == len(set(slots(cache))) == 20
+    assert cache.get_many("m", ["b", "c"])[1].tolist() == [2.0, 2.0]
+
+
+def _put_batches(directory, worker):
+    cache = EmbeddingCache(directory, max_entries=200)
+    for batch in range(30):
+        cache.put_many("m", texts(f"w{worker}-{batch}", 20), np.full((20, 4), worker * 100 + batch))
+    cache.close()
+
+
+def test_processes_sharing_a_store_never_share_a_row(tmp_path):
+    directory = str(tmp_path)
+    EmbeddingCache(directory, max_entries=200).put_many("m", ["seed"], np.zeros((1, 4)))
+
+    processes = [multiprocessing.Process(target=_put_batches, args=(directory, worker)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    cache = EmbeddingCache(directory, max_entries=200)
+    assert len(slots(cache)) == len(set(slots(cache)))
+    for worker in range(4):
+        for batch in range(30):
+            for vector in cache.get_many("m", texts(f"w{worker}-{batch}", 20)):
+                assert vector is None or vector[0] == worker * 100 + batch
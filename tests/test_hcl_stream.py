@@ -0,0 +1,69 @@
+import pytest
+
+from hcl_stream import HclStreamError, HclStreamWriter
+
+TEMPLATE = (
+    'provider "aws" {\n'
+    '  region = "eu-west-1"\n'
+    "}\n"
+    "\n"
+    "# Static site bucket\n"
+    'resource "aws_s3_bucket" "site" {\n'
+    '  bucket = "site-${var.env}" # "}" in a comment\n'
+    "  tags = {\n"
+    '    Name = "{not a brace}"\n'
+    "  }\n"
+    "}\n"
+)
+
+
+def stream(deltas):
+    lines = []
+    writer = HclStreamWriter(lines.append)
+    for delta in deltas:
+        writer.feed(delta)
+    return writer.close(), lines
+
+
+def test_accepts_template_split_at_arbitrary_points():
+    deltas = [TEMPLATE[i:i + 7] for i in range(0, len(TEMPLATE), 7)]
+    script, lines = stream(deltas)
+    assert script == TEMPLATE
+    assert "".join(lines) == TEMPLATE
+
+
+def test_strips_code_fences():
+    script, _ = stream(["```hcl\n", TEMPLATE, "```\n"])
+    assert script == TEMPLATE
+
+
+def test_rejects_prose_on_its_first_line():
+    lines = []
+    writer = HclStreamWriter(lines.append)
+    writer.feed('provider "aws" {}\n')
+    with pytest.raises(HclStreamError, match="top-level"):
+        writer.feed("Here is your Terraform template:\n")
+    assert lines == ['provider "aws" {}\n']
+
+
+def test_rejects_unbalanced_closing_brace_immediately():
+    writer = HclStreamWriter(lambda line: None)
+    with pytest.raises(HclStreamError, match="Unbalanced"):
+        writer.feed('provider "aws" {}}\n')
+
+
+def test_rejects_unclosed_block():
+    writer = HclStreamWriter(lambda line: None)
+    writer.feed('provider "aws" {\n  region = "eu-west-1"\n')
+    with pytest.raises(HclStreamError, match="unclosed"):
+        writer.close()
+
+
+def test_requires_provider_block():
+    with pytest.raises(HclStreamError, match="provider"):
+        stream(['resource "aws_s3_bucket" "site" {}\n'])
+
+
+def test_block_comments_are_ignored():
+    script, _ = stream(['/* resource "x" "y" {\n', "not hcl at all\n", "*/\n", 'provider "aws" {}'])
+    assert script.endswith('provider "aws" {}')
@@ -0,0 +1,127 @@
+import threading
+import time
+
+import pytest
+
+from common.artifact_store import ArtifactStore
+from common.stage_graph import (CANCELLED, FAILED, REUSED, SUCCEEDED, TIMED_OUT, Stage, StageCancelled, StageError,
+                                StageGraph)
+
+
+def statuses(results):
+    return {name: result.status for name, result in results.items()}
+
+
+def test_passes_outputs_downstream_in_dependency_order():
+    graph = StageGraph([
+        Stage("total", lambda a, b: a + b, inputs={"a": "double", "b": "source"}),
+        Stage("double", lambda value: value * 2, inputs={"value": "source"}),
+        Stage("source", lambda: 3),
+    ])
+    assert graph.order() == ["source", "double", "total"]
+    results = graph.run()
+    assert results["total"].value == 9
+    assert set(statuses(results).values()) == {SUCCEEDED}
+
+
+def test_independent_stages_run_concurrently():
+    barrier = threading.Barrier(2, timeout=5)
+    graph = StageGraph([Stage("left", barrier.wait), Stage("right", barrier.wait)])
+    assert set(statuses(graph.run()).values()) == {SUCCEEDED}
+
+
+def test_rejects_unknown_dependencies_cycles_and_type_mismatches():
+    with pytest.raises(ValueError, match="unknown"):
+        StageGraph([Stage("a", lambda x: x, inputs={"x": "missing"})]).order()
+    with pytest.raises(ValueError, match="cycle"):
+        StageGraph([Stage("a", lambda: 1, after=["b"]), Stage("b", lambda: 1, after=["a"])]).order()
+    with pytest.raises(ValueError, match="expects"):
+        StageGraph([
+            Stage("a", lambda: "text", output_type=str),
+            Stage("b", lambda x: x, inputs={"x": "a"}, input_types={"x": list}),
+        ]).order()
+    with pytest.raises(ValueError, match="Duplicate"):
+        StageGraph([Stage("a", lambda: 1), Stage("a", lambda: 2)])
+
+
+def fail():
+    raise RuntimeError("boom")
+
+
+def test_failure_cancels_downstream_stages_only():
+    ran = []
+    graph = StageGraph([
+        Stage("broken", fail),
+        Stage("downstream", lambda x: ran.append("downstream"), inputs={"x": "broken"}),
+        Stage("independent", lambda: ran.append("independent")),
+    ])
+    results = graph.run(raise_on_failure=False)
+    assert statuses(results) == {"broken": FAILED, "downstream": CANCELLED, "independent": SUCCEEDED}
+    assert isinstance(results["downstream"].error, StageCancelled)
+    assert ran == ["independent"]
+
+    with pytest.raises(RuntimeError, match="boom"):
+        graph.run()
+
+
+def test_fail_fast_cancels_stages_not_started_yet():
+    graph = StageGraph([
+        Stage("broken", fail),
+        Stage("gate", lambda: time.sleep(0.2)),
+        Stage("waiting", lambda: None, after=["gate"]),
+    ])
+    results = graph.run(fail_fast=True, raise_on_failure=False)
+    assert statuses(results) == {"broken": FAILED, "gate": SUCCEEDED, "waiting": CANCELLED}
+
+
+def test_optional_failure_passes_none_downstream():
+    graph = StageGraph([
+        Stage("extra", fail, optional=True),
+        Stage("main", lambda extra: extra, inputs={"extra": "extra"}, output_type=type(None)),
+    ])
+    results = graph.run()
+    assert statuses(results) == {"extra": FAILED, "main": SUCCEEDED}
+
+
+def test_wrong_output_type_fails_the_stage():
+    results = StageGraph([Stage("a", lambda: 1, output_type=str)]).run(raise_on_failure=False)
+    assert results["a"].status == FAILED
+    assert isinstance(results["a"].error, StageError)
+
+
+def test_timed_out_stage_is_abandoned():
+    release = threading.Event()
+    graph = StageGraph([
+        Stage("slow", lambda: release.wait(5), timeout=0.1),
+        Stage("after", lambda x: x, inputs={"x": "slow"}),
+    ])
+    started = time.perf_counter()
+    try:
+        results = graph.run(raise_on_failure=False)
+    finally:
+        release.set()
+    assert time.perf_counter() - started < 2
+    assert statuses(results) == {"slow": TIMED_OUT, "after": CANCELLED}
+
+
+def test_resume_reuses_checkpoints_whose_inputs_are_unchanged(tmp_path):
+    calls = []
+    settings = {"region": "eu-west-1"}
+
+    def graph():
+        return StageGraph([
+            Stage("source", lambda: calls.append("source") or [1, 2], key=lambda: settings),
+            Stage("total", lambda values: calls.append("total") or sum(values), inputs={"values": "source"}),
+        ])
+
+    graph().run(store=ArtifactStore(str(tmp_path)))
+    results = graph().run(store=ArtifactStore(str(tmp_path)), resume=True)
+    assert statuses(results) == {"source": REUSED, "total": REUSED}
+    assert results["total"].value == 3
+    assert calls == ["source", "total"]
+
+    settings["region"] = "us-east-1"
+    results = graph().run(store=ArtifactStore(str(tmp_path)), resume=True)
+    # The source reruns with new settings; its output is unchanged, so the total is still reused.
+    assert statuses(results) == {"source": SUCCEEDED, "total": REUSED}
+    assert calls == ["source", "total", "source"]
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+from common.vector_store import LocalVectorStore
+
+
+def unit(index, dimension=8):
+    value = np.zeros(dimension, dtype=np.float32)
+    value[index] = 1.0
+    return value.tolist()
+
+
+def ids(response):
+    return [match["id"] for match in response["matches"]]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LocalVectorStore(str(tmp_path / "index"))
+    store.upsert([{"id": f"v{i}", "values": unit(i), "metadata": {"n": i}} for i in range(4)])
+    return store
+
+
+def test_query_returns_nearest_first(store):
+    response = store.query(np.array(unit(2)) + 0.1 * np.array(unit(3)), top_k=2)
+    assert ids(response) == ["v2", "v3"]
+    assert response["matches"][0]["metadata"] == {"n": 2}
+    assert response["matches"][0]["score"] == pytest.approx(1 / np.sqrt(1.01), rel=1e-5)
+
+
+def test_zero_top_k_returns_no_matches(store):
+    assert store.query(unit(0), top_k=0) == {"matches": []}
+
+
+def test_empty_store_returns_no_matches(tmp_path):
+    assert LocalVectorStore(str(tmp_path / "empty")).query(unit(0)) == {"matches": []}
+
+
+def test_dimension_mismatch_is_rejected(store):
+    with pytest.raises(ValueError, match="dimension"):
+        store.upsert([{"id": "bad", "values": [1.0, 0.0]}])
+
+
+def test_update_and_delete_before_and_after_save(store, tmp_path):
+    store.save()
+    store.upsert([{"id": "v0", "values": unit(5), "metadata": {"n": "moved"}},
+                  {"id": "v9", "values": unit(6)}])
+    store.delete(["v1", "missing"])
+
+    assert len(store) == 4
+    assert ids(store.query(unit(5), top_k=1)) == ["v0"]
+    assert "v1" not in ids(store.query(unit(1), top_k=10))
+
+    store.save()
+    reloaded = LocalVectorStore(str(tmp_path / "index"))
+    assert len(reloaded) == 4
+    assert sorted(ids(reloaded.query(unit(0), top_k=10))) == ["v0", "v2", "v3", "v9"]
+    assert reloaded.query(unit(5), top_k=1)["matches"][0]["metadata"] == {"n": "moved"}
+
+
+def test_updates_do_not_copy_the_memory_mapped_rows(store, tmp_path):
+    store.save()
+    base = store._base
+    assert isinstance(base, np.memmap)
+
+    store.upsert([{"id": "v0", "values": unit(7)}] + [{"id": f"w{i}", "values": unit(i % 8)} for i in range(100)])
+    assert store._base is base
+    assert store._base[0].tolist() == unit(0)
+    assert ids(store.query(unit(7), top_k=1)) == ["v0"]
+
+
+def test_approximate_query_skips_deleted_rows(tmp_path):
+    store = LocalVectorStore(str(tmp_path / "ivf"), approximate=True, n_lists=2, n_probe=1, min_ivf_rows=4)
+    rng = np.random.default_rng(0)
+    near_a = [unit(0) + 0.01 * rng.standard_normal(8) for _ in range(5)]
+    near_b = [unit(1) + 0.01 * rng.standard_normal(8) for _ in range(5)]
+    store.upsert([{"id": f"a{i}", "values": v.tolist()} for i, v in enumerate(near_a)]
+                 + [{"id": f"b{i}", "values": v.tolist()} for i, v in enumerate(near_b)])
+    store.save()
+
+    reloaded = LocalVectorStore(str(tmp_path / "ivf"), approximate=True, n_lists=2, n_probe=1, min_ivf_rows=4)
+    assert reloaded._ivf is not None
+    assert ids(reloaded.query(unit(0), top_k=1))[0].startswith("a")
+
+    reloaded.delete([f"a{i}" for i in range(5)])
+    assert ids(reloaded.query(unit(0), top_k=1))[0].startswith("b")
+
+
+def test_approximate_query_falls_back_to_exact_scan_when_probed_partitions_are_empty(store):
+    store.approximate = True
+    store.min_ivf_rows = 1
+    store.n_probe = 1
+    # Partition 0 (closest to the query) holds no rows, partition 1 holds them all.
+    centroids = np.array([unit(0), unit(1)], dtype=np.float32)
+    store._ivf = (centroids, np.arange(4), np.array([0, 0, 4]))
+    assert ids(store.query(unit(0), top_k=1)) == ["v0"]